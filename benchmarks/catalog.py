@@ -0,0 +1,81 @@
+#!/usr/bin/python
+"""
+Time catalog queries over a full size synthetic catalog
+
+--shows synthetic show payloads (the real index has about 60000) and a week of
+schedule episodes are loaded into a Catalog, then every query is timed.
+
+    $ python benchmarks/catalog.py --shows 60000 --path /tmp/catalog.db
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pytvmaze.catalog import Catalog
+
+NETWORKS = ['HBO', 'AMC', 'FX', 'BBC One', 'ABC', 'NBC', 'CBS', 'Showtime', 'ITV', 'Channel 4'] + \
+           ['Network {0}'.format(number) for number in range(200)]
+GENRES = ['Drama', 'Comedy', 'Crime', 'Horror', 'Science-Fiction', 'Thriller', 'Romance', 'Action', 'Family',
+          'Documentary', 'Anime', 'Fantasy']
+STATUSES = ['Running', 'Ended', 'To Be Determined', 'In Development']
+LANGUAGES = ['English', 'English', 'English', 'Japanese', 'Spanish', 'German', 'French']
+
+
+def show_payload(maze_id, rng):
+    return {'id': maze_id, 'name': 'Show {0}'.format(maze_id), 'type': 'Scripted', 'language': rng.choice(LANGUAGES),
+            'genres': rng.sample(GENRES, rng.randint(0, 3)), 'status': rng.choice(STATUSES),
+            'runtime': rng.choice([30, 45, 60, 90]), 'premiered': '{0}-01-01'.format(rng.randint(1950, 2020)),
+            'weight': rng.randint(0, 100), 'updated': 1500000000 + maze_id, 'rating': {'average': rng.randint(0, 100) / 10.0},
+            'network': {'id': 1, 'name': rng.choice(NETWORKS), 'country': {'code': 'US', 'name': 'United States'}},
+            'externals': {'thetvdb': maze_id}, 'summary': '<p>Summary of show {0}</p>'.format(maze_id), '_links': {}}
+
+
+def episode_payload(episode_id, maze_id, day, hour):
+    return {'id': episode_id, 'season': 1, 'number': episode_id % 20, 'name': 'Episode {0}'.format(episode_id),
+            'airstamp': '2016-01-{0:02d}T{1:02d}:00:00+00:00'.format(day, hour), 'summary': '<p>Summary</p>',
+            '_embedded': {'show': {'id': maze_id, 'name': 'Show {0}'.format(maze_id)}}}
+
+
+def timed(label, query, runs=20):
+    result = query()
+    start = time.time()
+    for _ in range(runs):
+        query()
+    print('{0:<50} {1:>8.2f} ms  {2:>6} rows'.format(label, (time.time() - start) * 1000 / runs, len(result)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shows', type=int, default=60000)
+    parser.add_argument('--path', default=':memory:')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    catalog = Catalog(args.path)
+    start = time.time()
+    catalog.add_shows(show_payload(maze_id, rng) for maze_id in range(1, args.shows + 1))
+    episodes = [episode_payload(episode_id, rng.randint(1, args.shows), 1 + episode_id % 28, episode_id % 24)
+                for episode_id in range(1, 20001)]
+    catalog.add_episodes(episodes)
+    print('loaded {0} shows and {1} episodes in {2:.1f} s'.format(len(catalog), catalog.episode_count(),
+                                                                   time.time() - start))
+
+    timed('shows(network=HBO, status=Running)', lambda: catalog.shows(network='HBO', status='Running'))
+    timed('shows(genre=Horror, limit=100)', lambda: catalog.shows(genre='Horror', limit=100))
+    timed('shows(language=Japanese, premiered_from=2015)',
+          lambda: catalog.shows(language='Japanese', premiered_from=2015))
+    timed('shows(min_runtime=90, order_by=-rating, limit=20)',
+          lambda: catalog.shows(min_runtime=90, order_by='-rating', limit=20))
+    timed('episodes(start=2016-01-07, end=2016-01-08)', lambda: catalog.episodes(start='2016-01-07', end='2016-01-08'))
+    timed('show(30000)', lambda: [catalog.show(min(30000, args.shows))])
+    catalog.close()
+
+
+if __name__ == '__main__':
+    main()
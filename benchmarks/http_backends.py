@@ -0,0 +1,133 @@
+#!/usr/bin/python
+"""
+Compare the throughput and latency of the HTTP backends
+
+A local threaded server answers every GET with a show payload after --delay
+seconds.  For each installed backend --requests GETs are spread over --threads
+threads through TVMaze(backend=...) and requests/s, p50 and p99 are printed.
+
+The local server speaks HTTP/1.1 only, so httpx runs without multiplexing here.
+Point --url at an HTTP/2 server (e.g. https://api.tvmaze.com) to measure it.
+
+    $ python benchmarks/http_backends.py --requests 2000 --threads 32 --pool-size 8
+    $ python benchmarks/http_backends.py --url https://api.tvmaze.com --requests 200
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pytvmaze.backends import backends
+from pytvmaze.tvmaze import TVMaze
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def _handler(delay):
+    body = json.dumps({'id': 1, 'name': 'Show', 'genres': [], 'schedule': {'time': '', 'days': []},
+                       'summary': 'x' * 1000}).encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately, don't let Nagle hold back the body
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def run(backend, base_url, total, threads, pool_size):
+    '''Return (requests per second, sorted latencies in seconds) of total GETs over threads threads.'''
+    tvm = TVMaze(pool_size=pool_size, backend=backend)
+    url = base_url + '/shows/1'
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        with tvm.use():
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                start = time.time()
+                TVMaze._endpoint_standard_get(url)
+                with lock:
+                    latencies.append(time.time() - start)
+
+    # One warm-up request opens the first connection
+    with tvm.use():
+        TVMaze._endpoint_standard_get(url)
+    start = time.time()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - start
+    tvm.close()
+    latencies.sort()
+    return len(latencies) / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--delay', type=float, default=0.005, help='seconds the local server waits per request')
+    parser.add_argument('--url', help='base url of a real server instead of the local one')
+    parser.add_argument('backends', nargs='*', default=sorted(backends))
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server = _Server(('127.0.0.1', 0), _handler(args.delay))
+        threading.Thread(target=server.serve_forever).start()
+        base_url = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    try:
+        for name in args.backends:
+            try:
+                backend = backends[name](args.pool_size)
+            except ImportError as e:
+                print('{0:<10} not installed ({1})'.format(name, e))
+                continue
+            throughput, latencies = run(backend, base_url, args.requests, args.threads, args.pool_size)
+            print('{0:<10} {1:>8.1f} req/s  p50 {2:>7.1f} ms  p99 {3:>7.1f} ms'.format(
+                    name, throughput, latencies[len(latencies) // 2] * 1000,
+                    latencies[int(len(latencies) * 0.99)] * 1000))
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+"""
+Measure the cold import time of pytvmaze
+
+Every sample runs a fresh interpreter with ``-X importtime`` and reads the
+cumulative time of the top level import from its report.  The HTTP stack is
+expected to stay unloaded until the first request.
+
+    $ python benchmarks/import_time.py --runs 20
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time(module):
+    '''Return the cumulative import time of module in microseconds and the modules it loaded.'''
+    code = 'import {0}, sys; print(",".join(sorted(sys.modules)))'.format(module)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code], env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    out, err = process.communicate()
+    if process.returncode:
+        raise RuntimeError(err)
+    cumulative = None
+    for line in err.splitlines():
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            cumulative = int(parts[1])
+    return cumulative, set(out.strip().split(','))
+
+
+def main():
+    if sys.version_info < (3, 7):
+        sys.exit('-X importtime needs Python 3.7 or newer')
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('modules', nargs='*', default=['pytvmaze', 'pytvmaze.snapshot', 'requests'])
+    args = parser.parse_args()
+
+    for module in args.modules:
+        # The first run compiles bytecode, leave it out of the samples
+        import_time(module)
+        samples = []
+        for _ in range(args.runs):
+            micros, loaded = import_time(module)
+            samples.append(micros)
+        samples.sort()
+        print('{0:<20} median {1:>8.1f} ms  min {2:>8.1f} ms  requests loaded: {3}'.format(
+                module, samples[len(samples) // 2] / 1000.0, samples[0] / 1000.0, 'requests' in loaded))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+"""
+Compare building full models with building projected Records
+
+A show index page worth of synthetic show payloads is built into Show objects
+and into Records of a few fields; time per batch and the memory held by the
+built objects (tracemalloc, Python 3) are printed.
+
+    $ python benchmarks/projection.py --shows 25000 --fields id,name,updated,externals.thetvdb
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pytvmaze.tvmaze import Show, Projection
+
+
+def show_payload(maze_id):
+    return {'id': maze_id, 'name': 'Show {0}'.format(maze_id), 'type': 'Scripted', 'language': 'English',
+            'genres': ['Drama', 'Crime'], 'status': 'Ended', 'runtime': 60, 'premiered': '2006-10-01',
+            'officialSite': 'http://example.com/{0}'.format(maze_id), 'weight': 90, 'updated': 1500000000 + maze_id,
+            'schedule': {'time': '21:00', 'days': ['Sunday']}, 'rating': {'average': 8.5},
+            'network': {'id': 8, 'name': 'Showtime', 'country': {'name': 'United States', 'code': 'US',
+                                                                  'timezone': 'America/New_York'}},
+            'webChannel': None, 'externals': {'tvrage': maze_id, 'thetvdb': 79349 + maze_id, 'imdb': 'tt0773262'},
+            'image': {'medium': 'http://example.com/m.jpg', 'original': 'http://example.com/o.jpg'},
+            'summary': '<p><b>Show {0}</b> follows a <i>forensic</i> expert leading a double life.</p>'.format(maze_id),
+            '_links': {'self': {'href': 'http://api.tvmaze.com/shows/{0}'.format(maze_id)},
+                       'previousepisode': {'href': 'http://api.tvmaze.com/episodes/{0}'.format(maze_id)}}}
+
+
+def measure(build, payloads):
+    '''Return (seconds, bytes allocated by the built objects).'''
+    tracemalloc = None
+    try:
+        import tracemalloc
+    except ImportError:
+        pass
+    if tracemalloc is not None:
+        tracemalloc.start()
+    start = time.time()
+    built = [build(payload) for payload in payloads]
+    elapsed = time.time() - start
+    size = None
+    if tracemalloc is not None:
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    del built
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--fields', default='id,name,updated,externals.thetvdb')
+    args = parser.parse_args()
+
+    payloads = [show_payload(maze_id) for maze_id in range(1, args.shows + 1)]
+    for name, build in (('Show', Show), ('Projection', Projection(args.fields))):
+        elapsed, size = measure(build, payloads)
+        print('{0:<12} {1:>8.1f} ms  {2:>8.2f} us/object  {3}'.format(
+                name, elapsed * 1000, elapsed * 1e6 / len(payloads),
+                'n/a' if size is None else '{0:.1f} MB retained'.format(size / 1e6)))
+
+
+if __name__ == '__main__':
+    main()
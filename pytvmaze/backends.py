@@ -0,0 +1,205 @@
+#!/usr/bin/python
+"""
+HTTP backends TVMaze sends its requests through
+
+A backend turns request(method, url, data=None, auth=None, timeout=None) into a response with
+status_code and json(), and maps its transport errors to ConnectionError: RequestTimeout when
+the connect or read timeout expired, RateLimited when 429 responses outlasted the retries.
+timeout is None, seconds, or (connect, read) seconds.  Pass an instance or one of the names in
+``backends`` as TVMaze(backend=...).  The HTTP library of a backend is imported when the
+backend is created.
+
+    >>> tvm = pytvmaze.TVMaze(backend=HttpxBackend(pool_size=4, http2=True))
+"""
+from __future__ import unicode_literals
+
+import json
+import time
+
+from pytvmaze.exceptions import ConnectionError, RateLimited, RequestTimeout
+
+# Same policy for every backend: back off on 429 Too Many Requests and connection failures.
+# Reads are not retried, a stalled read would otherwise wait out its timeout several times.
+# A 429 that outlasts the retries is returned as the response (raised as RetryError by
+# requests) and TVMaze raises RateLimited for it.
+_RETRIES = 5
+_READ_RETRIES = 0
+_BACKOFF_FACTOR = 0.1
+_RETRY_STATUS = [429]
+
+
+def _timed_out(error, timeouts, refused=()):
+    # Retries wrap the timeout in MaxRetryError, requests wraps that once more.  urllib3 derives
+    # NewConnectionError (refused, DNS failure) from ConnectTimeoutError, those didn't time out
+    while error is not None:
+        if isinstance(error, refused):
+            return False
+        if isinstance(error, timeouts):
+            return True
+        error = getattr(error, 'reason', None) or (error.args[0] if getattr(error, 'args', None) else None)
+        if not isinstance(error, Exception):
+            return False
+    return False
+
+
+def _retry_delay(attempt, retry_after):
+    # Seconds to wait before retry number attempt (from 0), Retry-After when it gives seconds
+    if retry_after and retry_after.strip().isdigit():
+        return int(retry_after)
+    return _BACKOFF_FACTOR * 2 ** attempt
+
+
+def _connect_read(timeout):
+    if timeout is None or isinstance(timeout, tuple):
+        return timeout
+    return timeout, timeout
+
+
+class HTTPBackend(object):
+    '''Interface of HTTP backends.
+
+    Attributes:
+        pool_size (int): Maximum number of open connections; requests beyond it wait
+    '''
+
+    def __init__(self, pool_size=10):
+        self.pool_size = pool_size
+
+    def __repr__(self):
+        return '<{0}(pool_size={1})>'.format(type(self).__name__, self.pool_size)
+
+    def request(self, method, url, data=None, auth=None, timeout=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsBackend(HTTPBackend):
+    '''requests.Session with a bounded urllib3 connection pool, HTTP/1.1.'''
+
+    def __init__(self, pool_size=10):
+        super(RequestsBackend, self).__init__(pool_size)
+        import requests
+        from requests.packages.urllib3.util.retry import Retry
+        from requests.packages.urllib3.exceptions import NewConnectionError, TimeoutError
+        from requests.adapters import HTTPAdapter
+
+        self._errors = (requests.exceptions.ConnectionError,)
+        self._timeouts = (requests.exceptions.Timeout, TimeoutError)
+        self._refused = (NewConnectionError,)
+        self._rate_limited = (requests.exceptions.RetryError,)
+        session = requests.Session()
+        retries = Retry(total=_RETRIES,
+                        read=_READ_RETRIES,
+                        backoff_factor=_BACKOFF_FACTOR,
+                        status_forcelist=_RETRY_STATUS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        self.session = session
+
+    def request(self, method, url, data=None, auth=None, timeout=None):
+        try:
+            return self.session.request(method, url, data=data, auth=auth, timeout=_connect_read(timeout))
+        except self._rate_limited as e:
+            raise RateLimited(repr(e))
+        except self._errors + self._timeouts as e:
+            if _timed_out(e, self._timeouts, self._refused):
+                raise RequestTimeout(repr(e))
+            raise ConnectionError(repr(e))
+
+    def close(self):
+        self.session.close()
+
+
+class _Urllib3Response(object):
+    def __init__(self, response):
+        self.status_code = response.status
+        self.content = response.data
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class Urllib3Backend(HTTPBackend):
+    '''Plain urllib3 PoolManager without the requests layer, HTTP/1.1.'''
+
+    def __init__(self, pool_size=10):
+        super(Urllib3Backend, self).__init__(pool_size)
+        import urllib3
+        from urllib3.util.retry import Retry
+
+        self._urllib3 = urllib3
+        self._errors = (urllib3.exceptions.HTTPError,)
+        self._timeouts = (urllib3.exceptions.TimeoutError,)
+        self._refused = (urllib3.exceptions.NewConnectionError,)
+        retries = Retry(total=_RETRIES, read=_READ_RETRIES, backoff_factor=_BACKOFF_FACTOR,
+                        status_forcelist=_RETRY_STATUS, raise_on_status=False, redirect=5)
+        self.pool = urllib3.PoolManager(num_pools=2, maxsize=pool_size, block=True, retries=retries)
+
+    def request(self, method, url, data=None, auth=None, timeout=None):
+        headers = None
+        if auth is not None:
+            headers = self._urllib3.make_headers(basic_auth='{0}:{1}'.format(*auth))
+        if timeout is not None:
+            connect, read = _connect_read(timeout)
+            timeout = self._urllib3.Timeout(connect=connect, read=read)
+        try:
+            if data is not None:
+                return _Urllib3Response(self.pool.request_encode_body(method, url, fields=data, headers=headers,
+                                                                      timeout=timeout, encode_multipart=False))
+            return _Urllib3Response(self.pool.request(method, url, headers=headers, timeout=timeout))
+        except self._errors as e:
+            if _timed_out(e, self._timeouts, self._refused):
+                raise RequestTimeout(repr(e))
+            raise ConnectionError(repr(e))
+
+    def close(self):
+        self.pool.clear()
+
+
+class HttpxBackend(HTTPBackend):
+    '''httpx client; with http2=True many requests share a few connections as concurrent streams.
+
+    Requires ``pip install httpx[http2]`` and a server speaking HTTP/2 (api.tvmaze.com does
+    over https); otherwise requests fall back to HTTP/1.1.
+    '''
+
+    def __init__(self, pool_size=10, http2=True, connections=None):
+        super(HttpxBackend, self).__init__(pool_size)
+        import httpx
+
+        self.http2 = http2
+        self._httpx = httpx
+        self._errors = (httpx.TransportError,)
+        self._timeouts = (httpx.TimeoutException,)
+        # Each HTTP/2 connection carries many streams, so fewer connections are needed
+        limits = httpx.Limits(max_connections=connections or pool_size, max_keepalive_connections=connections or pool_size)
+        # The transport only retries failed connects, request() retries 429 itself
+        transport = httpx.HTTPTransport(http2=http2, limits=limits, retries=_RETRIES)
+        self.client = httpx.Client(transport=transport, follow_redirects=True)
+
+    def __repr__(self):
+        return '<HttpxBackend(pool_size={0},http2={1})>'.format(self.pool_size, self.http2)
+
+    def request(self, method, url, data=None, auth=None, timeout=None):
+        try:
+            if timeout is not None:
+                connect, read = _connect_read(timeout)
+                timeout = self._httpx.Timeout(read, connect=connect)
+            for attempt in range(_RETRIES + 1):
+                response = self.client.request(method, url, data=data, auth=auth, timeout=timeout)
+                if response.status_code not in _RETRY_STATUS or attempt == _RETRIES:
+                    return response
+                time.sleep(_retry_delay(attempt, response.headers.get('Retry-After')))
+        except self._timeouts as e:
+            raise RequestTimeout(repr(e))
+        except self._errors as e:
+            raise ConnectionError(repr(e))
+
+    def close(self):
+        self.client.close()
+
+
+backends = {'requests': RequestsBackend, 'urllib3': Urllib3Backend, 'httpx': HttpxBackend}
@@ -0,0 +1,303 @@
+#!/usr/bin/python
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryCache(object):
+    '''In-process cache of decoded TVMaze responses keyed by url.
+
+    Attributes:
+        ttl (float): Seconds an entry stays fresh unless set() is given another ttl, None for ever
+        max_entries (int): Entries kept at most, the least recently used go first; None for no limit
+
+    '''
+
+    def __init__(self, ttl=3600, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<MemoryCache(entries={0},ttl={1})>'.format(len(self), self.ttl)
+
+    def _expires_at(self, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        return None if ttl is None else time.time() + ttl
+
+    def get(self, url):
+        '''Return the fresh payload cached for url or None.'''
+        entry = self.lookup(url)
+        if entry is None:
+            return None
+        payload, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return payload
+
+    def lookup(self, url):
+        '''Return (payload, expires_at) for url even if it has expired, or None.'''
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                self._entries[url] = entry
+        return None if entry is None else entry[:2]
+
+    def set(self, url, payload, ttl=None, show_id=None):
+        '''Store a payload; show_id records which show it belongs to, see CoherentCache.'''
+        with self._lock:
+            self._entries.pop(url, None)
+            self._entries[url] = (payload, self._expires_at(ttl), time.time(), show_id)
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def entries(self):
+        '''Return (url, stored_at, show_id) for every entry.'''
+        with self._lock:
+            return [(url, entry[2], entry[3]) for url, entry in self._entries.items()]
+
+    def delete(self, url):
+        with self._lock:
+            self._entries.pop(url, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileCache(MemoryCache):
+    '''Cache of decoded TVMaze responses stored as one JSON file per url in a directory.
+
+    Entries survive restarts and can be shared by processes using the same directory.
+
+    Attributes:
+        directory (str): Directory holding the cache files, created if missing
+        ttl (float): Seconds an entry stays fresh unless set() is given another ttl, None for ever
+
+    '''
+
+    def __init__(self, directory, ttl=3600):
+        super(FileCache, self).__init__(ttl)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __len__(self):
+        return len([name for name in os.listdir(self.directory) if name.endswith('.json')])
+
+    def __repr__(self):
+        return '<FileCache(directory={0},ttl={1})>'.format(self.directory, self.ttl)
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+    def lookup(self, url):
+        try:
+            with open(self._path(url)) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        return entry['payload'], entry['expires_at']
+
+    def set(self, url, payload, ttl=None, show_id=None):
+        entry = {'url': url, 'stored_at': time.time(), 'expires_at': self._expires_at(ttl), 'show_id': show_id,
+                 'payload': payload}
+        path = self._path(url)
+        tmp_path = '{0}.{1}.{2}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+
+    def entries(self):
+        result = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        entry = json.load(f)
+                except (IOError, OSError, ValueError):
+                    continue
+                result.append((entry['url'], entry['stored_at'], entry.get('show_id')))
+        return result
+
+    def delete(self, url):
+        try:
+            os.remove(self._path(url))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                os.remove(os.path.join(self.directory, name))
+
+
+class CoherentCache(object):
+    '''Cache that keeps show data until the TVMaze updates feed says the show changed.
+
+    Responses belonging to a show (/shows/{id}/..., lookups and single searches, and
+    /seasons/{id} and /episodes/{id} once the show's season or episode list has been
+    seen) are stored without expiry.  sync() reads the updates feed and drops, or with
+    refresh=True downloads again, only the entries of shows updated after they were
+    stored.  Everything else expires after the backend's ttl.  Use start() to sync
+    periodically from a background thread.
+
+    Attributes:
+        backend (MemoryCache): Storage, a MemoryCache(ttl=3600) if None
+        sync_interval (float): Seconds between syncs of the background thread
+        last_sync (float): time.time() of the last sync, None before the first
+        last_error (Exception): Error of the last failed background sync, None if it succeeded
+
+    '''
+    _show_url = re.compile(r'/shows/(\d+)')
+    _season_url = re.compile(r'/seasons/(\d+)')
+    _episode_url = re.compile(r'/episodes/(\d+)')
+    _show_payload_url = re.compile(r'/(singlesearch|lookup)/shows\?')
+    # Updates are recorded with the server's clock, allow some drift of ours
+    clock_skew = 60
+
+    def __init__(self, backend=None, sync_interval=300):
+        self.backend = backend if backend is not None else MemoryCache()
+        self.sync_interval = sync_interval
+        self.last_sync = None
+        self.last_error = None
+        self._season_shows = dict()
+        self._episode_shows = dict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.backend)
+
+    def __repr__(self):
+        return '<CoherentCache(backend={0},last_sync={1})>'.format(self.backend, self.last_sync)
+
+    def _show_id(self, url, payload):
+        match = self._show_url.search(url)
+        if match:
+            return int(match.group(1))
+        if self._show_payload_url.search(url) and isinstance(payload, dict):
+            return payload.get('id')
+        with self._lock:
+            match = self._season_url.search(url)
+            if match:
+                return self._season_shows.get(int(match.group(1)))
+            match = self._episode_url.search(url)
+            if match:
+                return self._episode_shows.get(int(match.group(1)))
+
+    def _learn(self, url, show_id, payload):
+        # Season and episode lists tell which show later /seasons/{id} and /episodes/{id} urls belong to
+        path = url.split('?')[0]
+        if isinstance(payload, dict):
+            owners, items = self._episode_shows, (payload.get('_embedded') or {}).get('episodes') or []
+        elif path.endswith('/seasons'):
+            owners, items = self._season_shows, payload
+        elif path.endswith('/episodes'):
+            owners, items = self._episode_shows, payload
+        else:
+            return
+        with self._lock:
+            for item in items:
+                if isinstance(item, dict) and 'id' in item:
+                    owners[item['id']] = show_id
+
+    def get(self, url):
+        return self.backend.get(url)
+
+    def lookup(self, url):
+        return self.backend.lookup(url)
+
+    def set(self, url, payload, ttl=None, show_id=None):
+        if show_id is None:
+            show_id = self._show_id(url, payload)
+        if show_id is not None:
+            self._learn(url, show_id, payload)
+            if ttl is None:
+                ttl = float('inf')
+        self.backend.set(url, payload, ttl, show_id)
+
+    def delete(self, url):
+        self.backend.delete(url)
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self._season_shows.clear()
+            self._episode_shows.clear()
+
+    def entries(self):
+        return self.backend.entries()
+
+    def _updates_url(self):
+        from pytvmaze import endpoints
+
+        if self.last_sync is not None:
+            age = time.time() - self.last_sync
+            for since, seconds in (('day', 24 * 3600), ('week', 7 * 24 * 3600), ('month', 30 * 24 * 3600)):
+                if age < seconds - self.clock_skew:
+                    return endpoints.show_updates + '?since=' + since
+        return endpoints.show_updates
+
+    def sync(self, tvm=None, refresh=False):
+        """
+        Invalidate entries of shows changed since they were cached
+
+        :param tvm: Client used for the requests, the shared default client if None
+        :param refresh: Download invalidated entries again instead of only dropping them
+        :return: List of invalidated urls
+        """
+        from pytvmaze.tvmaze import TVMaze, _current_client
+
+        started = time.time()
+        client = tvm if tvm is not None else _current_client()
+        with client.use():
+            # A private cache so the feed itself is never served from this one
+            updates = TVMaze._endpoint_standard_get(self._updates_url(), MemoryCache(ttl=0)) or {}
+        updates = dict((int(maze_id), updated) for maze_id, updated in updates.items())
+        stale = [url for url, stored_at, show_id in self.backend.entries()
+                 if show_id is not None and updates.get(show_id, 0) > stored_at - self.clock_skew]
+        for url in stale:
+            self.backend.delete(url)
+        if refresh:
+            with client.use():
+                for url in stale:
+                    TVMaze._endpoint_standard_get(url, self)
+        self.last_sync = started
+        return stale
+
+    def start(self, tvm=None, refresh=False):
+        '''Sync every sync_interval seconds from a daemon thread until stop() is called.'''
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(tvm, refresh))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, tvm, refresh):
+        while not self._stop.is_set():
+            try:
+                self.sync(tvm, refresh)
+                self.last_error = None
+            except Exception as e:
+                # The next round tries again, entries stay as they are meanwhile
+                self.last_error = e
+            self._stop.wait(self.sync_interval)
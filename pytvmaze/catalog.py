@@ -0,0 +1,374 @@
+#!/usr/bin/python
+"""
+Local SQLite catalog of shows and episodes
+
+Shows and episodes (model objects or raw api payloads) are stored with the
+fields queries filter on as indexed columns next to their payload, so filtering
+the full catalog by network, status, genre, language, premiere year, runtime or
+airstamp takes milliseconds and only matching rows are turned into Show and
+Episode objects.
+
+    >>> from pytvmaze.catalog import Catalog
+    >>> catalog = Catalog('catalog.db')
+    >>> for page in range(250):
+    ...     catalog.add_shows(pytvmaze.show_index(page))
+    >>> catalog.shows(network='HBO', status='Running')
+    >>> catalog.shows(genre='Horror', premiered_from=2010, order_by='-rating', limit=20)
+    >>> catalog.add_episodes(pytvmaze.get_full_schedule())
+    >>> catalog.episodes(start=datetime(2016, 1, 1), end=datetime(2016, 1, 8))
+"""
+from __future__ import unicode_literals
+
+import json
+import sqlite3
+import threading
+from calendar import timegm
+from datetime import date, datetime
+
+from pytvmaze.tvmaze import Model, Show, Episode, airstamp_seconds
+from pytvmaze.exceptions import *
+
+_VERSION = 1
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shows (
+    id INTEGER PRIMARY KEY,
+    name TEXT COLLATE NOCASE,
+    type TEXT COLLATE NOCASE,
+    language TEXT COLLATE NOCASE,
+    status TEXT COLLATE NOCASE,
+    runtime INTEGER,
+    premiere_year INTEGER,
+    network_name TEXT COLLATE NOCASE,
+    web_channel_name TEXT COLLATE NOCASE,
+    country_code TEXT COLLATE NOCASE,
+    rating REAL,
+    weight INTEGER,
+    updated INTEGER,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shows_network ON shows (network_name, status);
+CREATE INDEX IF NOT EXISTS shows_web_channel ON shows (web_channel_name, status);
+CREATE INDEX IF NOT EXISTS shows_status ON shows (status, premiere_year);
+CREATE INDEX IF NOT EXISTS shows_language ON shows (language, status);
+CREATE INDEX IF NOT EXISTS shows_country ON shows (country_code, status);
+CREATE INDEX IF NOT EXISTS shows_premiere_year ON shows (premiere_year);
+CREATE INDEX IF NOT EXISTS shows_runtime ON shows (runtime);
+CREATE TABLE IF NOT EXISTS show_genres (
+    genre TEXT COLLATE NOCASE,
+    show_id INTEGER,
+    PRIMARY KEY (genre, show_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS show_genres_show ON show_genres (show_id);
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    show_id INTEGER,
+    season INTEGER,
+    number INTEGER,
+    airstamp INTEGER,
+    show_key TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS episodes_show ON episodes (show_id, season, number);
+CREATE INDEX IF NOT EXISTS episodes_airstamp ON episodes (airstamp, show_id);
+'''
+
+# Allowed order_by values and the columns they sort on
+_SHOW_ORDER = {'id': 'id', 'name': 'name', 'premiered': 'premiere_year', 'rating': 'rating', 'weight': 'weight',
+               'updated': 'updated', 'runtime': 'runtime'}
+
+
+def _dumps(payload):
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def _payload(item):
+    return item.to_dict() if isinstance(item, Model) else dict(item)
+
+
+def _get(payload, *path):
+    for key in path:
+        if not isinstance(payload, dict):
+            return None
+        payload = payload.get(key)
+    return payload
+
+
+def _seconds(value):
+    # Seconds since the epoch from seconds, an airstamp, or a date/datetime (naive ones are UTC)
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        if value.utcoffset() is not None:
+            value = value - value.utcoffset()
+        return timegm(value.timetuple())
+    if isinstance(value, date):
+        return timegm(value.timetuple())
+    if len(value) == 10:
+        return timegm(datetime.strptime(value, '%Y-%m-%d').timetuple())
+    return airstamp_seconds(value)
+
+
+class Catalog(object):
+    '''SQLite catalog answering show and episode queries locally.
+
+    Fields used for filtering are indexed columns; the payload of each row is stored
+    alongside and model objects are only built for the rows a query returns.  Shows
+    embedded in episodes (schedules) are stored once in the shows table and put back
+    when the episode is read.  Adding a show or episode again replaces it.
+
+    Attributes:
+        path (str): Database file, ':memory:' for a catalog that isn't kept
+
+    '''
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            if version not in (0, _VERSION):
+                raise GeneralError('Unsupported catalog version {0} in {1}'.format(version, path))
+            self._db.executescript(_SCHEMA)
+            self._db.execute('PRAGMA user_version = {0}'.format(_VERSION))
+
+    def __repr__(self):
+        return '<Catalog(path={0},shows={1},episodes={2})>'.format(self.path, len(self), self.episode_count())
+
+    def __len__(self):
+        return self._scalar('SELECT COUNT(*) FROM shows')
+
+    def __contains__(self, maze_id):
+        return self._scalar('SELECT COUNT(*) FROM shows WHERE id = ?', (int(maze_id),)) > 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def _scalar(self, sql, parameters=()):
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchone()[0]
+
+    def _rows(self, sql, parameters=()):
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    def episode_count(self):
+        return self._scalar('SELECT COUNT(*) FROM episodes')
+
+    @staticmethod
+    def _show_row(data):
+        embedded = dict(data.pop('_embedded', None) or {})
+        episodes = embedded.pop('episodes', None) or []
+        embedded.pop('seasons', None)
+        if embedded:
+            data['_embedded'] = embedded
+        premiered = data.get('premiered')
+        row = (data['id'], data.get('name'), data.get('type'), data.get('language'), data.get('status'),
+               data.get('runtime'), int(premiered[:4]) if premiered else None, _get(data, 'network', 'name'),
+               _get(data, 'webChannel', 'name'),
+               _get(data, 'network', 'country', 'code') or _get(data, 'webChannel', 'country', 'code'),
+               _get(data, 'rating', 'average'), data.get('weight'), data.get('updated'), _dumps(data))
+        return row, data.get('genres') or [], episodes
+
+    @staticmethod
+    def _episode_row(data, maze_id=None):
+        show, show_key = data.pop('show', None), None
+        if show:
+            show_key = 'show'
+        elif (data.get('_embedded') or {}).get('show'):
+            embedded = dict(data.pop('_embedded'))
+            show, show_key = embedded.pop('show'), '_embedded'
+            if embedded:
+                data['_embedded'] = embedded
+        if show:
+            maze_id = show['id']
+        row = (data['id'], maze_id, data.get('season'), data.get('number'), airstamp_seconds(data.get('airstamp')),
+               show_key, _dumps(data))
+        return row, show
+
+    def _store(self, show_rows, episode_rows):
+        with self._lock, self._db:
+            if show_rows:
+                self._db.executemany('INSERT OR REPLACE INTO shows VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                                     [row for row, _ in show_rows])
+                self._db.executemany('DELETE FROM show_genres WHERE show_id = ?', [(row[0],) for row, _ in show_rows])
+                self._db.executemany('INSERT OR IGNORE INTO show_genres VALUES (?,?)',
+                                     [(genre, row[0]) for row, genres in show_rows for genre in genres])
+            if episode_rows:
+                self._db.executemany('INSERT OR REPLACE INTO episodes VALUES (?,?,?,?,?,?,?)', episode_rows)
+
+    def add_shows(self, shows):
+        """
+        Store shows, replacing earlier versions
+
+        Episodes embedded in a show (get_show(..., embed='episodes')) are stored as well.
+        :param shows: Iterable of Show objects or show payloads, e.g. show_index pages
+        :return: Number of shows stored
+        """
+        show_rows = []
+        episode_rows = []
+        for show in shows:
+            row, genres, episodes = self._show_row(_payload(show))
+            show_rows.append((row, genres))
+            episode_rows.extend(self._episode_row(dict(episode), row[0])[0] for episode in episodes)
+        self._store(show_rows, episode_rows)
+        return len(show_rows)
+
+    def add_episodes(self, episodes, maze_id=None):
+        """
+        Store episodes, replacing earlier versions
+
+        Shows embedded in schedule episodes are stored too, unless the catalog already
+        has the same or a newer version of them.
+        :param episodes: Iterable of Episode objects or episode payloads
+        :param maze_id: Show of the episodes when they don't embed it, as from episode_list
+        :return: Number of episodes stored
+        """
+        episode_rows = []
+        shows = dict()
+        for episode in episodes:
+            row, show = self._episode_row(_payload(episode), maze_id)
+            episode_rows.append(row)
+            if show and show['id'] not in shows:
+                shows[show['id']] = show
+        if shows:
+            known = dict()
+            ids = list(shows)
+            # Stay below SQLite's limit on the number of parameters
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                known.update(self._rows('SELECT id, updated FROM shows WHERE id IN ({0})'.format(
+                        ','.join('?' * len(chunk))), chunk))
+            shows = [show for maze_id, show in shows.items()
+                     if maze_id not in known or (show.get('updated') or 0) > (known[maze_id] or 0)]
+        show_rows = [self._show_row(dict(show))[:2] for show in shows]
+        self._store(show_rows, episode_rows)
+        return len(episode_rows)
+
+    def show(self, maze_id):
+        '''Return a stored Show by maze id.'''
+        rows = self._rows('SELECT payload FROM shows WHERE id = ?', (int(maze_id),))
+        if not rows:
+            raise IDNotFound('Maze id {0} not found in catalog'.format(maze_id))
+        return Show(json.loads(rows[0][0]))
+
+    def episode(self, episode_id):
+        '''Return a stored Episode by id.'''
+        episodes = self._episodes('WHERE e.id = ?', [int(episode_id)], '')
+        if not episodes:
+            raise EpisodeNotFound('Couldn\'t find Episode with ID {0} in catalog'.format(episode_id))
+        return episodes[0]
+
+    def shows(self, genre=None, network=None, web_channel=None, language=None, status=None, country=None,
+              show_type=None, premiered_from=None, premiered_to=None, min_runtime=None, max_runtime=None,
+              min_rating=None, order_by='id', limit=None):
+        """
+        Return stored shows matching all given filters
+
+        Text filters ignore case.
+        :param genre: Genre the show must have, e.g. Drama
+        :param network: Network name, e.g. HBO
+        :param web_channel: Web channel name, e.g. Netflix
+        :param country: ISO country code of the network or web channel
+        :param show_type: Scripted, Reality, Animation, ...
+        :param premiered_from: First premiere year included
+        :param premiered_to: Last premiere year included
+        :param order_by: id, name, premiered, rating, weight, updated or runtime; prefix with - to sort descending
+        :param limit: Maximum number of shows returned
+        :return: List of Show objects
+        """
+        conditions = []
+        parameters = []
+        for column, value in (('network_name', network), ('web_channel_name', web_channel), ('language', language),
+                              ('status', status), ('country_code', country), ('type', show_type)):
+            if value is not None:
+                conditions.append('{0} = ?'.format(column))
+                parameters.append(value)
+        for column, operator, value in (('premiere_year', '>=', premiered_from), ('premiere_year', '<=', premiered_to),
+                                        ('runtime', '>=', min_runtime), ('runtime', '<=', max_runtime),
+                                        ('rating', '>=', min_rating)):
+            if value is not None:
+                conditions.append('{0} {1} ?'.format(column, operator))
+                parameters.append(value)
+        if genre is not None:
+            conditions.append('id IN (SELECT show_id FROM show_genres WHERE genre = ?)')
+            parameters.append(genre)
+
+        descending = order_by.startswith('-')
+        column = _SHOW_ORDER.get(order_by.lstrip('-'))
+        if column is None:
+            raise GeneralError('order_by must be one of {0}'.format(', '.join(sorted(_SHOW_ORDER))))
+        sql = 'SELECT payload FROM shows'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY {0} {1}, id'.format(column, 'DESC' if descending else 'ASC')
+        if limit is not None:
+            sql += ' LIMIT ?'
+            parameters.append(int(limit))
+        return [Show(json.loads(payload)) for payload, in self._rows(sql, parameters)]
+
+    def _episodes(self, where, parameters, order):
+        sql = ('SELECT e.payload, e.show_key, s.payload FROM episodes e LEFT JOIN shows s ON s.id = e.show_id '
+               + where + order)
+        episodes = []
+        for payload, show_key, show in self._rows(sql, parameters):
+            data = json.loads(payload)
+            if show_key == 'show' and show:
+                data['show'] = json.loads(show)
+            elif show_key == '_embedded' and show:
+                data.setdefault('_embedded', {})['show'] = json.loads(show)
+            episodes.append(Episode(data))
+        return episodes
+
+    def episodes(self, maze_id=None, season=None, start=None, end=None, limit=None):
+        """
+        Return stored episodes of a show or airing in a time window
+
+        Episodes of a single show without a window are ordered by season and number,
+        all others by airstamp.
+        :param maze_id: Show the episodes belong to
+        :param season: Season number, needs maze_id
+        :param start: Earliest airstamp as seconds since the epoch, a datetime (naive is UTC),
+            a date or 'YYYY-MM-DD'
+        :param end: Latest airstamp, excluded; same types as start
+        :param limit: Maximum number of episodes returned
+        :return: List of Episode objects
+        """
+        conditions = []
+        parameters = []
+        if maze_id is not None:
+            conditions.append('e.show_id = ?')
+            parameters.append(int(maze_id))
+        if season is not None:
+            if maze_id is None:
+                raise MissingParameters('season needs maze_id')
+            conditions.append('e.season = ?')
+            parameters.append(int(season))
+        start, end = _seconds(start), _seconds(end)
+        if start is not None:
+            conditions.append('e.airstamp >= ?')
+            parameters.append(start)
+        if end is not None:
+            conditions.append('e.airstamp < ?')
+            parameters.append(end)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        if maze_id is not None and start is None and end is None:
+            order = ' ORDER BY e.season, e.number, e.id'
+        else:
+            order = ' ORDER BY e.airstamp, e.id'
+        if limit is not None:
+            order += ' LIMIT ?'
+            parameters.append(int(limit))
+        return self._episodes(where, parameters, order)
+
+    def genres(self):
+        '''Return (genre, number of shows) pairs, most common first.'''
+        return [tuple(row) for row in self._rows('SELECT genre, COUNT(*) AS n FROM show_genres GROUP BY genre '
+                                                 'ORDER BY n DESC, genre')]
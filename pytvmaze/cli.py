@@ -0,0 +1,149 @@
+#!/usr/bin/python
+"""
+Resolve batches of shows and episodes from the command line
+
+Queries are read one per line from a file or stdin and results are written as
+JSON lines to stdout while the batch is still running; the exit status is 1 when
+any query failed.  A line is plain text read according to --type or a JSON object:
+
+    {"show_name": "utopia", "show_country": "au"}    get_show keyword arguments
+    {"tvdb_id": 81189, "embed": "episodes"}
+    {"maze_id": 161, "season": 1, "number": 8}       episode_by_number
+
+    $ printf 'dexter\\nlost\\n' | pytvmaze --concurrency 4
+    $ pytvmaze --type tvdb --cache-dir ~/.cache/pytvmaze tvdb_ids.txt
+"""
+import argparse
+import json
+import sys
+from collections import deque
+
+from pytvmaze import tvmaze
+from pytvmaze.backends import backends
+from pytvmaze.cache import FileCache
+from pytvmaze.exceptions import BaseError
+
+_show_arguments = ('maze_id', 'tvdb_id', 'tvrage_id', 'imdb_id', 'show_name', 'show_year', 'show_network',
+                   'show_language', 'show_country', 'show_web_channel', 'embed')
+_id_types = {'maze_id': 'maze_id', 'tvdb': 'tvdb_id', 'tvrage': 'tvrage_id', 'imdb': 'imdb_id', 'name': 'show_name'}
+
+
+def parse_query(line, query_type='name'):
+    """
+    Turn an input line into a query dict
+
+    :param line: JSON object or plain text
+    :param query_type: How plain text is read: name, maze_id, tvdb, tvrage, imdb or
+        episode ("maze_id season number")
+    :return: Dict of get_show keyword arguments, or maze_id/season/number for an episode
+    """
+    line = line.strip()
+    if line.startswith('{'):
+        return json.loads(line)
+    if query_type == 'episode':
+        maze_id, season, number = line.replace(',', ' ').replace('/', ' ').split()
+        return {'maze_id': int(maze_id), 'season': int(season), 'number': int(number)}
+    return {_id_types[query_type]: line}
+
+
+def resolve(tvm, query, race=False):
+    '''Run a single query and return the resulting model object.'''
+    with tvm.use():
+        if 'season' in query and 'number' in query:
+            return tvmaze.episode_by_number(query['maze_id'], query['season'], query['number'])
+        unknown = set(query) - set(_show_arguments)
+        if unknown:
+            raise tvmaze.MissingParameters('Unknown query fields: {0}'.format(', '.join(sorted(unknown))))
+        return tvm.get_show(race=race, **query)
+
+
+def _run(tvm, index, line, query_type, embed, race):
+    record = {'index': index, 'query': line, 'result': None, 'error': None}
+    try:
+        query = parse_query(line, query_type)
+        if embed and 'season' not in query:
+            query.setdefault('embed', embed)
+        record['result'] = resolve(tvm, query, race).to_dict()
+    except (BaseError, ValueError, KeyError) as e:
+        record['error'] = {'type': type(e).__name__, 'message': str(e)}
+    return record
+
+
+def resolve_stream(tvm, lines, query_type='name', concurrency=8, ordered=True, embed=None, race=False):
+    """
+    Resolve input lines concurrently and yield one result record per non-empty line
+
+    Only about twice as many lines as there are workers are read ahead, so results
+    start flowing immediately and memory stays bounded for any input size.
+    :param ordered: Yield records in input order, otherwise as soon as they complete
+    :param race: Run all identifier lookups of a query at once, see TVMaze.get_show
+    :return: Iterator of dicts with index, query, result (to_dict() of the model) and error
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    window = concurrency * 2
+    queries = ((index, line) for index, line in enumerate(line for line in lines if line.strip()))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    index, line = next(queries)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append(executor.submit(_run, tvm, index, line.strip(), query_type, embed, race))
+            if not pending:
+                return
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+
+
+def main(argv=None, stdin=None, stdout=None):
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    parser = argparse.ArgumentParser(prog='pytvmaze', description=__doc__.strip().splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='\n'.join(__doc__.strip().splitlines()[1:]))
+    parser.add_argument('input', nargs='?', help='file with one query per line, stdin if omitted')
+    parser.add_argument('--type', dest='query_type', default='name',
+                        choices=sorted(list(_id_types) + ['episode']), help='meaning of plain text lines')
+    parser.add_argument('--embed', choices=['episodes', 'cast', 'previousepisode', 'nextepisode'],
+                        help='embed parameter passed to get_show')
+    parser.add_argument('--order', choices=['input', 'completion'], default='input',
+                        help='write results in input order or as soon as they are resolved')
+    parser.add_argument('--race', action='store_true',
+                        help='try all identifiers of a JSON query at once instead of one after the other')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent queries')
+    parser.add_argument('--rate-limit', type=float, help='maximum number of requests per second')
+    parser.add_argument('--backend', choices=sorted(backends), default='requests', help='HTTP library used')
+    parser.add_argument('--cache-dir', help='directory caching TVMaze responses between runs')
+    parser.add_argument('--cache-ttl', type=float, default=24 * 3600, help='seconds cached responses stay valid')
+    args = parser.parse_args(argv)
+
+    cache = FileCache(args.cache_dir, ttl=args.cache_ttl) if args.cache_dir else None
+    tvm = tvmaze.TVMaze(pool_size=args.concurrency, rate_limit=args.rate_limit, cache=cache,
+                        backend=args.backend)
+    source = open(args.input) if args.input else stdin
+    failed = 0
+    try:
+        for record in resolve_stream(tvm, source, args.query_type, args.concurrency,
+                                     ordered=args.order == 'input', embed=args.embed, race=args.race):
+            failed += record['error'] is not None
+            stdout.write(json.dumps(record) + '\n')
+            stdout.flush()
+    finally:
+        if source is not stdin:
+            source.close()
+        tvm.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
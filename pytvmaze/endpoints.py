@@ -23,6 +23,7 @@ show_updates = 'http://api.tvmaze.com/updates/shows'
 show_akas = 'http://api.tvmaze.com/shows/{0}/akas'
 show_seasons = 'http://api.tvmaze.com/shows/{0}/seasons'
 season_by_id = 'http://api.tvmaze.com/seasons/{0}'
+season_episodes = 'http://api.tvmaze.com/seasons/{0}/episodes'
 episode_by_id = 'http://api.tvmaze.com/episodes/{0}'
 
 # TVMaze Premium endpoints
@@ -135,3 +135,35 @@ class EpisodeNotVotedFor(BaseError):
 
 class CrewNotFound(BaseError):
     pass
+
+class NoFollowedNetworks(BaseError):
+    pass
+
+class NetworkNotFound(BaseError):
+    pass
+
+class WebChannelNotFound(BaseError):
+    pass
+
+class WebChannelNotFollowed(BaseError):
+    pass
+
+class SnapshotError(BaseError):
+    pass
+
+class CircuitOpen(ConnectionError):
+    pass
+
+class RateLimited(ConnectionError):
+    pass
+
+class RequestTimeout(ConnectionError):
+    pass
+
+class DeadlineExceeded(RequestTimeout):
+    def __init__(self, value, completed=(), pending=None, elapsed=None):
+        BaseError.__init__(self, value)
+        # Urls answered before the deadline, the url being waited for and the seconds spent
+        self.completed = list(completed)
+        self.pending = pending
+        self.elapsed = elapsed
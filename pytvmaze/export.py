@@ -0,0 +1,269 @@
+#!/usr/bin/python
+"""
+Columnar export of shows, seasons, episodes and updates
+
+Objects (or the raw api payloads they are built from) are flattened into typed
+columns: nested network, web channel, rating, externals and schedule fields become
+columns of their own.  Rows are converted batch_size at a time, so write_parquet
+holds only one batch in memory however long the input stream is.
+
+    >>> from pytvmaze import export
+    >>> table = export.to_arrow(pytvmaze.show_index(0))
+    >>> export.write_parquet('episodes.parquet', pytvmaze.episode_list(161), kind='episode')
+
+pyarrow is needed for to_arrow and write_parquet, numpy for to_numpy.  to_table
+returns an Arrow table when pyarrow is installed and a NumPy structured array
+otherwise.
+"""
+from __future__ import unicode_literals
+
+from datetime import datetime
+from itertools import chain, islice
+
+from pytvmaze.tvmaze import Model, Show, Season, Episode, Update
+
+# Column name, type and the paths tried in order to find the value in a payload
+_SHOW_COLUMNS = (
+    ('id', 'int', ('id',)),
+    ('name', 'str', ('name',)),
+    ('type', 'str', ('type',)),
+    ('language', 'str', ('language',)),
+    ('genres', 'list', ('genres',)),
+    ('status', 'str', ('status',)),
+    ('runtime', 'int', ('runtime',)),
+    ('premiered', 'date', ('premiered',)),
+    ('official_site', 'str', ('officialSite',)),
+    ('schedule_time', 'str', ('schedule.time',)),
+    ('schedule_days', 'list', ('schedule.days',)),
+    ('rating_average', 'float', ('rating.average',)),
+    ('weight', 'int', ('weight',)),
+    ('network_id', 'int', ('network.id',)),
+    ('network_name', 'str', ('network.name',)),
+    ('network_country_code', 'str', ('network.country.code',)),
+    ('network_timezone', 'str', ('network.country.timezone',)),
+    ('web_channel_id', 'int', ('webChannel.id',)),
+    ('web_channel_name', 'str', ('webChannel.name',)),
+    ('web_channel_country_code', 'str', ('webChannel.country.code',)),
+    ('externals_tvdb', 'int', ('externals.thetvdb',)),
+    ('externals_tvrage', 'int', ('externals.tvrage',)),
+    ('externals_imdb', 'str', ('externals.imdb',)),
+    ('updated', 'int', ('updated',)),
+    ('url', 'str', ('url',)),
+)
+
+_SEASON_COLUMNS = (
+    ('id', 'int', ('id',)),
+    ('number', 'int', ('number',)),
+    ('name', 'str', ('name',)),
+    ('episode_order', 'int', ('episodeOrder',)),
+    ('premiere_date', 'date', ('premiereDate', 'premierDate')),
+    ('end_date', 'date', ('endDate',)),
+    ('network_id', 'int', ('network.id',)),
+    ('network_name', 'str', ('network.name',)),
+    ('web_channel_id', 'int', ('webChannel.id',)),
+    ('web_channel_name', 'str', ('webChannel.name',)),
+    ('url', 'str', ('url',)),
+)
+
+_EPISODE_COLUMNS = (
+    ('id', 'int', ('id',)),
+    ('show_id', 'int', ('show.id', '_embedded.show.id')),
+    ('season', 'int', ('season',)),
+    ('number', 'int', ('number',)),
+    ('name', 'str', ('name',)),
+    ('type', 'str', ('type',)),
+    ('airdate', 'date', ('airdate',)),
+    ('airtime', 'str', ('airtime',)),
+    ('airstamp', 'str', ('airstamp',)),
+    ('runtime', 'int', ('runtime',)),
+    ('rating_average', 'float', ('rating.average',)),
+    ('url', 'str', ('url',)),
+)
+
+_UPDATE_COLUMNS = (
+    ('id', 'int', ('id',)),
+    ('time', 'int', ('time',)),
+)
+
+schemas = {'show': _SHOW_COLUMNS, 'season': _SEASON_COLUMNS, 'episode': _EPISODE_COLUMNS, 'update': _UPDATE_COLUMNS}
+_kinds = ((Show, 'show'), (Season, 'season'), (Episode, 'episode'), (Update, 'update'))
+
+
+def _payload(item):
+    return item.to_dict() if isinstance(item, Model) else item
+
+
+def _kind_of(item):
+    for model, kind in _kinds:
+        if isinstance(item, model):
+            return kind
+    raise ValueError('Cannot tell what kind of payload {0!r} is, pass kind='.format(item))
+
+
+def _lookup(payload, paths):
+    for path in paths:
+        value = payload
+        for key in path.split('.'):
+            if not isinstance(value, dict):
+                value = None
+                break
+            value = value.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def _convert(value, column_type):
+    if value is None or value == '':
+        return None
+    if column_type == 'int':
+        return int(value)
+    if column_type == 'float':
+        return float(value)
+    if column_type == 'date':
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    if column_type == 'list':
+        return list(value)
+    return value
+
+
+def columns(items, kind=None):
+    """
+    Flatten objects or payloads into a dict of column name to list of values
+
+    :param items: Iterable of Show, Season, Episode or Update objects, or api payloads
+    :param kind: show, season, episode or update; only needed for raw payloads
+    :return: Dict of column lists in schema order, missing values are None
+    """
+    items = iter(items)
+    first = next(items, None)
+    if kind is None:
+        kind = _kind_of(first) if first is not None else 'show'
+    schema = schemas[kind]
+    result = dict((name, []) for name, _, _ in schema)
+    if first is None:
+        return result
+    for item in chain([first], items):
+        payload = _payload(item)
+        for name, column_type, paths in schema:
+            result[name].append(_convert(_lookup(payload, paths), column_type))
+    return result
+
+
+def batches(items, kind=None, batch_size=10000):
+    '''Yield (kind, columns) for consecutive slices of batch_size items.'''
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        if kind is None:
+            kind = _kind_of(batch[0])
+        yield kind, columns(batch, kind)
+
+
+def _arrow_schema(kind):
+    import pyarrow as pa
+
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(), 'date': pa.date32(),
+             'list': pa.list_(pa.string())}
+    return pa.schema([(name, types[column_type]) for name, column_type, _ in schemas[kind]])
+
+
+def _record_batch(kind, batch_columns):
+    import pyarrow as pa
+
+    schema = _arrow_schema(kind)
+    return pa.RecordBatch.from_arrays([pa.array(batch_columns[field.name], type=field.type) for field in schema],
+                                      schema=schema)
+
+
+def to_arrow(items, kind=None, batch_size=10000):
+    """
+    Build a pyarrow Table
+
+    :param items: Iterable of objects or payloads, see columns()
+    :param kind: show, season, episode or update; only needed for raw payloads
+    :return: pyarrow.Table with one record batch per batch_size items
+    """
+    import pyarrow as pa
+
+    record_batches = [_record_batch(batch_kind, batch_columns)
+                      for batch_kind, batch_columns in batches(items, kind, batch_size)]
+    if not record_batches:
+        return _arrow_schema(kind or 'show').empty_table()
+    return pa.Table.from_batches(record_batches)
+
+
+def write_parquet(path, items, kind=None, batch_size=10000, compression='snappy'):
+    """
+    Stream objects or payloads into a Parquet file, one row group per batch
+
+    :param path: File to write
+    :param items: Iterable of objects or payloads, e.g. a generator over show_index pages
+    :param kind: show, season, episode or update; only needed for raw payloads
+    :return: Number of rows written
+    """
+    import pyarrow.parquet as pq
+
+    writer = None
+    rows = 0
+    try:
+        for batch_kind, batch_columns in batches(items, kind, batch_size):
+            record_batch = _record_batch(batch_kind, batch_columns)
+            if writer is None:
+                writer = pq.ParquetWriter(path, record_batch.schema, compression=compression)
+            writer.write_batch(record_batch)
+            rows += record_batch.num_rows
+        if writer is None:
+            writer = pq.ParquetWriter(path, _arrow_schema(kind or 'show'), compression=compression)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def to_numpy(items, kind=None, batch_size=10000):
+    """
+    Build a NumPy structured array
+
+    Missing integers are -1, missing floats NaN and missing dates NaT; strings and
+    lists are stored as objects.
+    :param items: Iterable of objects or payloads, see columns()
+    :param kind: show, season, episode or update; only needed for raw payloads
+    :return: numpy structured array with one field per column
+    """
+    import numpy as np
+
+    types = {'int': 'i8', 'float': 'f8', 'date': 'M8[D]', 'str': 'O', 'list': 'O'}
+    nulls = {'int': -1, 'float': np.nan}
+    arrays = []
+    for batch_kind, batch_columns in batches(items, kind, batch_size):
+        kind = batch_kind
+        schema = schemas[kind]
+        array = np.empty(len(batch_columns['id']), dtype=[(name, types[column_type])
+                                                           for name, column_type, _ in schema])
+        for name, column_type, _ in schema:
+            values = batch_columns[name]
+            if column_type in nulls:
+                values = [nulls[column_type] if value is None else value for value in values]
+            if types[column_type] == 'O':
+                # Element by element so numpy doesn't treat lists as an extra dimension
+                for row, value in enumerate(values):
+                    array[name][row] = value
+            else:
+                array[name] = np.array(values, dtype=types[column_type])
+        arrays.append(array)
+    if not arrays:
+        schema = schemas[kind or 'show']
+        return np.empty(0, dtype=[(name, types[column_type]) for name, column_type, _ in schema])
+    return np.concatenate(arrays)
+
+
+def to_table(items, kind=None, batch_size=10000):
+    '''Build a pyarrow Table, or a NumPy structured array when pyarrow is not installed.'''
+    try:
+        import pyarrow
+    except ImportError:
+        return to_numpy(items, kind, batch_size)
+    return to_arrow(items, kind, batch_size)
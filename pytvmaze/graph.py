@@ -0,0 +1,213 @@
+#!/usr/bin/python
+from __future__ import unicode_literals
+
+import threading
+
+from pytvmaze import endpoints
+from pytvmaze.tvmaze import TVMaze, Show, Person, Character
+
+
+class CreditGraph(object):
+    '''Local graph of shows, people and characters built from TVMaze cast and crew data.
+
+    crawl() expands shows into their cast and crew and people into their cast and crew
+    credits, level by level and concurrently, requesting every show and person at most
+    once.  Afterwards all queries run against in-memory indexes; payloads are kept once
+    per node and model objects are built on first use and then reused.
+
+    Attributes:
+        tvm (TVMaze): Client used for the crawl, the shared default client if None
+        max_workers (int): Maximum number of concurrent requests
+
+    '''
+
+    def __init__(self, tvm=None, max_workers=8):
+        self.tvm = tvm
+        self.max_workers = max_workers
+        self._shows = dict()               # maze id -> payload
+        self._people = dict()              # person id -> payload
+        self._characters = dict()          # character id -> payload
+        self._cast_by_show = dict()        # maze id -> {(person id, character id)}
+        self._cast_by_person = dict()      # person id -> {(maze id, character id)}
+        self._crew_by_show = dict()        # maze id -> {(person id, crew type)}
+        self._crew_by_person = dict()      # person id -> {(maze id, crew type)}
+        self._expanded_shows = set()
+        self._expanded_people = set()
+        self._models = dict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<CreditGraph(shows={0},people={1},characters={2})>'.format(len(self._shows), len(self._people),
+                                                                           len(self._characters))
+
+    def _get(self, url):
+        if self.tvm is None:
+            return TVMaze._endpoint_standard_get(url) or []
+        with self.tvm.use():
+            return TVMaze._endpoint_standard_get(url) or []
+
+    def _fetch_show(self, maze_id):
+        return self._get(endpoints.show_main_info.format(maze_id) + '?embed[]=cast&embed[]=crew')
+
+    def _fetch_person(self, person_id, need_person):
+        person = self._get(endpoints.person_main_info.format(person_id)) if need_person else None
+        cast = self._get(endpoints.person_cast_credits.format(person_id) + '?embed[]=show&embed[]=character')
+        crew = self._get(endpoints.person_crew_credits.format(person_id) + '?embed=show')
+        return person, cast, crew
+
+    def _add_cast(self, maze_id, person_id, character_id):
+        self._cast_by_show.setdefault(maze_id, set()).add((person_id, character_id))
+        self._cast_by_person.setdefault(person_id, set()).add((maze_id, character_id))
+
+    def _add_crew(self, maze_id, person_id, crew_type):
+        self._crew_by_show.setdefault(maze_id, set()).add((person_id, crew_type))
+        self._crew_by_person.setdefault(person_id, set()).add((maze_id, crew_type))
+
+    def _add_show(self, payload):
+        if not payload:
+            return
+        maze_id = payload['id']
+        embedded = payload.get('_embedded') or {}
+        self._shows[maze_id] = dict((key, value) for key, value in payload.items() if key != '_embedded')
+        for member in embedded.get('cast') or []:
+            person, character = member['person'], member['character']
+            self._people.setdefault(person['id'], person)
+            self._characters.setdefault(character['id'], character)
+            self._add_cast(maze_id, person['id'], character['id'])
+        for member in embedded.get('crew') or []:
+            person = member['person']
+            self._people.setdefault(person['id'], person)
+            self._add_crew(maze_id, person['id'], member.get('type'))
+
+    def _add_person(self, person_id, result):
+        person, cast, crew = result
+        if person:
+            self._people[person_id] = person
+        for credit in cast:
+            embedded = credit.get('_embedded') or {}
+            show, character = embedded.get('show'), embedded.get('character')
+            if not show:
+                continue
+            self._shows.setdefault(show['id'], show)
+            character_id = None
+            if character:
+                self._characters.setdefault(character['id'], character)
+                character_id = character['id']
+            self._add_cast(show['id'], person_id, character_id)
+        for credit in crew:
+            show = (credit.get('_embedded') or {}).get('show')
+            if not show:
+                continue
+            self._shows.setdefault(show['id'], show)
+            self._add_crew(show['id'], person_id, credit.get('type'))
+
+    def crawl(self, shows=(), people=(), depth=2):
+        """
+        Expand shows and people into their cast, crew and credits
+
+        Each level expands everything discovered by the previous one: shows yield
+        people, people yield shows.  Nodes already expanded by an earlier crawl are
+        not requested again.
+        Args:
+            shows: Maze ids (or objects with a maze_id) to start from
+            people: Person ids (or Person objects) to start from
+            depth: Number of levels to expand, 1 only expands the starting nodes
+        :return: self
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        show_frontier = set(int(getattr(show, 'maze_id', show)) for show in shows)
+        person_frontier = set(int(getattr(person, 'id', person)) for person in people)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for _ in range(depth):
+                show_frontier -= self._expanded_shows
+                person_frontier -= self._expanded_people
+                if not show_frontier and not person_frontier:
+                    break
+                show_ids, person_ids = sorted(show_frontier), sorted(person_frontier)
+                show_results = executor.map(self._fetch_show, show_ids)
+                person_results = executor.map(self._fetch_person, person_ids,
+                                              [person_id not in self._people for person_id in person_ids])
+                with self._lock:
+                    for payload in show_results:
+                        self._add_show(payload)
+                    for person_id, result in zip(person_ids, person_results):
+                        self._add_person(person_id, result)
+                    self._expanded_shows.update(show_ids)
+                    self._expanded_people.update(person_ids)
+                person_frontier = set(person_id for maze_id in show_ids for person_id in self.people_in(maze_id))
+                show_frontier = set(maze_id for person_id in person_ids for maze_id in self.shows_of(person_id))
+        return self
+
+    def _model(self, kind, node_id, payloads, model):
+        key = (kind, node_id)
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = model(payloads[node_id])
+            return self._models[key]
+
+    def show(self, maze_id):
+        '''Return the Show for a crawled maze id, built once.'''
+        return self._model('show', maze_id, self._shows, Show)
+
+    def person(self, person_id):
+        '''Return the Person for a crawled person id, built once.'''
+        return self._model('person', person_id, self._people, Person)
+
+    def character(self, character_id):
+        '''Return the Character for a crawled character id, built once.'''
+        return self._model('character', character_id, self._characters, Character)
+
+    def show_ids(self):
+        return sorted(self._shows)
+
+    def person_ids(self):
+        return sorted(self._people)
+
+    def people_in(self, maze_id, cast=True, crew=True):
+        '''Return the sorted ids of the people credited on a show.'''
+        people = set()
+        if cast:
+            people.update(person_id for person_id, _ in self._cast_by_show.get(maze_id, ()))
+        if crew:
+            people.update(person_id for person_id, _ in self._crew_by_show.get(maze_id, ()))
+        return sorted(people)
+
+    def shows_of(self, person_id, cast=True, crew=True):
+        '''Return the sorted maze ids of every show a person worked on, e.g. everything a showrunner made.'''
+        shows = set()
+        if cast:
+            shows.update(maze_id for maze_id, _ in self._cast_by_person.get(person_id, ()))
+        if crew:
+            shows.update(maze_id for maze_id, _ in self._crew_by_person.get(person_id, ()))
+        return sorted(shows)
+
+    def crew_roles(self, person_id):
+        '''Return (maze id, crew type) pairs of a person, sorted.'''
+        return sorted(self._crew_by_person.get(person_id, ()))
+
+    def characters_of(self, person_id):
+        '''Return (maze id, character id) pairs played by a person, sorted.'''
+        return sorted(credit for credit in self._cast_by_person.get(person_id, ()) if credit[1] is not None)
+
+    def shared_cast(self, maze_id, crew=False):
+        """
+        Find shows that share people with a show
+
+        :param crew: Count crew members as well as cast
+        :return: List of (maze id, sorted person ids) with the most shared people first
+        """
+        shared = dict()
+        for person_id in self.people_in(maze_id, crew=crew):
+            for other in self.shows_of(person_id, crew=crew):
+                if other != maze_id:
+                    shared.setdefault(other, set()).add(person_id)
+        return sorted(((other, sorted(ids)) for other, ids in shared.items()), key=lambda item: (-len(item[1]), item[0]))
+
+    def co_workers(self, person_id, crew=True):
+        '''Return the sorted ids of people credited on any show together with a person.'''
+        people = set()
+        for maze_id in self.shows_of(person_id, crew=crew):
+            people.update(self.people_in(maze_id, crew=crew))
+        people.discard(person_id)
+        return sorted(people)
@@ -0,0 +1,268 @@
+#!/usr/bin/python
+from __future__ import unicode_literals
+
+import json
+import mmap
+import os
+import struct
+
+from pytvmaze.tvmaze import Show, Season, Episode
+from pytvmaze.exceptions import *
+
+# File layout (all integers little-endian):
+#   header
+#   show records     sorted by show id
+#   season records   sorted by (show id, season number)
+#   episode records  sorted by (show id, season number, episode number)
+#   episode id index (episode id, episode record number) sorted by episode id
+#   string table     UTF-8 JSON payloads referenced by (offset, length) from the records
+_MAGIC = b'PYTVMAZE'
+_VERSION = 1
+_HEADER = struct.Struct('<8sIIIIQQQQQ')
+_SHOW = struct.Struct('<IqQI')             # id, updated, payload offset, payload length
+_SEASON = struct.Struct('<IIiQI')          # id, show id, number, payload offset, payload length
+_EPISODE = struct.Struct('<IIiiQI')        # id, show id, season, number, payload offset, payload length
+_EPISODE_ID = struct.Struct('<II')         # episode id, episode record number
+
+
+def _record_id(kind, value):
+    # Every record is keyed by its id
+    if value is None:
+        raise SnapshotError('Cannot write a {0} without an id to a snapshot'.format(kind))
+    return value
+
+
+def _show_payload(show):
+    # Seasons and episodes get their own records
+    data = show.to_dict()
+    embedded = dict(data.pop('_embedded', None) or {})
+    embedded.pop('episodes', None)
+    embedded.pop('seasons', None)
+    if embedded:
+        data['_embedded'] = embedded
+    return data
+
+
+def _season_payload(season):
+    data = season.to_dict()
+    data.pop('_embedded', None)
+    return data
+
+
+def write_snapshot(path, shows, seasons=None, episodes=None):
+    """
+    Write shows, seasons and episodes to a snapshot file readable with Snapshot
+
+    Seasons and episodes already attached to a show (get_show(..., embed='episodes'))
+    are included automatically.
+    :param path: File to write
+    :param shows: Iterable of Show objects
+    :param seasons: Optional dict of maze id to an iterable of Season objects
+    :param episodes: Optional dict of maze id to an iterable of Episode objects
+    :return: Number of shows written
+    """
+    seasons = seasons or {}
+    episodes = episodes or {}
+    strings = []
+    string_offset = [0]
+
+    def add_string(payload):
+        data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        offset = string_offset[0]
+        strings.append(data)
+        string_offset[0] += len(data)
+        return offset, len(data)
+
+    show_rows = dict()
+    season_rows = dict()
+    episode_rows = dict()
+    for show in shows:
+        _record_id('show', show.id)
+        show_rows[show.id] = (show.id, show.updated or 0) + add_string(_show_payload(show))
+        show_seasons = list(seasons.get(show.id, [])) + list(show._seasons.values())
+        show_episodes = list(episodes.get(show.id, []))
+        for season in show_seasons:
+            row = (_record_id('season', season.id), show.id, season.season_number or 0)
+            season_rows[row[1:]] = row + add_string(_season_payload(season))
+            show_episodes.extend(season._episodes.values())
+        for episode in show_episodes:
+            key = (show.id, episode.season_number or 0, episode.episode_number or 0,
+                   _record_id('episode', episode.maze_id))
+            if key not in episode_rows:
+                episode_rows[key] = (episode.maze_id, show.id, episode.season_number or 0,
+                                     episode.episode_number or 0) + add_string(episode.to_dict())
+
+    show_table = b''.join(_SHOW.pack(*show_rows[key]) for key in sorted(show_rows))
+    season_table = b''.join(_SEASON.pack(*season_rows[key]) for key in sorted(season_rows))
+    episode_keys = sorted(episode_rows)
+    episode_table = b''.join(_EPISODE.pack(*episode_rows[key]) for key in episode_keys)
+    episode_index = b''.join(_EPISODE_ID.pack(episode_id, row) for episode_id, row in
+                             sorted((key[3], row) for row, key in enumerate(episode_keys)))
+
+    seasons_at = _HEADER.size + len(show_table)
+    episodes_at = seasons_at + len(season_table)
+    index_at = episodes_at + len(episode_table)
+    strings_at = index_at + len(episode_index)
+    header = _HEADER.pack(_MAGIC, _VERSION, len(show_rows), len(season_rows), len(episode_rows),
+                          seasons_at, episodes_at, index_at, strings_at, string_offset[0])
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for chunk in (header, show_table, season_table, episode_table, episode_index):
+            f.write(chunk)
+        for data in strings:
+            f.write(data)
+    getattr(os, 'replace', os.rename)(tmp_path, path)
+    return len(show_rows)
+
+
+class Snapshot(object):
+    '''Read-only, memory-mapped catalog of shows, seasons and episodes written by write_snapshot.
+
+    Opening a snapshot only maps the file; records are located by binary search over
+    fixed-width tables and model objects are built when they are requested.  Every
+    process mapping the same file shares its pages through the OS page cache.
+
+    Attributes:
+        path (str): Snapshot file
+        show_count (int): Number of shows in the snapshot
+        season_count (int): Number of seasons in the snapshot
+        episode_count (int): Number of episodes in the snapshot
+
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            # An empty file can't be mapped at all
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise SnapshotError('{0} is not a pytvmaze snapshot'.format(path))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.show_count, self.season_count, self.episode_count, self._seasons_at,
+         self._episodes_at, self._index_at, self._strings_at, strings_length) = _HEADER.unpack_from(self._mmap, 0)
+        error = None
+        if magic != _MAGIC:
+            error = '{0} is not a pytvmaze snapshot'.format(path)
+        elif version != _VERSION:
+            error = 'Unsupported snapshot version {0}'.format(version)
+        elif len(self._mmap) < self._strings_at + strings_length:
+            error = '{0} is truncated'.format(path)
+        if error is not None:
+            self._mmap.close()
+            raise SnapshotError(error)
+
+    def __repr__(self):
+        return '<Snapshot(path={path},shows={shows},episodes={episodes})>'.format(path=self.path,
+                                                                                  shows=self.show_count,
+                                                                                  episodes=self.episode_count)
+
+    def __len__(self):
+        return self.show_count
+
+    def __contains__(self, maze_id):
+        return self._find_show(maze_id) is not None
+
+    def __iter__(self):
+        for maze_id in self.show_ids():
+            yield self.show(maze_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._mmap.close()
+
+    def _record(self, record, table_at, row):
+        return record.unpack_from(self._mmap, table_at + row * record.size)
+
+    def _payload(self, offset, length):
+        start = self._strings_at + offset
+        return json.loads(self._mmap[start:start + length].decode('utf-8'))
+
+    # Index of the first row whose key is >= value
+    def _lower_bound(self, record, table_at, count, value, key):
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if key(self._record(record, table_at, middle)) < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find_show(self, maze_id):
+        maze_id = int(maze_id)
+        row = self._lower_bound(_SHOW, _HEADER.size, self.show_count, maze_id, lambda r: r[0])
+        if row < self.show_count:
+            record = self._record(_SHOW, _HEADER.size, row)
+            if record[0] == maze_id:
+                return record
+
+    def _rows(self, record, table_at, count, maze_id):
+        row = self._lower_bound(record, table_at, count, maze_id, lambda r: r[1])
+        while row < count:
+            values = self._record(record, table_at, row)
+            if values[1] != maze_id:
+                break
+            yield values
+            row += 1
+
+    def show_ids(self):
+        '''Iterate over the maze ids of all shows in ascending order.'''
+        for row in range(self.show_count):
+            yield self._record(_SHOW, _HEADER.size, row)[0]
+
+    def updated(self, maze_id):
+        '''Return the "updated" timestamp of a show without building it.'''
+        record = self._find_show(maze_id)
+        if record is None:
+            raise IDNotFound('Maze id {0} not found in snapshot'.format(maze_id))
+        return record[1]
+
+    def show(self, maze_id, episodes=True):
+        """
+        Build a Show from the snapshot
+
+        :param maze_id: Show maze id
+        :param episodes: Attach the show's seasons and episodes as get_show(..., embed='episodes') does
+        :return: Show
+        """
+        record = self._find_show(maze_id)
+        if record is None:
+            raise IDNotFound('Maze id {0} not found in snapshot'.format(maze_id))
+        data = self._payload(record[2], record[3])
+        if episodes:
+            episode_payloads = [self._payload(r[4], r[5]) for r in
+                                self._rows(_EPISODE, self._episodes_at, self.episode_count, record[0])]
+            if episode_payloads:
+                season_payloads = [self._payload(r[3], r[4]) for r in
+                                   self._rows(_SEASON, self._seasons_at, self.season_count, record[0])]
+                # Show needs a Season for every episode, stand in for seasons that weren't stored
+                known = set(season['number'] for season in season_payloads)
+                season_payloads.extend({'number': number} for number in
+                                       sorted(set(episode['season'] for episode in episode_payloads) - known))
+                data.setdefault('_embedded', {}).update(episodes=episode_payloads, seasons=season_payloads)
+        return Show(data)
+
+    def seasons(self, maze_id):
+        '''Return a dict of season number to Season, like show_seasons.'''
+        return dict((r[2], Season(self._payload(r[3], r[4]))) for r in
+                    self._rows(_SEASON, self._seasons_at, self.season_count, int(maze_id)))
+
+    def episodes(self, maze_id):
+        '''Return a show's episodes ordered by season and episode number, like episode_list.'''
+        return [Episode(self._payload(r[4], r[5])) for r in
+                self._rows(_EPISODE, self._episodes_at, self.episode_count, int(maze_id))]
+
+    def episode(self, episode_id):
+        '''Return an Episode by its id, like episode_by_id.'''
+        episode_id = int(episode_id)
+        row = self._lower_bound(_EPISODE_ID, self._index_at, self.episode_count, episode_id, lambda r: r[0])
+        if row < self.episode_count:
+            found_id, episode_row = self._record(_EPISODE_ID, self._index_at, row)
+            if found_id == episode_id:
+                values = self._record(_EPISODE, self._episodes_at, episode_row)
+                return Episode(self._payload(values[4], values[5]))
+        raise EpisodeNotFound('Couldn\'t find Episode with ID {0} in snapshot'.format(episode_id))
@@ -1,17 +1,111 @@
 #!/usr/bin/python
 from __future__ import unicode_literals
 
+import functools
+import json
+import os
 import re
-from datetime import datetime
-import requests
-from requests.packages.urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+import time
+from datetime import datetime, timedelta
+from calendar import timegm
+import heapq
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
 from pytvmaze import endpoints
+from pytvmaze.cache import MemoryCache
+from pytvmaze import backends as _backends
+from pytvmaze.backends import HTTPBackend
 from pytvmaze.exceptions import *
 
+# requests and concurrent.futures are imported where they are first
+# used so that importing pytvmaze stays cheap for code that never touches the network
 
-class Show(object):
+# Version of the pickled state of model objects, bump when its layout changes
+_STATE_VERSION = 1
+
+# Seconds a cached schedule day stays valid; days that are over everywhere never change
+_schedule_past_ttl = float('inf')
+_schedule_today_ttl = 300
+_schedule_future_ttl = 3600
+# Country-days get_schedule_range keeps when TVMaze was given no cache
+_schedule_cache_entries = 256
+
+
+class _StaleDict(dict):
+    '''Payload served from an expired cache entry, see TVMaze(stale_while_revalidate=...).'''
+    stale_since = None
+
+
+class _StaleList(list):
+    stale_since = None
+
+
+def _mark_stale(payload, since):
+    # Marks the payload and, for lists, each object in it so every model built from it is flagged
+    if isinstance(payload, dict):
+        marked = _StaleDict(payload)
+    elif isinstance(payload, list):
+        marked = _StaleList(_mark_stale(item, since) for item in payload)
+    else:
+        return payload
+    marked.stale_since = since
+    return marked
+
+
+class Model(object):
+    '''Base class of all objects built from a TVMaze api payload.
+
+    Objects keep the payload they were built from.  to_dict returns it, including
+    related resources loaded afterwards, and from_dict rebuilds an equal object
+    from it without any request.  Pickling stores only a version number and this
+    payload; derived attributes and nested objects are rebuilt when unpickling.
+    '''
+    # Resource name -> _PendingPrefetch started by TVMaze(prefetch=...)
+    _pending_prefetch = None
+
+    @property
+    def stale(self):
+        '''True when built from an expired cached response because TVMaze was slow or unreachable.'''
+        return getattr(getattr(self, '_data', None), 'stale_since', None) is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data)
+
+    def _prefetchable(self):
+        # Resource name -> function fetching it, for resources not loaded yet
+        return dict()
+
+    def _prefetched(self, name):
+        # Result of the background prefetch of a resource, waiting for it if still running;
+        # None without one or when it failed
+        pending = self._pending_prefetch.pop(name, None) if self._pending_prefetch else None
+        return pending.take() if pending is not None else None
+
+    def __getstate__(self):
+        return _STATE_VERSION, self.to_dict()
+
+    def __setstate__(self, state):
+        version, data = state
+        if version != _STATE_VERSION:
+            raise GeneralError('Unsupported {0} state version {1}'.format(type(self).__name__, version))
+        self._restore(data)
+
+    def _restore(self, data):
+        self.__init__(data)
+
+
+class Show(Model):
     def __init__(self, data):
+        self._data = data
         self.status = data.get('status')
         self.rating = data.get('rating')
         self.genres = data.get('genres')
@@ -39,10 +133,15 @@ class Show(object):
         else:
             self.network = None
         self.__episodes = list()
-        self.seasons = dict()
-        self.cast = None
+        self._seasons = dict()
+        self._seasons_loaded = False
+        self.__cast = None
         self.__nextepisode = None
         self.__previousepisode = None
+        if 'score' in data:
+            self.score = data['score']
+        # Guards the lazy properties so concurrent readers trigger a single request
+        self.__lock = threading.Lock()
         self.populate(data)
 
     def __repr__(self):
@@ -94,50 +193,160 @@ class Show(object):
         except KeyError:
             raise SeasonNotFound('Season {0} does not exist for show {1}.'.format(item, self.name))
 
+    def _linked_episode_id(self, link):
+        if self.links and link in self.links and 'href' in self.links[link]:
+            episode_id = self.links[link]['href'].rsplit('/', 1)[1]
+            if episode_id.isdigit():
+                return episode_id
+
+    # Links whose episode hasn't been loaded yet, as {link: episode id}
+    def _pending_linked_episodes(self):
+        pending = dict()
+        for link, episode in (('nextepisode', self.__nextepisode), ('previousepisode', self.__previousepisode)):
+            episode_id = self._linked_episode_id(link)
+            if episode is None and episode_id:
+                pending[link] = episode_id
+        return pending
+
+    def _prefetchable(self):
+        fetches = dict()
+        if not self.maze_id:
+            return fetches
+        if not self.__episodes:
+            fetches['episodes'] = functools.partial(episode_list, self.maze_id, specials=True)
+        if not self._seasons_loaded:
+            fetches['seasons'] = functools.partial(show_seasons, self.maze_id)
+        if self.__cast is None:
+            fetches['cast'] = functools.partial(show_cast, self.maze_id)
+        for link, episode_id in self._pending_linked_episodes().items():
+            name = 'next_episode' if link == 'nextepisode' else 'previous_episode'
+            fetches[name] = functools.partial(episode_by_id, episode_id)
+        return fetches
+
+    def _set_linked_episode(self, link, episode):
+        with self.__lock:
+            if link == 'nextepisode':
+                self.__nextepisode = self.__nextepisode or episode
+            else:
+                self.__previousepisode = self.__previousepisode or episode
+
     @property
     def next_episode(self):
-        if self.__nextepisode is None and 'nextepisode' in self.links and 'href' in self.links['nextepisode']:
-            episode_id = self.links['nextepisode']['href'].rsplit('/',1)[1]
-            if episode_id.isdigit():
-                self.__nextepisode = episode_by_id(episode_id)
+        if self.__nextepisode is None:
+            with self.__lock:
+                episode_id = self._linked_episode_id('nextepisode')
+                if self.__nextepisode is None and episode_id:
+                    self.__nextepisode = self._prefetched('next_episode') or episode_by_id(episode_id)
         return self.__nextepisode
 
     @property
     def previous_episode(self):
-        if self.__previousepisode is None and 'previousepisode' in self.links and 'href' in self.links['previousepisode']:
-            episode_id = self.links['previousepisode']['href'].rsplit('/',1)[1]
-            if episode_id.isdigit():
-                self.__previousepisode = episode_by_id(episode_id)
+        if self.__previousepisode is None:
+            with self.__lock:
+                episode_id = self._linked_episode_id('previousepisode')
+                if self.__previousepisode is None and episode_id:
+                    self.__previousepisode = self._prefetched('previous_episode') or episode_by_id(episode_id)
         return self.__previousepisode
 
+    @property
+    def seasons(self):
+        if not self._seasons_loaded:
+            with self.__lock:
+                if not self._seasons_loaded and self.maze_id:
+                    seasons = self._prefetched('seasons')
+                    if seasons is None:
+                        try:
+                            seasons = show_seasons(self.maze_id)
+                        except SeasonNotFound:
+                            seasons = dict()
+                    for season in seasons.values():
+                        season.show = self
+                    self._seasons = seasons
+                    self._seasons_loaded = True
+        return self._seasons
+
     @property
     def episodes(self):
         if not self.__episodes:
-            self.__episodes = episode_list(self.maze_id, specials=True)
+            with self.__lock:
+                if not self.__episodes:
+                    self.__episodes = self._prefetched('episodes') or episode_list(self.maze_id, specials=True)
         return self.__episodes
 
+    @property
+    def cast(self):
+        # Only loaded when embedded or prefetched
+        if self.__cast is None and self._pending_prefetch:
+            self.__cast = self._prefetched('cast')
+        return self.__cast
+
+    @cast.setter
+    def cast(self, cast):
+        self.__cast = cast
 
     def populate(self, data):
         embedded = data.get('_embedded')
         if embedded:
             if embedded.get('episodes'):
-                seasons = show_seasons(self.maze_id)
+                # Seasons embedded by to_dict or a snapshot save the show_seasons request
+                if 'seasons' in embedded:
+                    seasons = dict((season['number'], Season(season)) for season in embedded['seasons'])
+                else:
+                    seasons = show_seasons(self.maze_id)
                 for episode in embedded.get('episodes'):
                     self.__episodes.append(Episode(episode))
                 for episode in self.__episodes:
                     season_num = int(episode.season_number)
-                    if season_num not in self.seasons:
-                        self.seasons[season_num] = seasons[season_num]
-                        self.seasons[season_num].show = self
-                    self.seasons[season_num].episodes[episode.episode_number] = episode
+                    if season_num not in self._seasons:
+                        if season_num not in seasons:
+                            continue
+                        self._seasons[season_num] = seasons[season_num]
+                        self._seasons[season_num].show = self
+                        self._seasons[season_num]._episodes_loaded = True
+                    self._seasons[season_num]._episodes[episode.episode_number] = episode
+                self._seasons_loaded = True
+            elif 'seasons' in embedded:
+                for season in embedded['seasons']:
+                    season = Season(season)
+                    season.show = self
+                    self._seasons[season.season_number] = season
+                self._seasons_loaded = True
             if embedded.get('cast'):
                 self.cast = Cast(embedded.get('cast'))
+            if embedded.get('nextepisode'):
+                self.__nextepisode = Episode(embedded['nextepisode'])
+            if embedded.get('previousepisode'):
+                self.__previousepisode = Episode(embedded['previousepisode'])
+
+    def to_dict(self):
+        data = dict(self._data)
+        embedded = dict(data.get('_embedded') or {})
+        # Episodes loaded without their seasons are left out, the copy would fetch the seasons
+        # while being built; it loads both lazily instead
+        if self.__episodes and self._seasons_loaded:
+            embedded['episodes'] = [episode.to_dict() for episode in self.__episodes]
+            embedded['seasons'] = [dict(season._data) for season in self._seasons.values()]
+        elif self._seasons_loaded and self._seasons:
+            embedded['seasons'] = [season.to_dict() for season in self._seasons.values()]
+        if self.cast:
+            embedded['cast'] = self.cast.to_dict()
+        if self.__nextepisode:
+            embedded['nextepisode'] = self.__nextepisode.to_dict()
+        if self.__previousepisode:
+            embedded['previousepisode'] = self.__previousepisode.to_dict()
+        if embedded:
+            data['_embedded'] = embedded
+        if 'score' in self.__dict__:
+            data['score'] = self.score
+        return data
 
 
-class Season(object):
+class Season(Model):
     def __init__(self, data):
+        self._data = data
         self.show = None
-        self.episodes = dict()
+        self._episodes = dict()
+        self._episodes_loaded = False
         self.id = data.get('id')
         self.url = data.get('url')
         self.season_number = data.get('number')
@@ -156,6 +365,35 @@ class Season(object):
         self.image = data.get('image')
         self.summary = data.get('summary')
         self.links = data.get('_links')
+        embedded = data.get('_embedded')
+        if embedded and embedded.get('episodes'):
+            for episode in embedded['episodes']:
+                episode = Episode(episode)
+                self._episodes[episode.episode_number] = episode
+            self._episodes_loaded = True
+        self.__lock = threading.Lock()
+
+    @property
+    def episodes(self):
+        # Loaded from the season's own episodes endpoint the first time they are needed
+        if not self._episodes_loaded:
+            with self.__lock:
+                if not self._episodes_loaded and self.id:
+                    try:
+                        episodes = season_episodes(self.id)
+                    except EpisodeNotFound:
+                        episodes = []
+                    for episode in episodes:
+                        self._episodes[episode.episode_number] = episode
+                    self._episodes_loaded = True
+        return self._episodes
+
+    def to_dict(self):
+        data = dict(self._data)
+        if self._episodes:
+            data['_embedded'] = dict(data.get('_embedded') or {})
+            data['_embedded']['episodes'] = [episode.to_dict() for episode in self._episodes.values()]
+        return data
 
     def __repr__(self):
         return _valid_encoding('<Season(id={id},season_number={number})>'.format(
@@ -185,8 +423,9 @@ class Season(object):
     def __nonzero__(self):
         return bool(self.id)
 
-class Episode(object):
+class Episode(Model):
     def __init__(self, data):
+        self._data = data
         self.title = data.get('name')
         self.airdate = data.get('airdate')
         self.url = data.get('url')
@@ -231,21 +470,51 @@ class Episode(object):
         return True
 
 
-class Person(object):
+class Person(Model):
     def __init__(self, data):
+        self._data = data
         if data.get('person'):
             data = data['person']
         self.links = data.get('_links')
         self.id = data.get('id')
         self.image = data.get('image')
         self.name = data.get('name')
-        self.score = data.get('score')
+        self.score = self._data.get('score')
         self.url = data.get('url')
         self.character = None
-        self.castcredits = None
-        self.crewcredits = None
+        self._castcredits = None
+        self._crewcredits = None
         self.populate(data)
 
+    def _prefetchable(self):
+        fetches = dict()
+        if self.id and self._castcredits is None:
+            fetches['castcredits'] = functools.partial(person_cast_credits, self.id)
+        if self.id and self._crewcredits is None:
+            fetches['crewcredits'] = functools.partial(person_crew_credits, self.id)
+        return fetches
+
+    # Only loaded when embedded or prefetched
+    @property
+    def castcredits(self):
+        if self._castcredits is None and self._pending_prefetch:
+            self._castcredits = self._prefetched('castcredits')
+        return self._castcredits
+
+    @castcredits.setter
+    def castcredits(self, credits):
+        self._castcredits = credits
+
+    @property
+    def crewcredits(self):
+        if self._crewcredits is None and self._pending_prefetch:
+            self._crewcredits = self._prefetched('crewcredits')
+        return self._crewcredits
+
+    @crewcredits.setter
+    def crewcredits(self, credits):
+        self._crewcredits = credits
+
     def populate(self, data):
         if data.get('_embedded'):
             if data['_embedded'].get('castcredits'):
@@ -265,8 +534,9 @@ class Person(object):
         return _valid_encoding(self.name)
 
 
-class Character(object):
+class Character(Model):
     def __init__(self, data):
+        self._data = data
         self.id = data.get('id')
         self.url = data.get('url')
         self.name = data.get('name')
@@ -287,12 +557,16 @@ class Character(object):
         return self.name
 
 
-class Cast(object):
+class Cast(Model):
     def __init__(self, data):
+        self._data = data
         self.people = []
         self.characters = []
         self.populate(data)
 
+    def to_dict(self):
+        return list(self._data)
+
     def populate(self, data):
         for cast_member in data:
             self.people.append(Person(cast_member['person']))
@@ -301,8 +575,9 @@ class Cast(object):
             self.characters[-1].person = self.people[-1]  # add reference to cast member
 
 
-class CastCredit(object):
+class CastCredit(Model):
     def __init__(self, data):
+        self._data = data
         self.links = data.get('_links')
         self.character = None
         self.show = None
@@ -316,8 +591,9 @@ class CastCredit(object):
                 self.show = Show(data['_embedded']['show'])
 
 
-class CrewCredit(object):
+class CrewCredit(Model):
     def __init__(self, data):
+        self._data = data
         self.links = data.get('_links')
         self.type = data.get('type')
         self.show = None
@@ -329,8 +605,9 @@ class CrewCredit(object):
                 self.show = Show(data['_embedded']['show'])
 
 
-class Crew(object):
+class Crew(Model):
     def __init__(self, data):
+        self._data = data
         self.person = Person(data.get('person'))
         self.type = data.get('type')
 
@@ -342,8 +619,9 @@ class Crew(object):
         ))
 
 
-class Updates(object):
+class Updates(Model):
     def __init__(self, data):
+        self._data = data
         self.updates = dict()
         self.populate(data)
 
@@ -361,12 +639,22 @@ class Updates(object):
         return iter(self.updates.values())
 
 
-class Update(object):
+class Update(Model):
     def __init__(self, maze_id, time):
         self.maze_id = int(maze_id)
         self.seconds_since_epoch = time
         self.timestamp = datetime.fromtimestamp(time)
 
+    def to_dict(self):
+        return {'id': self.maze_id, 'time': self.seconds_since_epoch}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['time'])
+
+    def _restore(self, data):
+        self.__init__(data['id'], data['time'])
+
     def __repr__(self):
         return '<Update(maze_id={maze_id},time={time})>'.format(
                 maze_id=self.maze_id,
@@ -374,8 +662,9 @@ class Update(object):
         )
 
 
-class AKA(object):
+class AKA(Model):
     def __init__(self, data):
+        self._data = data
         self.name = data.get('name')
         self.country = data.get('country')
 
@@ -383,8 +672,9 @@ class AKA(object):
         return '<AKA(name={name},country={country})>'.format(name=name, country=country)
 
 
-class Network(object):
+class Network(Model):
     def __init__(self, data):
+        self._data = data
         self.name = data.get('name')
         self.maze_id = data.get('id')
         if data.get('country'):
@@ -396,8 +686,9 @@ class Network(object):
         return '<Network(name={name},country={country})>'.format(name=self.name, country=self.country)
 
 
-class WebChannel(object):
+class WebChannel(Model):
     def __init__(self, data):
+        self._data = data
         self.name = data.get('name')
         self.maze_id = data.get('id')
         if data.get('country'):
@@ -409,8 +700,9 @@ class WebChannel(object):
         return '<WebChannel(name={name},country={country})>'.format(name=self.name, country=self.country)
 
 
-class FollowedShow(object):
+class FollowedShow(Model):
     def __init__(self, data):
+        self._data = data
         self.maze_id = data.get('show_id')
         self.show = None
         if data.get('_embedded'):
@@ -420,8 +712,9 @@ class FollowedShow(object):
         return '<FollowedShow(maze_id={})>'.format(self.maze_id)
 
 
-class FollowedPerson(object):
+class FollowedPerson(Model):
     def __init__(self, data):
+        self._data = data
         self.person_id = data.get('person_id')
         self.person = None
         if data.get('_embedded'):
@@ -431,8 +724,9 @@ class FollowedPerson(object):
         return '<FollowedPerson(person_id={id})>'.format(id=self.person_id)
 
 
-class FollowedNetwork(object):
+class FollowedNetwork(Model):
     def __init__(self, data):
+        self._data = data
         self.network_id = data.get('network_id')
         self.network = None
         if data.get('_embedded'):
@@ -442,8 +736,9 @@ class FollowedNetwork(object):
         return '<FollowedNetwork(network_id={id})>'.format(id=self.network_id)
 
 
-class FollowedWebChannel(object):
+class FollowedWebChannel(Model):
     def __init__(self, data):
+        self._data = data
         self.web_channel_id = data.get('webchannel_id')
         self.web_channel = None
         if data.get('_embedded'):
@@ -453,8 +748,9 @@ class FollowedWebChannel(object):
         return '<FollowedWebChannel(web_channel_id={id})>'.format(id=self.web_channel_id)
 
 
-class MarkedEpisode(object):
+class MarkedEpisode(Model):
     def __init__(self, data):
+        self._data = data
         self.episode_id = data.get('episode_id')
         self.marked_at = data.get('marked_at')
         type_ = data.get('type')
@@ -467,8 +763,9 @@ class MarkedEpisode(object):
                                                                                            type=self.type)
 
 
-class VotedShow(object):
+class VotedShow(Model):
     def __init__(self, data):
+        self._data = data
         self.maze_id = data.get('show_id')
         self.voted_at = data.get('voted_at')
         self.vote = data.get('vote')
@@ -481,8 +778,9 @@ class VotedShow(object):
                                                                                   vote=self.vote)
 
 
-class VotedEpisode(object):
+class VotedEpisode(Model):
     def __init__(self, data):
+        self._data = data
         self.episode_id = data.get('episode_id')
         self.voted_at = data.get('voted_at')
         self.vote = data.get('vote')
@@ -503,7 +801,7 @@ def _valid_encoding(text):
 
 
 def _url_quote(show):
-    return requests.compat.quote(show.encode('UTF-8'))
+    return quote(show.encode('UTF-8'))
 
 
 def _remove_tags(text):
@@ -512,34 +810,1284 @@ def _remove_tags(text):
     return re.sub(r'<.*?>', '', text)
 
 
+class Record(object):
+    '''Lightweight row of the payload fields selected by a Projection.
+
+    Fields are attributes with dots replaced by underscores (record.show_id) and
+    items under their path (record['show.id']).  Missing fields are None.
+    '''
+    __slots__ = ('_projection', '_values')
+
+    def __init__(self, projection, values):
+        self._projection = projection
+        self._values = values
+
+    def __getattr__(self, name):
+        try:
+            return self._values[self._projection._attributes[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, item):
+        if isinstance(item, int):
+            return self._values[item]
+        return self._values[self._projection._indexes[item]]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        return Record, (self._projection, self._values)
+
+    def __repr__(self):
+        return '<Record({0})>'.format(','.join('{0}={1!r}'.format(field, value)
+                                               for field, value in zip(self._projection.fields, self._values)))
+
+    def to_dict(self):
+        '''Return {field path: value}.'''
+        return dict(zip(self._projection.fields, self._values))
+
+
+class Projection(object):
+    '''Builds Records holding only some fields of a payload instead of a full model.
+
+    Fields are payload paths with dots for nested objects, e.g. id, externals.thetvdb
+    or show.id.  Nothing else of the payload is parsed or kept.
+
+    Attributes:
+        fields (tuple): Field paths in record order
+    '''
+
+    def __init__(self, fields):
+        if isinstance(fields, Projection):
+            fields = fields.fields
+        elif not isinstance(fields, (list, tuple)):
+            fields = [field.strip() for field in fields.split(',')]
+        if not fields:
+            raise MissingParameters('A projection needs at least one field')
+        self.fields = tuple(fields)
+        self._paths = tuple(tuple(field.split('.')) for field in self.fields)
+        self._indexes = dict((field, index) for index, field in enumerate(self.fields))
+        self._attributes = dict((field.replace('.', '_'), index) for index, field in enumerate(self.fields))
+
+    def __repr__(self):
+        return '<Projection({0})>'.format(','.join(self.fields))
+
+    def __eq__(self, other):
+        return isinstance(other, Projection) and self.fields == other.fields
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.fields)
+
+    def __reduce__(self):
+        return Projection, (self.fields,)
+
+    def __call__(self, data):
+        values = []
+        for path in self._paths:
+            value = data.get(path[0])
+            for key in path[1:]:
+                if value is None:
+                    break
+                value = value.get(key) if isinstance(value, dict) else None
+            values.append(value)
+        return Record(self, tuple(values))
+
+
+def _model_or_projection(model, fields):
+    # What list endpoints build from each payload: the full model, or Records of the requested fields
+    if fields is None:
+        return model
+    return fields if isinstance(fields, Projection) else Projection(fields)
+
+
+# Client used by module level endpoint functions in the current thread, see TVMaze.use()
+_context = threading.local()
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def _current_client():
+    global _default_client
+    client = getattr(_context, 'client', None)
+    if client is not None:
+        return client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = TVMaze()
+    return _default_client
+
+
+class IDMap(object):
+    '''Mapping of external show ids (TVDB, TVRage, IMDB) to TVMaze ids.
+
+    The map is filled from ``Show.externals`` of every show passed to
+    ``add_show``/``add_shows`` and can be persisted as a JSON file so lookups
+    survive between runs.
+
+    Attributes:
+        path (str): Optional JSON file the map is loaded from and saved to
+
+    '''
+    sources = ('tvdb', 'tvrage', 'imdb')
+    # Keys used by the TVMaze api in a show's "externals" dict
+    _externals_keys = {'tvdb': 'thetvdb', 'tvrage': 'tvrage', 'imdb': 'imdb'}
+
+    def __init__(self, path=None):
+        self.path = path
+        self._ids = dict((source, dict()) for source in self.sources)
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._ids.values())
+
+    def __repr__(self):
+        return '<IDMap(entries={0})>'.format(len(self))
+
+    @staticmethod
+    def _key(source, external_id):
+        if source == 'imdb':
+            return str(external_id).lower()
+        return str(external_id)
+
+    def get(self, source, external_id):
+        if source not in self._ids:
+            raise ValueError('source must be one of {0}'.format(', '.join(self.sources)))
+        return self._ids[source].get(self._key(source, external_id))
+
+    def add(self, source, external_id, maze_id):
+        if source not in self._ids:
+            raise ValueError('source must be one of {0}'.format(', '.join(self.sources)))
+        if external_id is None or maze_id is None:
+            return
+        with self._lock:
+            self._ids[source][self._key(source, external_id)] = int(maze_id)
+
+    def add_show(self, show):
+        if not show or not show.externals:
+            return
+        for source, key in self._externals_keys.items():
+            self.add(source, show.externals.get(key), show.maze_id)
+
+    def add_shows(self, shows):
+        for show in shows:
+            self.add_show(show)
+
+    def crawl_show_index(self, start_page=0, end_page=None):
+        '''Bulk load the map from the TVMaze show index.
+
+        Pages are read from start_page until end_page (exclusive) or the end
+        of the index is reached.
+        :return: Number of the first page that was not read
+        '''
+        page = start_page
+        while end_page is None or page < end_page:
+            try:
+                shows = show_index(page)
+            except ShowIndexError:
+                break
+            self.add_shows(shows)
+            page += 1
+        return page
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path) as f:
+            data = json.load(f)
+        with self._lock:
+            for source in self.sources:
+                self._ids[source].update((key, int(value)) for key, value in data.get(source, {}).items())
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            raise MissingParameters('A path is required to save an IDMap')
+        with self._lock:
+            data = dict((source, dict(ids)) for source, ids in self._ids.items())
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        # os.replace is atomic on every platform but missing on Python 2
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+
+
+class RateLimiter(object):
+    '''Token bucket allowing on average ``rate`` calls per second in bursts of up to ``burst`` calls.
+
+    Safe to share between threads; ``acquire`` blocks until a call is allowed.
+    '''
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0')
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<RateLimiter(rate={rate},burst={burst})>'.format(rate=self.rate, burst=self.burst)
+
+    def acquire(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self):
+        '''Take a call without waiting; False if none is allowed right now.'''
+        return not self._take()
+
+    # Takes a token and returns 0, or returns the seconds until one is available
+    def _take(self):
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+def _endpoint_template(url):
+    # /shows/161/episodes?specials=1 -> /shows/{}/episodes?specials={}
+    path, _, query = url.partition('?')
+    path = '/'.join('{}' if part.isdigit() else part for part in path.split('://', 1)[-1].split('/')[1:])
+    if query:
+        query = '&'.join(sorted(set(parameter.split('=', 1)[0] + '={}' for parameter in query.split('&'))))
+        return '/' + path + '?' + query
+    return '/' + path
+
+
+class CircuitBreaker(object):
+    '''Fails requests to an endpoint fast while it keeps failing.
+
+    Outcomes are tracked per endpoint template (the url with ids replaced).  A circuit
+    opens when at least ``min_requests`` of the last ``window`` requests were made and the
+    share of failures reached ``failure_threshold``.  Requests to an open endpoint raise
+    CircuitOpen without being sent.  After ``reset_timeout`` seconds one trial request is
+    let through; its success closes the circuit, a failure opens it again.  A trial cut
+    short by the caller's deadline is cancelled and the next request becomes the trial.
+
+    Safe to share between threads.
+    '''
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold=0.5, window=20, min_requests=10, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self._circuits = dict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<CircuitBreaker(failure_threshold={0},window={1},reset_timeout={2})>'.format(
+                self.failure_threshold, self.window, self.reset_timeout)
+
+    def _circuit(self, template):
+        circuit = self._circuits.get(template)
+        if circuit is None:
+            circuit = {'state': self.CLOSED, 'outcomes': deque(maxlen=self.window), 'opened_at': None}
+            self._circuits[template] = circuit
+        return circuit
+
+    def state(self, template):
+        with self._lock:
+            return self._circuit(template)['state']
+
+    def before(self, template):
+        '''Raise CircuitOpen unless a request to template may be sent.'''
+        with self._lock:
+            circuit = self._circuit(template)
+            if circuit['state'] == self.CLOSED:
+                return
+            if circuit['state'] == self.OPEN and time.time() - circuit['opened_at'] >= self.reset_timeout:
+                circuit['state'] = self.HALF_OPEN
+                return
+        raise CircuitOpen('Circuit for {0} is open after repeated failures'.format(template))
+
+    def cancel(self, template):
+        '''Forget a request that ended without an outcome; a half-open trial is left to the next request.'''
+        with self._lock:
+            circuit = self._circuit(template)
+            if circuit['state'] == self.HALF_OPEN:
+                circuit['state'] = self.OPEN
+
+    def record(self, template, success):
+        with self._lock:
+            circuit = self._circuit(template)
+            if circuit['state'] == self.HALF_OPEN:
+                circuit['outcomes'].clear()
+                if success:
+                    circuit['state'] = self.CLOSED
+                else:
+                    circuit['state'], circuit['opened_at'] = self.OPEN, time.time()
+                return
+            circuit['outcomes'].append(success)
+            failures = circuit['outcomes'].count(False)
+            if len(circuit['outcomes']) >= self.min_requests and \
+                    failures >= self.failure_threshold * len(circuit['outcomes']):
+                circuit['state'], circuit['opened_at'] = self.OPEN, time.time()
+
+
+class _EndpointStats(object):
+    # Counters and recent latencies of one endpoint template
+    def __init__(self, samples=200):
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.latencies = deque(maxlen=samples)
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100.0))]
+
+
+class _PriorityClass(object):
+    def __init__(self, name, rank, weight, limit):
+        self.name = name
+        self.rank = rank
+        self.weight = float(weight)
+        self.limit = limit
+        self.queue = deque()
+        self.in_flight = 0
+        self.virtual_time = 0.0
+        self.dispatched = 0
+        self.waited = 0.0
+
+
+class PriorityScheduler(object):
+    '''Admits requests of several priority classes to a shared budget of concurrent requests.
+
+    Every request waits in the queue of its class.  A free slot goes to the class
+    that has had the least service relative to its weight (weighted fair queuing), so
+    a class with weight 8 gets eight requests through for every one of a class with
+    weight 1 while both are busy, and an idle class doesn't build up credit.  A class
+    at its concurrency limit is skipped.  With a rate, the scheduler also hands out
+    the requests per second budget in the same order.  Share one scheduler between
+    several TVMaze instances to share the budget.
+
+    Attributes:
+        max_concurrency (int): Maximum number of requests in flight over all classes
+        classes (dict): Name to (weight, concurrency limit or None), in priority order for ties
+        rate (float): Optional limit on requests per second over all classes
+
+    '''
+
+    def __init__(self, classes=None, max_concurrency=10, rate=None, burst=1):
+        if classes is None:
+            # Batch work never takes more than half the slots, interactive requests get the rest first
+            classes = OrderedDict([('interactive', (8, None)), ('batch', (1, max(1, max_concurrency // 2)))])
+        if rate is not None and rate <= 0:
+            raise ValueError('rate must be greater than 0')
+        self.max_concurrency = max_concurrency
+        self.classes = classes
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._classes = dict((name, _PriorityClass(name, rank, weight, limit))
+                             for rank, (name, (weight, limit)) in enumerate(classes.items()))
+        self._in_flight = 0
+        self._virtual_time = 0.0
+        self._tokens = float(self.burst)
+        self._last = time.time()
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return '<PriorityScheduler(classes={0},max_concurrency={1},rate={2})>'.format(
+                ','.join(self.classes), self.max_concurrency, self.rate)
+
+    def _class(self, priority):
+        try:
+            return self._classes[priority]
+        except KeyError:
+            raise ValueError('Unknown priority {0!r}, expected one of {1}'.format(priority, ', '.join(self.classes)))
+
+    # Seconds until the head of the queue of cls may go, 0 if it may go now and None if another
+    # request goes first
+    def _wait_time(self, cls, ticket):
+        if self._in_flight >= self.max_concurrency:
+            return None
+        eligible = [c for c in self._classes.values() if c.queue and (c.limit is None or c.in_flight < c.limit)]
+        if not eligible:
+            return None
+        chosen = min(eligible, key=lambda c: (c.virtual_time, c.rank))
+        if chosen is not cls or cls.queue[0] is not ticket:
+            return None
+        if self.rate is None:
+            return 0
+        now = time.time()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        return 0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def acquire(self, priority, timeout=None):
+        '''Block until a request of this priority class may be sent; False if timeout seconds passed first.'''
+        cls = self._class(priority)
+        ticket = object()
+        queued_at = time.time()
+        with self._condition:
+            if not cls.queue and not cls.in_flight:
+                # Returning from idle: start at the current virtual time instead of using saved up credit
+                cls.virtual_time = max(cls.virtual_time, self._virtual_time)
+            cls.queue.append(ticket)
+            while True:
+                wait = self._wait_time(cls, ticket)
+                if wait == 0:
+                    break
+                if timeout is not None:
+                    left = queued_at + timeout - time.time()
+                    if left <= 0:
+                        cls.queue.remove(ticket)
+                        self._condition.notify_all()
+                        return False
+                    wait = left if wait is None else min(wait, left)
+                self._condition.wait(wait)
+            cls.queue.popleft()
+            cls.in_flight += 1
+            self._in_flight += 1
+            if self.rate is not None:
+                self._tokens -= 1
+            self._virtual_time = cls.virtual_time
+            cls.virtual_time += 1 / cls.weight
+            cls.dispatched += 1
+            cls.waited += time.time() - queued_at
+            self._condition.notify_all()
+            return True
+
+    def release(self, priority):
+        '''Give back the slot taken by acquire.'''
+        cls = self._class(priority)
+        with self._condition:
+            cls.in_flight -= 1
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self):
+        '''Return per class queued, in_flight, dispatched and mean_wait (seconds spent queued).'''
+        with self._condition:
+            return dict((cls.name, {'queued': len(cls.queue), 'in_flight': cls.in_flight,
+                                    'dispatched': cls.dispatched,
+                                    'mean_wait': cls.waited / cls.dispatched if cls.dispatched else None})
+                        for cls in self._classes.values())
+
+
+class _PendingPrefetch(object):
+    def __init__(self, prefetcher, key, future):
+        self.prefetcher = prefetcher
+        self.key = key
+        self.future = future
+
+    def take(self):
+        waited = not self.future.done()
+        result = self.future.result()
+        self.prefetcher._record_hit(self.key, waited, result is not None)
+        return result
+
+
+class Prefetcher(object):
+    '''Fetches the resources callers usually read next in the background.
+
+    When TVMaze(prefetch=...) returns a Show (get_show, show_main_info) or a Person
+    (person_main_info), the resources listed for its kind start loading right away and
+    the lazy properties (episodes, seasons, next_episode, previous_episode, cast,
+    castcredits, crewcredits) take the result instead of sending their own request,
+    waiting for it if it is still running.  Prefetches go through the client, so the
+    rate limiter applies, and run as 'batch' when the client's scheduler has that class.
+    Beyond the budget nothing is prefetched.  A resource that is rarely read once it
+    has been prefetched min_samples times is only prefetched for one in probe_every
+    objects afterwards.
+
+    Attributes:
+        resources (dict): Kind ('show', 'person') to the resource names prefetched for it
+        budget (RateLimiter): Limit on prefetch requests, a number is requests per second
+        max_pending (int): Maximum number of prefetches queued or running
+        min_hit_rate (float): Share of prefetches that must be read to keep prefetching a resource
+
+    '''
+
+    def __init__(self, resources=None, budget=5, max_pending=32, max_workers=2, min_hit_rate=0.2,
+                 min_samples=20, probe_every=10):
+        if resources is None:
+            resources = {'show': ('episodes', 'cast', 'next_episode'), 'person': ('castcredits',)}
+        if not isinstance(budget, RateLimiter):
+            budget = RateLimiter(budget, burst=max(1, int(budget * 2)))
+        self.resources = resources
+        self.budget = budget
+        self.max_pending = max_pending
+        self.max_workers = max_workers
+        self.min_hit_rate = min_hit_rate
+        self.min_samples = min_samples
+        self.probe_every = probe_every
+        self._executor = None
+        self._pending = 0
+        self._stats = dict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Prefetcher(resources={0},budget={1},max_pending={2})>'.format(
+                ','.join('{0}.{1}'.format(kind, name) for kind in sorted(self.resources)
+                         for name in self.resources[kind]), self.budget.rate, self.max_pending)
+
+    def _resource_stats(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {'prefetched': 0, 'hits': 0, 'waited': 0, 'failed': 0, 'skipped': 0,
+                                        'suppressed': 0, 'opportunities': 0}
+        return stats
+
+    # Whether a resource still earns its prefetches, probing now and then once it doesn't
+    def _worth_it(self, stats):
+        stats['opportunities'] += 1
+        if stats['prefetched'] < self.min_samples:
+            return True
+        if stats['hits'] >= self.min_hit_rate * stats['prefetched']:
+            return True
+        return stats['opportunities'] % self.probe_every == 0
+
+    def prefetch(self, tvm, model):
+        '''Start prefetching the configured resources of a Show or Person; returns the model.'''
+        kind = 'show' if isinstance(model, Show) else 'person' if isinstance(model, Person) else None
+        names = self.resources.get(kind)
+        # Once per object, get_show returns what show_main_info already prefetched for
+        if not names or model._pending_prefetch is not None:
+            return model
+        fetches = model._prefetchable()
+        pending = dict()
+        for name in names:
+            if name not in fetches:
+                continue
+            key = '{0}.{1}'.format(kind, name)
+            with self._lock:
+                stats = self._resource_stats(key)
+                if not self._worth_it(stats):
+                    stats['suppressed'] += 1
+                    continue
+                if self._pending >= self.max_pending or not self.budget.try_acquire():
+                    stats['skipped'] += 1
+                    continue
+                stats['prefetched'] += 1
+                self._pending += 1
+            pending[name] = _PendingPrefetch(self, key, self._submit(self._run, tvm, key, fetches[name]))
+        model._pending_prefetch = pending
+        return model
+
+    def _submit(self, function, *args):
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor.submit(function, *args)
+
+    def _run(self, tvm, key, fetch):
+        scheduler = tvm.scheduler
+        priority = 'batch' if scheduler is not None and 'batch' in scheduler.classes else None
+        try:
+            with tvm.use(priority=priority):
+                return fetch()
+        except BaseError:
+            with self._lock:
+                self._resource_stats(key)['failed'] += 1
+            return None
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _record_hit(self, key, waited, success):
+        with self._lock:
+            stats = self._resource_stats(key)
+            stats['hits'] += success
+            stats['waited'] += waited and success
+
+    def stats(self):
+        """
+        Return prefetch statistics per resource
+
+        :return: Dict of resource (e.g. show.episodes) to a dict with prefetched, hits (read
+            by a lazy property), waited (hits that were still running), failed, skipped (over
+            budget), suppressed (low hit rate) and hit_rate
+        """
+        with self._lock:
+            result = dict()
+            for key, stats in self._stats.items():
+                stats = dict(stats)
+                stats.pop('opportunities')
+                stats['hit_rate'] = stats['hits'] / float(stats['prefetched']) if stats['prefetched'] else None
+                result[key] = stats
+            return result
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class Deadline(object):
+    '''Time budget shared by every request of a composite call, see deadline().
+
+    Attributes:
+        seconds (float): The budget
+        started (float): time.time() when it started
+        completed (list): Urls answered so far, in order
+
+    '''
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started = time.time()
+        self.expires_at = self.started + seconds
+        self.completed = []
+
+    def __repr__(self):
+        return '<Deadline(seconds={0},remaining={1:.3f},completed={2})>'.format(self.seconds, self.remaining(),
+                                                                              len(self.completed))
+
+    def remaining(self):
+        return self.expires_at - time.time()
+
+    def exceeded(self, url):
+        '''Return the DeadlineExceeded for a request to url that can't be answered in time.'''
+        completed = list(self.completed)
+        return DeadlineExceeded('Deadline of {0}s exceeded after {1} completed request(s), waiting for {2}'.format(
+                self.seconds, len(completed), url), completed=completed, pending=url,
+                elapsed=time.time() - self.started)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Limit the total time of all requests sent in this block by the current thread
+
+    Every request's connect and read timeouts are cut to the time left, and a
+    request that can't start in time raises DeadlineExceeded, which lists the
+    urls already answered.  Worker threads of TVMaze methods (race, resolve_ids,
+    get_schedule_range, ...) share the deadline.  A nested deadline can only
+    shorten the enclosing one.
+
+    >>> with pytvmaze.deadline(2.0):
+    ...     show = tvm.get_show(tvdb_id=81189, embed='episodes')
+    """
+    previous = getattr(_context, 'deadline', None)
+    current = Deadline(seconds)
+    if previous is not None and previous.expires_at <= current.expires_at:
+        current = previous
+    _context.deadline = current
+    try:
+        yield current
+    finally:
+        _context.deadline = previous
+
+# For methods with a deadline argument
+_deadline = deadline
+
+
+class ReconcileResult(object):
+    '''Outcome of TVMaze.reconcile_marked_episodes.
+
+    Attributes:
+        applied (list): (episode_id, mark_type) pairs that were changed on TVMaze
+        skipped (list): (episode_id, mark_type) pairs already in the desired state
+        failed (list): (episode_id, mark_type, error) triples that could not be applied
+
+    A mark_type of None means the episode is unmarked.
+    '''
+
+    def __init__(self):
+        self.applied = []
+        self.skipped = []
+        self.failed = []
+
+    def __repr__(self):
+        return '<ReconcileResult(applied={applied},skipped={skipped},failed={failed})>'.format(
+                applied=len(self.applied),
+                skipped=len(self.skipped),
+                failed=len(self.failed)
+        )
+
+
+class Mutation(object):
+    '''A premium mutation waiting in a WriteBehindQueue.'''
+
+    def __init__(self, action, target_id, value=None, queued_at=None):
+        self.action = action
+        self.target_id = target_id
+        self.value = value
+        self.queued_at = queued_at or time.time()
+
+    def __repr__(self):
+        return '<Mutation(action={action},target_id={id},value={value})>'.format(action=self.action,
+                                                                                 id=self.target_id,
+                                                                                 value=self.value)
+
+    @property
+    def key(self):
+        return WriteBehindQueue.actions[self.action][0], self.target_id
+
+    def to_dict(self):
+        return {'action': self.action, 'target_id': self.target_id, 'value': self.value,
+                'queued_at': self.queued_at}
+
+
+class WriteBehindQueue(object):
+    '''Applies premium mutations of a TVMaze instance from a background thread.
+
+    Mutations are accepted immediately and coalesced per target: following and then
+    unfollowing a show (or the reverse) cancels out, and only the last vote or mark
+    of a show or episode is sent.  Mutations failing with a ConnectionError are
+    retried with exponential backoff, other errors are recorded in ``failed``.
+
+    Attributes:
+        tvm (TVMaze): Instance the mutations are applied with
+        journal_path (str): Optional file holding pending mutations so they survive a crash
+        delay (float): Seconds a mutation waits in the queue to be coalesced with later ones
+        retries (int): Number of retries of a mutation failing with a ConnectionError
+        backoff (float): Seconds before the first retry, doubled on each further retry
+        applied (int): Number of mutations sent to TVMaze
+        failed (list): (Mutation, error) pairs that could not be applied
+
+    '''
+    # action -> (kind of target, action cancelling it out)
+    actions = {
+        'follow_show': ('show', 'unfollow_show'),
+        'unfollow_show': ('show', 'follow_show'),
+        'follow_person': ('person', 'unfollow_person'),
+        'unfollow_person': ('person', 'follow_person'),
+        'follow_network': ('network', 'unfollow_network'),
+        'unfollow_network': ('network', 'follow_network'),
+        'follow_web_channel': ('web_channel', 'unfollow_web_channel'),
+        'unfollow_web_channel': ('web_channel', 'follow_web_channel'),
+        'vote_show': ('show_vote', None),
+        'remove_show_vote': ('show_vote', None),
+        'vote_episode': ('episode_vote', None),
+        'remove_episode_vote': ('episode_vote', None),
+        'mark_episode': ('episode_mark', None),
+        'unmark_episode': ('episode_mark', None),
+    }
+
+    def __init__(self, tvm, journal_path=None, delay=0.5, retries=3, backoff=0.5):
+        self.tvm = tvm
+        self.journal_path = journal_path
+        self.delay = delay
+        self.retries = retries
+        self.backoff = backoff
+        self.applied = 0
+        self.failed = []
+        self._pending = OrderedDict()
+        self._in_flight = None
+        self._flushing = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+        if journal_path and os.path.exists(journal_path):
+            with open(journal_path) as f:
+                for line in f:
+                    if line.strip():
+                        mutation = Mutation(**json.loads(line))
+                        self._pending[mutation.key] = mutation
+            if self._pending:
+                self._start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending) + (self._in_flight is not None)
+
+    def __repr__(self):
+        return '<WriteBehindQueue(pending={pending},applied={applied},failed={failed})>'.format(
+                pending=len(self),
+                applied=self.applied,
+                failed=len(self.failed)
+        )
+
+    @property
+    def pending(self):
+        with self._cond:
+            return list(self._pending.values())
+
+    def submit(self, action, target_id, value=None):
+        if action not in self.actions:
+            raise ValueError('Unknown mutation {0}'.format(action))
+        mutation = Mutation(action, target_id, value)
+        with self._cond:
+            if self._closed:
+                raise GeneralError('Write-behind queue is closed')
+            queued = self._pending.pop(mutation.key, None)
+            if queued is None or queued.action != self.actions[action][1]:
+                self._pending[mutation.key] = mutation
+            self._write_journal()
+            self._cond.notify_all()
+        self._start()
+
+    def flush(self, timeout=None):
+        '''Send all pending mutations right away and wait until they are applied.
+
+        :return: True if the queue was emptied, False if the timeout expired first
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._pending or self._in_flight is not None:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout=None):
+        '''Flush pending mutations and stop the background thread.'''
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return flushed
+
+    def _start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='pytvmaze-write-behind')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        self.tvm._local.direct = True
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                mutation = next(iter(self._pending.values()))
+                wait = mutation.queued_at + self.delay - time.time()
+                if wait > 0 and not self._flushing and not self._closed:
+                    self._cond.wait(wait)
+                    continue
+                del self._pending[mutation.key]
+                self._in_flight = mutation
+            error = self._apply(mutation)
+            with self._cond:
+                self._in_flight = None
+                if error is None:
+                    self.applied += 1
+                else:
+                    self.failed.append((mutation, error))
+                self._write_journal()
+                self._cond.notify_all()
+
+    def _apply(self, mutation):
+        args = [mutation.target_id]
+        if mutation.value is not None:
+            args.append(mutation.value)
+        for attempt in range(self.retries + 1):
+            try:
+                getattr(self.tvm, mutation.action)(*args)
+                return None
+            except ConnectionError as e:
+                error = e
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2 ** attempt)
+            except Exception as e:
+                return e
+        return error
+
+    # Called with self._cond held
+    def _write_journal(self):
+        if not self.journal_path:
+            return
+        mutations = list(self._pending.values())
+        if self._in_flight is not None:
+            mutations.insert(0, self._in_flight)
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for mutation in mutations:
+                f.write(json.dumps(mutation.to_dict()) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        getattr(os, 'replace', os.rename)(tmp_path, self.journal_path)
+
+
+def _uses_client(method):
+    '''Run a TVMaze method with module level endpoint functions routed through the instance.'''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.use():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class TVMaze(object):
     '''This is the main class of the module enabling interaction with both free and Premium
     TVMaze features.
 
+    A single instance can be shared between threads.  All requests go through one
+    requests.Session whose connection pool holds at most pool_size connections; threads
+    beyond that wait for a free connection instead of opening new ones, so pool_size
+    should match the number of worker threads.  Module level functions such as
+    show_index use a shared default instance unless called inside ``with tvm.use():``.
+    Lazy Show properties (episodes, next_episode, previous_episode) are fetched once
+    even when read from several threads at the same time.
+
     Attributes:
         username (str): Username for http://www.tvmaze.com
         api_key (str): TVMaze api key.  Find your key at http://www.tvmaze.com/dashboard
+        id_map (IDMap): Mapping of external ids to maze ids used by get_show.  Every show
+            returned by get_show is added to it.
+        write_behind (WriteBehindQueue): Queue follow, vote and mark mutations are sent
+            through instead of blocking the caller.  Enabled with write_behind=True or
+            by passing a journal_path.
+        pool_size (int): Maximum number of open connections to TVMaze
+        rate_limiter (RateLimiter): Optional limit on requests per second, shared by all threads
+        cache (MemoryCache): Optional cache of free endpoint responses (MemoryCache or FileCache)
+        stale_while_revalidate (float): Seconds after expiry a cached response is still returned
+            immediately while it is refreshed in the background.  Objects built from it have
+            stale set to True.  Requires a cache.
+        stale_if_error (float): Seconds after expiry a cached response is returned when TVMaze
+            can't be reached or answers with a server error
+        hedge_percentile (float): Send a second identical GET when the first hasn't answered
+            after this percentile of the endpoint's recent latencies (at least hedge_min_delay
+            seconds) and use whichever answers first.  Disabled if None.
+        circuit_breaker (CircuitBreaker): Fails requests to a failing endpoint fast; True
+            for the default settings
+        backend (HTTPBackend): HTTP client all requests go through, created (and its library
+            imported) on first use.  Pass an HTTPBackend or 'requests' (the default),
+            'urllib3' or 'httpx' as backend=.
+        session (requests.Session): Session of the default RequestsBackend, None for other backends
+        scheduler (PriorityScheduler): Orders requests by priority class under a shared limit
+            of concurrent requests; True for one with pool_size slots.  Disabled if None.
+        priority (str): Priority class of this instance's requests, unless a thread overrides
+            it with use(priority=...).  Worker threads of TVMaze methods keep the caller's.
+        timeout (tuple): (connect, read) timeout in seconds of every request; a single number
+            is used for both and None waits forever.  Within a deadline() the time left is
+            used when it is shorter.
+        prefetcher (Prefetcher): Loads the resources usually read after a Show or Person is
+            returned in the background; True for the default policy.  Disabled if None.
 
     '''
 
-    def __init__(self, username=None, api_key=None):
+    def __init__(self, username=None, api_key=None, id_map=None, write_behind=False, journal_path=None,
+                 pool_size=10, rate_limit=None, cache=None, stale_while_revalidate=None, stale_if_error=None,
+                 hedge_percentile=None, hedge_min_delay=0.05, circuit_breaker=None, backend=None, scheduler=None,
+                 priority='interactive', timeout=(5, 30), prefetch=None):
         self.username = username
         self.api_key = api_key
+        self.id_map = id_map if id_map is not None else IDMap()
+        self._local = threading.local()
+        self.pool_size = pool_size
+        if backend is not None and not isinstance(backend, HTTPBackend) and backend not in _backends.backends:
+            raise ValueError('backend must be an HTTPBackend or one of {0}'.format(', '.join(sorted(_backends.backends))))
+        self._backend = backend
+        self._backend_lock = threading.Lock()
+        if rate_limit is not None and not isinstance(rate_limit, RateLimiter):
+            rate_limit = RateLimiter(rate_limit)
+        self.rate_limiter = rate_limit
+        self.cache = cache
+        # Schedule days fetched by get_schedule_range when no cache was given
+        self._schedule_cache = MemoryCache(max_entries=_schedule_cache_entries)
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self._revalidating = set()
+        self._revalidating_lock = threading.Lock()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self._hedge_executor = None
+        if circuit_breaker is True:
+            circuit_breaker = CircuitBreaker()
+        self.circuit_breaker = circuit_breaker or None
+        if scheduler is True:
+            scheduler = PriorityScheduler(max_concurrency=pool_size)
+        self.scheduler = scheduler or None
+        if self.scheduler is not None:
+            self.scheduler._class(priority)
+        self.priority = priority
+        self.timeout = timeout
+        if prefetch is True:
+            prefetch = Prefetcher()
+        self.prefetcher = prefetch or None
+        self._stats = dict()
+        self._stats_lock = threading.Lock()
+        self.write_behind = None
+        if write_behind or journal_path:
+            self.write_behind = WriteBehindQueue(self, journal_path=journal_path)
+
+    @property
+    def backend(self):
+        if not isinstance(self._backend, HTTPBackend):
+            with self._backend_lock:
+                if not isinstance(self._backend, HTTPBackend):
+                    self._backend = _backends.backends[self._backend or 'requests'](self.pool_size)
+        return self._backend
+
+    @property
+    def session(self):
+        return getattr(self.backend, 'session', None)
+
+    def flush(self, timeout=None):
+        '''Wait until all queued premium mutations have been sent to TVMaze.'''
+        if self.write_behind is not None:
+            return self.write_behind.flush(timeout)
+        return True
+
+    def close(self, timeout=None):
+        '''Flush queued premium mutations, stop the write-behind thread and close all connections.'''
+        flushed = True
+        if self.write_behind is not None:
+            flushed = self.write_behind.close(timeout)
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        if isinstance(self._backend, HTTPBackend):
+            self._backend.close()
+        return flushed
+
+    # Queue a premium mutation when write-behind is enabled.  Threads that set
+    # self._local.direct (the queue's own thread, reconcile workers) go straight to TVMaze.
+    def _defer(self, action, target_id, value=None):
+        if self.write_behind is None or getattr(self._local, 'direct', False):
+            return False
+        self.write_behind.submit(action, target_id, value)
+        return True
+
+    # Route module level endpoint functions called in this thread through this instance
+    @contextmanager
+    def use(self, priority=None):
+        """
+        Send requests made by module level functions (show_index, episode_list, ...)
+        in the current thread through this instance's connection pool
+
+        :param priority: Priority class of the requests this thread sends meanwhile,
+            through any instance, see PriorityScheduler
+
+        >>> with tvm.use():
+        ...     shows = show_index(0)
+        >>> with tvm.use(priority='batch'):
+        ...     index = show_index(0)
+        """
+        previous = getattr(_context, 'client', None)
+        previous_priority = getattr(_context, 'priority', None)
+        _context.client = self
+        if priority is not None:
+            _context.priority = priority
+        try:
+            yield self
+        finally:
+            _context.client = previous
+            _context.priority = previous_priority
+
+    # Returns a context manager continuing the calling thread's work in a worker thread:
+    # requests go through this instance with the caller's priority and deadline
+    def _carry(self):
+        priority = getattr(_context, 'priority', None)
+        current = getattr(_context, 'deadline', None)
+
+        @contextmanager
+        def carried():
+            previous = getattr(_context, 'deadline', None)
+            _context.deadline = current
+            try:
+                with self.use(priority=priority):
+                    yield
+            finally:
+                _context.deadline = previous
+        return carried
+
+    def _timeout(self, current):
+        if current is None:
+            return self.timeout
+        remaining = max(current.remaining(), 0.001)
+        if self.timeout is None:
+            return remaining, remaining
+        connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+        return min(connect, remaining), min(read, remaining)
+
+    def _request(self, method, url, **kwargs):
+        template = _endpoint_template(url)
+        stats = self._endpoint_stats(template)
+        current = getattr(_context, 'deadline', None)
+        if current is not None and current.remaining() <= 0:
+            raise current.exceeded(url)
+        priority = getattr(_context, 'priority', None) or self.priority
+        if self.scheduler is not None:
+            if not self.scheduler.acquire(priority, None if current is None else current.remaining()):
+                raise current.exceeded(url)
+        try:
+            # Asked last: once before() lets a half-open trial through, the request is sent
+            # and its outcome recorded
+            if self.circuit_breaker is not None:
+                try:
+                    self.circuit_breaker.before(template)
+                except CircuitOpen:
+                    with self._stats_lock:
+                        stats.rejected += 1
+                    raise
+            kwargs['timeout'] = self._timeout(current)
+            r = self._timed_request(template, stats, method, url, **kwargs)
+        except RequestTimeout:
+            if current is not None and current.remaining() <= 0:
+                raise current.exceeded(url)
+            raise
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.release(priority)
+        if current is not None:
+            current.completed.append(url)
+        return r
+
+    def _timed_request(self, template, stats, method, url, **kwargs):
+        started = time.time()
+        hedged = won = False
+        try:
+            if method == 'GET' and self.hedge_percentile is not None:
+                r, hedged, won = self._hedged_send(stats, method, url, **kwargs)
+            else:
+                r = self._send(method, url, **kwargs)
+        except Exception as e:
+            current = getattr(_context, 'deadline', None)
+            if isinstance(e, RequestTimeout) and current is not None and current.remaining() <= 0:
+                # Cut short by the caller's deadline, which says nothing about the endpoint
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.cancel(template)
+            else:
+                # Not only ConnectionError, a half-open circuit must learn the outcome of its trial
+                self._record(template, stats, False, None, hedged, won)
+            raise
+        self._record(template, stats, r.status_code < 500, time.time() - started, hedged, won)
+        return r
+
+    def _send(self, method, url, **kwargs):
+        backend = self.backend
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return backend.request(method, url, **kwargs)
+
+    # Send a GET and, if it hasn't answered after the hedge delay, a second identical
+    # one; the first successful response wins and the other one is ignored.  With a
+    # scheduler the second GET needs a slot of its own and is skipped when none is free
+    def _hedged_send(self, stats, method, url, **kwargs):
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+        with self._stats_lock:
+            delay = stats.percentile(self.hedge_percentile) if len(stats.latencies) >= 20 else None
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=self.pool_size * 2)
+        if delay is None:
+            return self._send(method, url, **kwargs), False, False
+        first = self._hedge_executor.submit(self._send, method, url, **kwargs)
+        done, _ = wait([first], timeout=max(delay, self.hedge_min_delay))
+        if done:
+            return first.result(), False, False
+        priority = getattr(_context, 'priority', None) or self.priority
+        if self.scheduler is not None and not self.scheduler.acquire(priority, timeout=0):
+            return first.result(), False, False
+        second = self._hedge_executor.submit(self._send, method, url, **kwargs)
+        if self.scheduler is not None:
+            second.add_done_callback(lambda future: self.scheduler.release(priority))
+        pending = [first, second]
+        while True:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None or not pending:
+                    return future.result(), True, future is second
+
+    def _endpoint_stats(self, template):
+        with self._stats_lock:
+            stats = self._stats.get(template)
+            if stats is None:
+                stats = self._stats[template] = _EndpointStats()
+            return stats
+
+    def _record(self, template, stats, success, latency, hedged, won):
+        with self._stats_lock:
+            stats.requests += 1
+            stats.failures += not success
+            stats.hedged += hedged
+            stats.hedge_wins += won
+            if success and latency is not None:
+                stats.latencies.append(latency)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(template, success)
+
+    def stats(self):
+        """
+        Return request statistics per endpoint template
+
+        :return: Dict of template (e.g. /shows/{}/episodes?specials={}) to a dict with
+            requests, failures, rejected (by the circuit breaker), hedged, hedge_wins,
+            p50 and p99 latency in seconds and the circuit state
+        """
+        with self._stats_lock:
+            stats = dict((template, {'requests': endpoint.requests, 'failures': endpoint.failures,
+                                     'rejected': endpoint.rejected, 'hedged': endpoint.hedged,
+                                     'hedge_wins': endpoint.hedge_wins, 'p50': endpoint.percentile(50),
+                                     'p99': endpoint.percentile(99)})
+                         for template, endpoint in self._stats.items())
+        for template, endpoint in stats.items():
+            endpoint['circuit'] = self.circuit_breaker.state(template) if self.circuit_breaker else None
+        return stats
 
     # Query TVMaze free endpoints
     @staticmethod
-    def _endpoint_standard_get(url):
-        s = requests.Session()
-        retries = Retry(total=5,
-                        backoff_factor=0.1,
-                        status_forcelist=[429])
-        s.mount('http://', HTTPAdapter(max_retries=retries))
+    def _endpoint_standard_get(url, cache=None, ttl=None):
+        client = _current_client()
+        cache = client.cache if cache is None else cache
+        entry = cache.lookup(url) if cache is not None else None
+        if entry is not None:
+            results, expires_at = entry
+            if expires_at is None or expires_at > time.time():
+                return results
+            if client.stale_while_revalidate is not None and \
+                    time.time() - expires_at <= client.stale_while_revalidate:
+                client._revalidate(url, cache, ttl)
+                return _mark_stale(results, expires_at)
+
         try:
-            r = s.get(url)
-        except requests.exceptions.ConnectionError as e:
-            raise ConnectionError(repr(e))
+            return client._fetch_standard(url, cache, ttl)
+        except ConnectionError:
+            if entry is not None and client.stale_if_error is not None and \
+                    time.time() - entry[1] <= client.stale_if_error:
+                return _mark_stale(entry[0], entry[1])
+            raise
 
-        s.close()
+    def _fetch_standard(self, url, cache, ttl):
+        r = self._request('GET', url)
+
+        if r.status_code == 429:
+            raise RateLimited('Too Many Requests for url {}'.format(url))
 
         if r.status_code in [404, 422]:
             return None
@@ -547,22 +2095,41 @@ class TVMaze(object):
         if r.status_code == 400:
             raise BadRequest('Bad Request for url {}'.format(url))
 
+        if r.status_code >= 500:
+            raise ConnectionError('TVMaze returned status {0} for url {1}'.format(r.status_code, url))
+
         results = r.json()
+        if cache is not None:
+            cache.set(url, results, ttl)
         return results
 
+    # Refresh an expired entry in the background while callers are served the stale copy
+    def _revalidate(self, url, cache, ttl):
+        with self._revalidating_lock:
+            if url in self._revalidating:
+                return
+            self._revalidating.add(url)
+
+        def refresh():
+            try:
+                with self.use():
+                    self._fetch_standard(url, cache, ttl)
+            except BaseError:
+                pass
+            finally:
+                with self._revalidating_lock:
+                    self._revalidating.discard(url)
+
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+
     # Query TVMaze Premium endpoints
     def _endpoint_premium_get(self, url):
-        s = requests.Session()
-        retries = Retry(total=5,
-                        backoff_factor=0.1,
-                        status_forcelist=[429])
-        s.mount('http://', HTTPAdapter(max_retries=retries))
-        try:
-            r = s.get(url, auth=(self.username, self.api_key))
-        except requests.exceptions.ConnectionError as e:
-            raise ConnectionError(repr(e))
+        r = self._request('GET', url, auth=(self.username, self.api_key))
 
-        s.close()
+        if r.status_code == 429:
+            raise RateLimited('Too Many Requests for url {}'.format(url))
 
         if r.status_code in [404, 422]:
             return None
@@ -574,17 +2141,10 @@ class TVMaze(object):
         return results
 
     def _endpoint_premium_delete(self, url):
-        s = requests.Session()
-        retries = Retry(total=5,
-                        backoff_factor=0.1,
-                        status_forcelist=[429])
-        s.mount('http://', HTTPAdapter(max_retries=retries))
-        try:
-            r = s.delete(url, auth=(self.username, self.api_key))
-        except requests.exceptions.ConnectionError as e:
-            raise ConnectionError(repr(e))
+        r = self._request('DELETE', url, auth=(self.username, self.api_key))
 
-        s.close()
+        if r.status_code == 429:
+            raise RateLimited('Too Many Requests for url {}'.format(url))
 
         if r.status_code == 400:
             raise BadRequest('Bad Request for url {}'.format(url))
@@ -596,17 +2156,10 @@ class TVMaze(object):
             return None
 
     def _endpoint_premium_put(self, url, payload=None):
-        s = requests.Session()
-        retries = Retry(total=5,
-                        backoff_factor=0.1,
-                        status_forcelist=[429])
-        s.mount('http://', HTTPAdapter(max_retries=retries))
-        try:
-            r = s.put(url, data=payload, auth=(self.username, self.api_key))
-        except requests.exceptions.ConnectionError as e:
-            raise ConnectionError(repr(e))
+        r = self._request('PUT', url, data=payload, auth=(self.username, self.api_key))
 
-        s.close()
+        if r.status_code == 429:
+            raise RateLimited('Too Many Requests for url {}'.format(url))
 
         if r.status_code == 400:
             raise BadRequest('Bad Request for url {}'.format(url))
@@ -618,9 +2171,10 @@ class TVMaze(object):
             return None
 
     # Get Show object
+    @_uses_client
     def get_show(self, maze_id=None, tvdb_id=None, tvrage_id=None, imdb_id=None, show_name=None,
                  show_year=None, show_network=None, show_language=None, show_country=None,
-                 show_web_channel=None, embed=None):
+                 show_web_channel=None, embed=None, race=False, deadline=None):
         """
         Get Show object directly via id or indirectly via name + optional qualifiers
 
@@ -628,10 +2182,13 @@ class TVMaze(object):
         tvmaze algorithm will be returned.
         If you provide extra qualifiers such as network or language they will be
         used for a more specific match, if one exists.
+        Lookups are tried in the order maze_id, tvdb_id, tvrage_id, imdb_id,
+        show_name and the first one that finds the show wins.
         Args:
             maze_id: Show maze_id
             tvdb_id: Show tvdb_id
             tvrage_id: Show tvrage_id
+            imdb_id: Show imdb_id
             show_name: Show name to be searched
             show_year: Show premiere year
             show_network: Show TV Network (like ABC, NBC, etc.)
@@ -639,39 +2196,234 @@ class TVMaze(object):
             show_language: Show language
             show_country: Show country
             embed: embed parameter to include additional data. Currently 'episodes' and 'cast' are supported
+            race: Start all given lookups at once instead of one after the other; the result
+                is the same, but a miss no longer delays the next lookup
+            deadline: Seconds all requests of the call (lookups, search, embeds) may take
+                together; DeadlineExceeded when they don't finish in time
         """
-        errors = []
+        if deadline is not None:
+            with _deadline(deadline):
+                return self.get_show(maze_id, tvdb_id, tvrage_id, imdb_id, show_name, show_year, show_network,
+                                     show_language, show_country, show_web_channel, embed, race)
         if not (maze_id or tvdb_id or tvrage_id or imdb_id or show_name):
             raise MissingParameters(
                     'Either maze_id, tvdb_id, tvrage_id, imdb_id or show_name are required to get show, none provided,')
+        # (lookup, exception meaning "not found") in priority order
+        lookups = []
+        if maze_id:
+            lookups.append((functools.partial(self._get_show_by_maze_id, maze_id, embed), IDNotFound))
+        for source, external_id in (('tvdb', tvdb_id), ('tvrage', tvrage_id), ('imdb', imdb_id)):
+            if external_id:
+                lookups.append((functools.partial(self._get_show_by_external_id, source, external_id, embed),
+                                IDNotFound))
+        if show_name:
+            lookups.append((functools.partial(self._get_show_by_name, show_name, show_year, show_network,
+                                              show_language, show_country, show_web_channel, embed), ShowNotFound))
+
+        errors = []
+        if race and len(lookups) > 1:
+            show = self._race_lookups(lookups, errors)
+            if show is not None:
+                return self._prefetch(show)
+        else:
+            for lookup, not_found in lookups:
+                try:
+                    show = lookup()
+                except not_found as e:
+                    errors.append(e.value)
+                else:
+                    return self._prefetch(show)
+        raise ShowNotFound(' ,'.join(errors))
+
+    def _race_lookups(self, lookups, errors):
+        # Waits for lookups in priority order, so a later lookup answering first can't win
+        from concurrent.futures import ThreadPoolExecutor
+
+        carried = self._carry()
+
+        def run(lookup):
+            with carried():
+                return lookup()
+
+        executor = ThreadPoolExecutor(max_workers=len(lookups))
+        futures = [(executor.submit(run, lookup), not_found) for lookup, not_found in lookups]
+        try:
+            for future, not_found in futures:
+                try:
+                    return future.result()
+                except not_found as e:
+                    errors.append(e.value)
+        finally:
+            # Requests already sent can't be stopped, their results are dropped
+            for future, _ in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _get_show_by_maze_id(self, maze_id, embed=None):
+        return self._remember(show_main_info(maze_id, embed=embed))
+
+    def _get_show_by_name(self, show_name, show_year, show_network, show_language, show_country,
+                          show_web_channel, embed=None):
+        show = self._get_show_by_search(show_name, show_year, show_network, show_language,
+                                        show_country, show_web_channel, embed=embed)
+        return self._remember(show)
+
+    def _prefetch(self, model):
+        if self.prefetcher is None:
+            return model
+        return self.prefetcher.prefetch(self, model)
+
+    def _remember(self, show):
+        self.id_map.add_show(show)
+        return show
+
+    # Known ids cost a single show_main_info request, unknown ids a single lookup request
+    # (plus show_main_info when embedding, since lookups don't accept embed)
+    def _get_show_by_external_id(self, source, external_id, embed=None):
+        lookups = {'tvdb': lookup_tvdb, 'tvrage': lookup_tvrage, 'imdb': lookup_imdb}
+        maze_id = self.id_map.get(source, external_id)
         if maze_id:
             try:
-                return show_main_info(maze_id, embed=embed)
-            except IDNotFound as e:
-                errors.append(e.value)
-        if tvdb_id:
-            try:
-                return show_main_info(lookup_tvdb(tvdb_id).id, embed=embed)
-            except IDNotFound as e:
-                errors.append(e.value)
-        if tvrage_id:
-            try:
-                return show_main_info(lookup_tvrage(tvrage_id).id, embed=embed)
-            except IDNotFound as e:
-                errors.append(e.value)
-        if imdb_id:
+                return self._remember(show_main_info(maze_id, embed=embed))
+            except IDNotFound:
+                pass
+        show = lookups[source](external_id)
+        if embed:
+            show = show_main_info(show.id, embed=embed)
+        return self._remember(show)
+
+    def resolve_ids(self, external_ids, source='tvdb', max_workers=8):
+        """
+        Resolve many external ids to maze ids at once
+
+        Ids already in id_map are answered locally, the rest are looked up
+        concurrently and added to id_map.
+        Args:
+            external_ids: Iterable of external ids
+            source: Kind of the ids, one of 'tvdb', 'tvrage' or 'imdb'
+            max_workers: Maximum number of concurrent lookups
+        :return: Dict of external id to maze id, or None when the id is unknown to TVMaze
+        """
+        lookups = {'tvdb': lookup_tvdb, 'tvrage': lookup_tvrage, 'imdb': lookup_imdb}
+        if source not in lookups:
+            raise ValueError('source must be one of {0}'.format(', '.join(IDMap.sources)))
+        resolved = dict()
+        missing = []
+        for external_id in external_ids:
+            maze_id = self.id_map.get(source, external_id)
+            if maze_id:
+                resolved[external_id] = maze_id
+            elif external_id not in resolved:
+                resolved[external_id] = None
+                missing.append(external_id)
+
+        carried = self._carry()
+
+        def lookup(external_id):
             try:
-                return show_main_info(lookup_imdb(imdb_id).id, embed=embed)
-            except IDNotFound as e:
-                errors.append(e.value)
-        if show_name:
+                with carried():
+                    return self._remember(lookups[source](external_id)).maze_id
+            except IDNotFound:
+                return None
+
+        if missing:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for external_id, maze_id in zip(missing, executor.map(lookup, missing)):
+                    resolved[external_id] = maze_id
+        return resolved
+
+    def resolve_next_previous(self, shows, max_workers=8):
+        """
+        Load next_episode and previous_episode for many shows at once
+
+        Maze ids are fetched with both episodes embedded.  For Show objects the linked
+        episode ids are collected, each distinct episode is requested once and all
+        requests run concurrently.  The results are stored on the shows, so reading
+        next_episode or previous_episode afterwards costs nothing.
+        Args:
+            shows: Iterable of Show objects or maze ids
+            max_workers: Maximum number of concurrent requests
+        :return: List of Show objects in input order, None for maze ids unknown to TVMaze
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        carried = self._carry()
+
+        def fetch_show(maze_id):
+            url = endpoints.show_main_info.format(maze_id) + '?embed[]=nextepisode&embed[]=previousepisode'
+            with carried():
+                q = TVMaze._endpoint_standard_get(url)
+            return Show(q) if q else None
+
+        def fetch_episode(episode_id):
             try:
-                show = self._get_show_by_search(show_name, show_year, show_network, show_language,
-                                                show_country, show_web_channel, embed=embed)
-                return show
-            except ShowNotFound as e:
-                errors.append(e.value)
-        raise ShowNotFound(' ,'.join(errors))
+                with carried():
+                    return episode_by_id(episode_id)
+            except EpisodeNotFound:
+                return None
+
+        shows = list(shows)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            maze_ids = list(set(show for show in shows if not isinstance(show, Show)))
+            fetched = dict(zip(maze_ids, executor.map(fetch_show, maze_ids)))
+            shows = [show if isinstance(show, Show) else fetched[show] for show in shows]
+
+            pending = [(show, show._pending_linked_episodes()) for show in shows if show]
+            episode_ids = list(set(episode_id for show, links in pending for episode_id in links.values()))
+            episodes = dict(zip(episode_ids, executor.map(fetch_episode, episode_ids)))
+        for show, links in pending:
+            for link, episode_id in links.items():
+                if episodes[episode_id]:
+                    show._set_linked_episode(link, episodes[episode_id])
+        return shows
+
+    def get_schedule_range(self, countries=('US',), start_date=None, days=1, max_workers=8, fields=None,
+                           deadline=None):
+        """
+        Fetch the schedules of several countries and days concurrently
+
+        Each country-day is cached on its own: days that are over never expire, today
+        and future days are fetched again after a few minutes.  The cache given to
+        TVMaze() is used if there is one.
+        Args:
+            countries: Iterable of ISO country codes
+            start_date: First day as a date or 'YYYY-MM-DD', today if None
+            days: Number of consecutive days
+            max_workers: Maximum number of concurrent requests
+            fields: Field paths to return Records of instead of Episodes, see Projection
+            deadline: Seconds all schedule requests may take together
+        :return: Iterator of Episode objects ordered by airstamp
+        """
+        if deadline is not None:
+            with _deadline(deadline):
+                return self.get_schedule_range(countries, start_date, days, max_workers, fields)
+        from concurrent.futures import ThreadPoolExecutor
+
+        if start_date is None:
+            start_date = datetime.today().date()
+        elif isinstance(start_date, datetime):
+            start_date = start_date.date()
+        elif not hasattr(start_date, 'year'):
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        cache = self.cache if self.cache is not None else self._schedule_cache
+        # Local calendar days lag UTC by up to a day, so only days before yesterday are final
+        today = datetime.today().date()
+        carried = self._carry()
+
+        def fetch(pair):
+            country, day = pair
+            if day < today - timedelta(days=1):
+                ttl = _schedule_past_ttl
+            else:
+                ttl = _schedule_today_ttl if day <= today else _schedule_future_ttl
+            with carried():
+                return TVMaze._endpoint_standard_get(endpoints.get_schedule.format(country, day), cache, ttl) or []
+
+        pairs = [(country, start_date + timedelta(days=offset)) for country in countries for offset in range(days)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            schedules = list(executor.map(fetch, pairs))
+        return _merge_by_airstamp(schedules, _model_or_projection(Episode, fields))
 
     def _get_show_with_qualifiers(self, show_name, qualifiers):
         shows = get_show_list(show_name)
@@ -749,12 +2501,16 @@ class TVMaze(object):
             raise ShowNotFollowed('Show with ID {} is not followed'.format(maze_id))
 
     def follow_show(self, maze_id):
+        if self._defer('follow_show', maze_id):
+            return
         url = endpoints.followed_shows.format('/' + str(maze_id))
         q = self._endpoint_premium_put(url)
         if not q:
             raise ShowNotFound('Show with ID {} does not exist'.format(maze_id))
 
     def unfollow_show(self, maze_id):
+        if self._defer('unfollow_show', maze_id):
+            return
         url = endpoints.followed_shows.format('/' + str(maze_id))
         q = self._endpoint_premium_delete(url)
         if not q:
@@ -781,12 +2537,16 @@ class TVMaze(object):
             raise PersonNotFound('Person with ID {} is not followed'.format(person_id))
 
     def follow_person(self, person_id):
+        if self._defer('follow_person', person_id):
+            return
         url = endpoints.followed_people.format('/' + str(person_id))
         q = self._endpoint_premium_put(url)
         if not q:
             raise PersonNotFound('Person with ID {} does not exist'.format(person_id))
 
     def unfollow_person(self, person_id):
+        if self._defer('unfollow_person', person_id):
+            return
         url = endpoints.followed_people.format('/' + str(person_id))
         q = self._endpoint_premium_delete(url)
         if not q:
@@ -813,12 +2573,16 @@ class TVMaze(object):
             raise NetworkNotFound('Network with ID {} is not followed'.format(network_id))
 
     def follow_network(self, network_id):
+        if self._defer('follow_network', network_id):
+            return
         url = endpoints.followed_networks.format('/' + str(network_id))
         q = self._endpoint_premium_put(url)
         if not q:
             raise NetworkNotFound('Network with ID {} does not exist'.format(network_id))
 
     def unfollow_network(self, network_id):
+        if self._defer('unfollow_network', network_id):
+            return
         url = endpoints.followed_networks.format('/' + str(network_id))
         q = self._endpoint_premium_delete(url)
         if not q:
@@ -845,12 +2609,16 @@ class TVMaze(object):
             raise NetworkNotFound('Web Channel with ID {} is not followed'.format(webchannel_id))
 
     def follow_web_channel(self, webchannel_id):
+        if self._defer('follow_web_channel', webchannel_id):
+            return
         url = endpoints.followed_web_channels.format('/' + str(webchannel_id))
         q = self._endpoint_premium_put(url)
         if not q:
             raise WebChannelNotFound('Web Channel with ID {} does not exist'.format(webchannel_id))
 
     def unfollow_web_channel(self, webchannel_id):
+        if self._defer('unfollow_web_channel', webchannel_id):
+            return
         url = endpoints.followed_web_channels.format('/' + str(webchannel_id))
         q = self._endpoint_premium_delete(url)
         if not q:
@@ -881,8 +2649,10 @@ class TVMaze(object):
         types = {'watched': 0, 'acquired': 1, 'skipped': 2}
         try:
             status = types[mark_type]
-        except IndexError:
+        except KeyError:
             raise InvalidMarkedEpisodeType('Episode must be marked as "watched", "acquired", or "skipped"')
+        if self._defer('mark_episode', episode_id, mark_type):
+            return
         payload = {'type': str(status)}
         path = '/{}'.format(episode_id)
         url = endpoints.marked_episodes.format(path)
@@ -891,12 +2661,72 @@ class TVMaze(object):
             raise EpisodeNotFound('Episode with ID {} does not exist'.format(episode_id))
 
     def unmark_episode(self, episode_id):
+        if self._defer('unmark_episode', episode_id):
+            return
         path = '/{}'.format(episode_id)
         url = endpoints.marked_episodes.format(path)
         q = self._endpoint_premium_delete(url)
         if not q:
             raise EpisodeNotMarked('Episode with ID {} was not marked'.format(episode_id))
 
+    def reconcile_marked_episodes(self, desired, maze_id=None, max_workers=4, rate_limit=None):
+        """
+        Bring marked episodes in line with a desired state using as few requests as possible
+
+        The current state is fetched once with get_marked_episodes, only the episodes
+        whose mark differs are changed.
+        Args:
+            desired: Dict of episode id to "watched", "acquired", "skipped" or None to unmark
+            maze_id: Restrict the current state lookup to a single show
+            max_workers: Maximum number of concurrent mark/unmark requests
+            rate_limit: Maximum number of mark/unmark requests per second, or a RateLimiter
+        :return: ReconcileResult
+        """
+        types = ('watched', 'acquired', 'skipped', None)
+        desired = dict((int(episode_id), mark_type) for episode_id, mark_type in desired.items())
+        for mark_type in desired.values():
+            if mark_type not in types:
+                raise InvalidMarkedEpisodeType('Episode must be marked as "watched", "acquired", "skipped" or None')
+        try:
+            current = dict((episode.episode_id, episode.type) for episode in self.get_marked_episodes(maze_id))
+        except NoMarkedEpisodes:
+            current = dict()
+
+        result = ReconcileResult()
+        changes = []
+        for episode_id, mark_type in sorted(desired.items()):
+            if current.get(episode_id) == mark_type:
+                result.skipped.append((episode_id, mark_type))
+            else:
+                changes.append((episode_id, mark_type))
+
+        if rate_limit is not None and not isinstance(rate_limit, RateLimiter):
+            rate_limit = RateLimiter(rate_limit)
+
+        def apply(change):
+            episode_id, mark_type = change
+            self._local.direct = True
+            if rate_limit:
+                rate_limit.acquire()
+            try:
+                if mark_type is None:
+                    self.unmark_episode(episode_id)
+                else:
+                    self.mark_episode(episode_id, mark_type)
+            except BaseError as e:
+                return e
+            return None
+
+        if changes:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for change, error in zip(changes, executor.map(apply, changes)):
+                    if error is None:
+                        result.applied.append(change)
+                    else:
+                        result.failed.append(change + (error,))
+        return result
+
     def get_voted_shows(self, embed=None):
         if not embed in [None, 'show']:
             raise InvalidEmbedValue('Value for embed must be "show" or None')
@@ -918,6 +2748,8 @@ class TVMaze(object):
             raise ShowNotVotedFor('Show with ID {} not voted for'.format(maze_id))
 
     def remove_show_vote(self, maze_id):
+        if self._defer('remove_show_vote', maze_id):
+            return
         url = endpoints.voted_shows.format('/' + str(maze_id))
         q = self._endpoint_premium_delete(url)
         if not q:
@@ -926,6 +2758,8 @@ class TVMaze(object):
     def vote_show(self, maze_id, vote):
         if not 1 <= vote <= 10:
             raise InvalidVoteValue('Vote must be an integer between 1 and 10')
+        if self._defer('vote_show', maze_id, int(vote)):
+            return
         payload = {'vote': int(vote)}
         url = endpoints.voted_shows.format('/' + str(maze_id))
         q = self._endpoint_premium_put(url, payload=payload)
@@ -950,6 +2784,8 @@ class TVMaze(object):
             raise EpisodeNotVotedFor('Episode with ID {} not voted for'.format(episode_id))
 
     def remove_episode_vote(self, episode_id):
+        if self._defer('remove_episode_vote', episode_id):
+            return
         path = '/{}'.format(episode_id)
         url = endpoints.voted_episodes.format(path)
         q = self._endpoint_premium_delete(url)
@@ -959,6 +2795,8 @@ class TVMaze(object):
     def vote_episode(self, episode_id, vote):
         if not 1 <= vote <= 10:
             raise InvalidVoteValue('Vote must be an integer between 1 and 10')
+        if self._defer('vote_episode', episode_id, int(vote)):
+            return
         payload = {'vote': int(vote)}
         path = '/{}'.format(episode_id)
         url = endpoints.voted_episodes.format(path)
@@ -1043,20 +2881,53 @@ def lookup_imdb(imdb_id):
     else:
         raise IDNotFound('IMDB ID {0} not found'.format(imdb_id))
 
-def get_schedule(country='US', date=str(datetime.today().date())):
+def airstamp_seconds(airstamp):
+    '''Convert an airstamp like 2016-01-01T21:00:00-05:00 to seconds since the epoch, None if missing.'''
+    if not airstamp:
+        return None
+    stamp, offset = airstamp[:19], airstamp[19:]
+    seconds = timegm(datetime.strptime(stamp, '%Y-%m-%dT%H:%M:%S').timetuple())
+    if offset and offset.upper() != 'Z':
+        sign = -1 if offset[0] == '-' else 1
+        hours, minutes = offset[1:].split(':') if ':' in offset else (offset[1:3], offset[3:5])
+        seconds -= sign * (int(hours) * 3600 + int(minutes) * 60)
+    return seconds
+
+def _merge_by_airstamp(schedules, build=Episode):
+    # Each schedule is sorted on its own, heapq.merge then interleaves them lazily
+    streams = []
+    for number, schedule in enumerate(schedules):
+        rows = [(airstamp_seconds(episode.get('airstamp')) or 0, number, row, episode)
+                for row, episode in enumerate(schedule)]
+        rows.sort()
+        streams.append(rows)
+    for _, _, _, episode in heapq.merge(*streams):
+        yield build(episode)
+
+def get_schedule(country='US', date=None, fields=None):
+    if date is None:
+        date = str(datetime.today().date())
     url = endpoints.get_schedule.format(country, date)
     q = TVMaze._endpoint_standard_get(url)
     if q:
-        return [Episode(episode) for episode in q]
+        build = _model_or_projection(Episode, fields)
+        return [build(episode) for episode in q]
     else:
         raise ScheduleNotFound('Schedule for country {0} at date {1} not found'.format(country, date))
 
 # ALL known future episodes, several MB large, cached for 24 hours
-def get_full_schedule():
+def get_full_schedule(fields=None):
+    """
+    Return all known future episodes
+
+    Pass fields (e.g. ['id', 'airstamp', '_embedded.show.id']) to get Records
+    of only those fields instead, see Projection.
+    """
     url = endpoints.get_full_schedule
     q = TVMaze._endpoint_standard_get(url)
     if q:
-        return [Episode(episode) for episode in q]
+        build = _model_or_projection(Episode, fields)
+        return [build(episode) for episode in q]
     else:
         raise GeneralError('Something went wrong, www.tvmaze.com may be down')
 
@@ -1069,18 +2940,19 @@ def show_main_info(maze_id, embed=None):
         url = endpoints.show_main_info.format(maze_id)
     q = TVMaze._endpoint_standard_get(url)
     if q:
-        return Show(q)
+        return _current_client()._prefetch(Show(q))
     else:
         raise IDNotFound('Maze id {0} not found'.format(maze_id))
 
-def episode_list(maze_id, specials=None):
+def episode_list(maze_id, specials=None, fields=None):
     if specials:
         url = endpoints.episode_list.format(maze_id) + '&specials=1'
     else:
         url = endpoints.episode_list.format(maze_id)
     q = TVMaze._endpoint_standard_get(url)
-    if type(q) == list:
-        return [Episode(episode) for episode in q]
+    if isinstance(q, list):
+        build = _model_or_projection(Episode, fields)
+        return [build(episode) for episode in q]
     else:
         raise IDNotFound('Maze id {0} not found'.format(maze_id))
 
@@ -1097,7 +2969,7 @@ def episode_by_number(maze_id, season_number, episode_number):
                                                                                  episode_number,
                                                                                  maze_id))
 
-def episodes_by_date(maze_id, airdate):
+def episodes_by_date(maze_id, airdate, fields=None):
     try:
         datetime.strptime(airdate, '%Y-%m-%d')
     except ValueError:
@@ -1105,7 +2977,8 @@ def episodes_by_date(maze_id, airdate):
     url = endpoints.episodes_by_date.format(maze_id, airdate)
     q = TVMaze._endpoint_standard_get(url)
     if q:
-        return [Episode(episode) for episode in q]
+        build = _model_or_projection(Episode, fields)
+        return [build(episode) for episode in q]
     else:
         raise NoEpisodesForAirdate(
                 'Couldn\'t find an episode airing {0} for TVMaze ID {1}'.format(airdate, maze_id))
@@ -1118,11 +2991,18 @@ def show_cast(maze_id):
     else:
         raise CastNotFound('Couldn\'nt find show cast for TVMaze ID {0}'.format(maze_id))
 
-def show_index(page=1):
+def show_index(page=1, fields=None):
+    """
+    Return a page of 250 shows of the TVMaze show index
+
+    :param fields: Field paths such as ['id', 'name', 'updated', 'externals.thetvdb'] to
+        return Records of only those fields instead of Shows, see Projection
+    """
     url = endpoints.show_index.format(page)
     q = TVMaze._endpoint_standard_get(url)
     if q:
-        return [Show(show) for show in q]
+        build = _model_or_projection(Show, fields)
+        return [build(show) for show in q]
     else:
         raise ShowIndexError('Error getting show index, www.tvmaze.com may be down')
 
@@ -1144,7 +3024,7 @@ def person_main_info(person_id, embed=None):
         url = endpoints.person_main_info.format(person_id)
     q = TVMaze._endpoint_standard_get(url)
     if q:
-        return Person(q)
+        return _current_client()._prefetch(Person(q))
     else:
         raise PersonNotFound('Couldn\'t find person {0}'.format(person_id))
 
@@ -1219,6 +3099,15 @@ def season_by_id(season_id):
     else:
         raise SeasonNotFound('Couldn\'t find Season with ID {0}'.format(season_id))
 
+def season_episodes(season_id, fields=None):
+    url = endpoints.season_episodes.format(season_id)
+    q = TVMaze._endpoint_standard_get(url)
+    if q:
+        build = _model_or_projection(Episode, fields)
+        return [build(episode) for episode in q]
+    else:
+        raise EpisodeNotFound('Couldn\'t find Episodes for Season with ID {0}'.format(season_id))
+
 def episode_by_id(episode_id):
     url = endpoints.episode_by_id.format(episode_id)
     q = TVMaze._endpoint_standard_get(url)
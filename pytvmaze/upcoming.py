@@ -0,0 +1,167 @@
+#!/usr/bin/python
+from __future__ import unicode_literals
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+from pytvmaze import endpoints
+from pytvmaze.tvmaze import TVMaze, Episode, airstamp_seconds
+from pytvmaze.exceptions import *
+
+
+class UpcomingEpisodes(object):
+    '''Index of the full schedule answering "what airs next" for many shows without per-show requests.
+
+    The full schedule (all known future episodes) is downloaded once and indexed by show
+    maze id and airstamp.  It is downloaded again when it is older than refresh_interval;
+    TVMaze regenerates it every 24 hours.  Queries keep using the previous index while a
+    refresh is running, and Episode objects are only built for returned airings and reused
+    across refreshes when their payload didn't change.
+
+    Attributes:
+        tvm (TVMaze): Client used for the download, the shared default client if None
+        refresh_interval (float): Seconds before the schedule is downloaded again
+        loaded_at (float): time.time() of the last download, None before the first
+
+    '''
+
+    def __init__(self, tvm=None, refresh_interval=24 * 3600):
+        self.tvm = tvm
+        self.refresh_interval = refresh_interval
+        self.loaded_at = None
+        self._airstamps = dict()     # maze id -> sorted airstamps in seconds
+        self._payloads = dict()      # maze id -> episode payloads in the same order
+        self._episodes = dict()      # episode id -> (payload, Episode) built so far
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __repr__(self):
+        return '<UpcomingEpisodes(shows={0},loaded_at={1})>'.format(len(self._airstamps), self.loaded_at)
+
+    def __len__(self):
+        return len(self._airstamps)
+
+    def __contains__(self, show):
+        return self._maze_id(show) in self._airstamps
+
+    @staticmethod
+    def _maze_id(show):
+        return int(getattr(show, 'maze_id', show))
+
+    def _download(self):
+        url = endpoints.get_full_schedule
+        if self.tvm is None:
+            q = TVMaze._endpoint_standard_get(url)
+        else:
+            with self.tvm.use():
+                q = TVMaze._endpoint_standard_get(url)
+        if not q:
+            raise GeneralError('Something went wrong, www.tvmaze.com may be down')
+        return q
+
+    def load(self, payloads):
+        '''Replace the index with a full schedule payload (a list of episode payloads with embedded shows).'''
+        rows = dict()
+        for payload in payloads:
+            show = payload.get('show') or (payload.get('_embedded') or {}).get('show')
+            airstamp = airstamp_seconds(payload.get('airstamp'))
+            if show is None or airstamp is None:
+                continue
+            rows.setdefault(show['id'], []).append((airstamp, payload.get('id'), payload))
+
+        airstamps = dict()
+        ordered = dict()
+        by_id = dict()
+        for maze_id, show_rows in rows.items():
+            show_rows.sort(key=lambda row: (row[0], row[1]))
+            airstamps[maze_id] = [row[0] for row in show_rows]
+            ordered[maze_id] = [row[2] for row in show_rows]
+            by_id.update((row[1], row[2]) for row in show_rows)
+
+        with self._lock:
+            # Keep Episodes whose payload is unchanged, drop those no longer scheduled
+            self._episodes = dict((episode_id, (by_id[episode_id], episode))
+                                  for episode_id, (payload, episode) in self._episodes.items()
+                                  if by_id.get(episode_id) == payload)
+            self._airstamps = airstamps
+            self._payloads = ordered
+            self.loaded_at = time.time()
+
+    def refresh(self, force=False):
+        """
+        Download the full schedule again if the index is stale
+
+        :param force: Download even if the index is younger than refresh_interval
+        :return: True if the schedule was downloaded
+        """
+        if self.loaded_at is not None and not force:
+            if not self._stale():
+                return False
+            # Another thread is already downloading, keep answering from the current index
+            if not self._refresh_lock.acquire(False):
+                return False
+        else:
+            self._refresh_lock.acquire()
+        try:
+            if not force and not self._stale():
+                return False
+            self.load(self._download())
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def _stale(self):
+        return self.loaded_at is None or time.time() - self.loaded_at >= self.refresh_interval
+
+    def _episode(self, payload):
+        with self._lock:
+            built = self._episodes.get(payload.get('id'))
+            if built is None or built[0] is not payload:
+                built = (payload, Episode(payload))
+                self._episodes[payload.get('id')] = built
+        return built[1]
+
+    def _airings(self, maze_id, start, end, airstamps, payloads):
+        show_airstamps = airstamps.get(maze_id, [])
+        show_payloads = payloads.get(maze_id, [])
+        first = bisect_left(show_airstamps, start)
+        last = len(show_airstamps) if end is None else bisect_right(show_airstamps, end)
+        for row in range(first, last):
+            yield show_airstamps[row], maze_id, row, show_payloads[row]
+
+    def next_airings(self, shows, limit=None, start=None, end=None, per_show=None):
+        """
+        Return the next airings of a set of shows, ordered by airstamp
+
+        :param shows: Iterable of maze ids or objects with a maze_id (Show, FollowedShow)
+        :param limit: Maximum number of episodes returned in total
+        :param start: Earliest airstamp in seconds since the epoch, defaults to now
+        :param end: Latest airstamp in seconds since the epoch, no limit if None
+        :param per_show: Maximum number of episodes returned for each show
+        :return: List of Episode objects
+        """
+        self.refresh()
+        start = time.time() if start is None else start
+        with self._lock:
+            airstamps, payloads = self._airstamps, self._payloads
+        streams = []
+        for maze_id in set(self._maze_id(show) for show in shows):
+            airings = self._airings(maze_id, start, end, airstamps, payloads)
+            if per_show is not None:
+                airings = islice(airings, per_show)
+            streams.append(airings)
+
+        episodes = []
+        for _, _, _, payload in heapq.merge(*streams):
+            if limit is not None and len(episodes) >= limit:
+                break
+            episodes.append(self._episode(payload))
+        return episodes
+
+    def next_airing(self, show, start=None):
+        '''Return the next Episode of a show, or None when nothing is scheduled.'''
+        episodes = self.next_airings([show], limit=1, start=start)
+        return episodes[0] if episodes else None
@@ -20,6 +20,10 @@ setup(
 
     keywords = 'python tv television tvmaze',
     packages=['pytvmaze'],
-    install_requires=['requests']
+    install_requires=['requests', 'futures; python_version < "3"'],
+    extras_require={'arrow': ['pyarrow'], 'numpy': ['numpy'], 'http2': ['httpx[http2]']},
+    entry_points={
+        'console_scripts': ['pytvmaze = pytvmaze.cli:main']
+    }
 
 )
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+ # -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from pytvmaze.tvmaze import *
+from pytvmaze.cache import MemoryCache, FileCache, CoherentCache
+from test.test_tvmaze import StubServer, show_payload
+
+
+class CacheTests(unittest.TestCase):
+    def check_cache(self, cache):
+        cache.set('a', {'id': 1})
+        cache.set('b', [1, 2], ttl=-1)
+        self.assertEqual(cache.get('a'), {'id': 1})
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNone(cache.get('c'))
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+    def test_memory_cache(self):
+        self.check_cache(MemoryCache(ttl=60))
+
+    def test_max_entries_evicts_least_recently_used(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+    def test_file_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            self.check_cache(FileCache(directory, ttl=60))
+            FileCache(directory).set('d', {'id': 4})
+            self.assertEqual(FileCache(directory).get('d'), {'id': 4})
+        finally:
+            shutil.rmtree(directory)
+
+    def test_entries(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for cache in (MemoryCache(), FileCache(directory)):
+                cache.set('a', {'id': 1}, show_id=7)
+                [(url, stored_at, show_id)] = cache.entries()
+                self.assertEqual((url, show_id), ('a', 7))
+                self.assertTrue(stored_at <= time.time())
+        finally:
+            shutil.rmtree(directory)
+
+
+class CoherentCacheTests(unittest.TestCase):
+    routes = {
+        '/shows/1': show_payload(1),
+        '/shows/2': show_payload(2),
+        '/shows/1/seasons': [{'id': 100, 'number': 1}],
+        '/seasons/100/episodes': [{'id': 1000, 'season': 1, 'number': 1}],
+        '/episodes/999': {'id': 999, 'season': 1, 'number': 1},
+    }
+
+    def test_only_updated_shows_are_invalidated(self):
+        cache = CoherentCache(MemoryCache(ttl=60))
+        tvm = TVMaze(cache=cache)
+        routes = dict(self.routes)
+        with StubServer(routes) as server, server.patch_endpoints(), tvm.use():
+            show_main_info(1)
+            show_main_info(2)
+            show_seasons(1)
+            season_episodes(100)
+            episode_by_id(999)
+            owners = dict((url.replace(server.url, ''), show_id) for url, _, show_id in cache.entries())
+            self.assertEqual(owners, {'/shows/1': 1, '/shows/2': 2, '/shows/1/seasons': 1,
+                                      '/seasons/100/episodes': 1, '/episodes/999': None})
+            self.assertEqual(cache.backend._entries[server.url + '/shows/2'][1], float('inf'))
+            self.assertNotEqual(cache.backend._entries[server.url + '/episodes/999'][1], float('inf'))
+
+            routes['/updates/shows'] = {'1': int(time.time()), '2': 1000, '3': int(time.time())}
+            stale = cache.sync(tvm)
+            self.assertEqual(sorted(url.replace(server.url, '') for url in stale),
+                             ['/seasons/100/episodes', '/shows/1', '/shows/1/seasons'])
+            self.assertIsNone(cache.get(server.url + '/shows/1'))
+            self.assertIsNotNone(cache.get(server.url + '/shows/2'))
+
+            # Later syncs only read the last day of updates
+            routes['/updates/shows?since=day'] = {'2': int(time.time()) + 120}
+            show_main_info(1)
+            requests = len(server.requests)
+            self.assertEqual(cache.sync(tvm, refresh=True), [server.url + '/shows/2'])
+            self.assertEqual(server.requests[requests:], ['/updates/shows?since=day', '/shows/2'])
+            self.assertIsNotNone(cache.get(server.url + '/shows/2'))
+            self.assertIsNotNone(cache.get(server.url + '/shows/1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+ # -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pytvmaze.tvmaze import *
+from pytvmaze.catalog import Catalog
+from test.test_tvmaze import show_payload
+
+
+def episode_data(episode_id, airstamp, **extra):
+    data = {'id': episode_id, 'season': 1, 'number': episode_id, 'name': 'Episode {0}'.format(episode_id),
+            'airstamp': airstamp, 'summary': '<p>Summary</p>'}
+    data.update(extra)
+    return data
+
+
+class CatalogTests(unittest.TestCase):
+    def setUp(self):
+        self.catalog = Catalog()
+        self.catalog.add_shows([show_payload(1, network='HBO', status='Running', genres=['Drama'], premiered='2010-04-01'),
+                                show_payload(2, network='HBO', status='Ended', genres=['Drama', 'Crime']),
+                                Show(show_payload(3, network='AMC', genres=['Horror'], premiered='2015-01-01',
+                                                  rating={'average': 8.0})),
+                                show_payload(4, genres=['Documentary'], webChannel={'name': 'Netflix'},
+                                             rating={'average': 9.0})])
+
+    def test_show_filters(self):
+        catalog = self.catalog
+        self.assertEqual(len(catalog), 4)
+        self.assertEqual([show.maze_id for show in catalog.shows(network='hbo', status='Running')], [1])
+        self.assertEqual([show.maze_id for show in catalog.shows(genre='Drama')], [1, 2])
+        self.assertEqual([show.maze_id for show in catalog.shows(web_channel='Netflix')], [4])
+        self.assertEqual([show.maze_id for show in catalog.shows(premiered_from=2011)], [3])
+        self.assertEqual([show.maze_id for show in catalog.shows(order_by='-rating', limit=2)], [4, 3])
+        self.assertEqual(catalog.show(3).network.name, 'AMC')
+        self.assertEqual(catalog.genres(), [('Drama', 2), ('Crime', 1), ('Documentary', 1), ('Horror', 1)])
+        with self.assertRaises(IDNotFound):
+            catalog.show(99)
+        with self.assertRaises(GeneralError):
+            catalog.shows(order_by='summary')
+
+    def test_replace_show(self):
+        self.catalog.add_shows([show_payload(2, genres=['Comedy'])])
+        self.assertEqual(len(self.catalog), 4)
+        self.assertEqual([show.maze_id for show in self.catalog.shows(genre='Comedy')], [2])
+        self.assertEqual([show.maze_id for show in self.catalog.shows(genre='Drama')], [1])
+
+    def test_episode_window(self):
+        schedule = [episode_data(10, '2016-01-01T20:00:00-05:00', show=show_payload(5, network='FX')),
+                    episode_data(11, '2016-01-02T20:00:00-05:00', show=show_payload(5, network='FX')),
+                    episode_data(12, '2016-01-09T20:00:00-05:00', _embedded={'show': show_payload(7)})]
+        self.assertEqual(self.catalog.add_episodes(schedule), 3)
+        # The show embedded in the schedule is stored once
+        self.assertEqual(self.catalog.show(5).network.name, 'FX')
+        episodes = self.catalog.episodes(start=datetime(2016, 1, 1), end='2016-01-05')
+        self.assertEqual([episode.maze_id for episode in episodes], [10, 11])
+        self.assertEqual(episodes[0].show.maze_id, 5)
+        self.assertEqual(episodes[0].summary, 'Summary')
+        self.assertEqual(self.catalog.episode(12).show.maze_id, 7)
+        self.assertEqual(self.catalog.episode(12).to_dict(), schedule[2])
+
+    def test_episodes_of_show(self):
+        # As get_show(..., embed='episodes') returns it
+        show = show_payload(6, _embedded={'episodes': [episode_data(21, None, season=2, number=1),
+                                                    episode_data(20, None, season=1, number=1)]})
+        self.catalog.add_shows([show])
+        self.catalog.add_episodes([Episode(episode_data(22, None, season=2, number=2))], maze_id=6)
+        self.assertEqual([episode.maze_id for episode in self.catalog.episodes(6)], [20, 21, 22])
+        self.assertEqual([episode.maze_id for episode in self.catalog.episodes(6, season=2)], [21, 22])
+        self.assertFalse(hasattr(self.catalog.episode(20), 'show'))
+        with self.assertRaises(EpisodeNotFound):
+            self.catalog.episode(99)
+
+    def test_file_persists(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'catalog.db')
+            with Catalog(path) as catalog:
+                catalog.add_shows([show_payload(1)])
+            with Catalog(path) as catalog:
+                self.assertIn(1, catalog)
+                self.assertEqual(catalog.show(1).name, 'Show')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+ # -*- coding: utf-8 -*-
+
+import io
+import json
+import shutil
+import tempfile
+import unittest
+
+from pytvmaze import cli
+from pytvmaze.tvmaze import *
+from test.test_tvmaze import FakeAPI, StubServer, show_payload
+
+
+class CliTests(unittest.TestCase):
+    responses = {
+        endpoints.show_single_search.format('dexter'): show_payload(161, 'Dexter'),
+        endpoints.lookup_tvdb.format('1007'): show_payload(7, 'Lost'),
+        endpoints.episode_by_number.format(161, 1, 8): {'id': 12, 'season': 1, 'number': 8, 'name': 'Shrink Wrap'},
+    }
+
+    def run_cli(self, argv, text):
+        stdout = io.StringIO()
+        status = cli.main(argv, stdin=io.StringIO(text), stdout=stdout)
+        return status, [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_mixed_queries_in_input_order(self):
+        text = u'dexter\n\n{"tvdb_id": 1007}\n{"maze_id": 161, "season": 1, "number": 8}\nnot a show\n'
+        with FakeAPI(self.responses):
+            status, records = self.run_cli(['--concurrency', '3'], text)
+        self.assertEqual(status, 1)
+        self.assertEqual([record['index'] for record in records], [0, 1, 2, 3])
+        self.assertEqual(records[0]['result']['name'], 'Dexter')
+        self.assertEqual(records[1]['result']['id'], 7)
+        self.assertEqual(records[2]['result']['name'], 'Shrink Wrap')
+        self.assertEqual(records[3]['error']['type'], 'ShowNotFound')
+
+    def test_typed_plain_lines_and_completion_order(self):
+        with FakeAPI(self.responses):
+            status, records = self.run_cli(['--type', 'episode', '--order', 'completion'], u'161 1 8\n161/1/8\n')
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(record['index'] for record in records), [0, 1])
+        self.assertEqual(set(record['result']['id'] for record in records), set([12]))
+
+    def test_cache_dir(self):
+        cache_dir = tempfile.mkdtemp()
+        routes = {'/singlesearch/shows?q=dexter': show_payload(161, 'Dexter')}
+        try:
+            with StubServer(routes) as server, server.patch_endpoints():
+                for _ in range(2):
+                    status, records = self.run_cli(['--cache-dir', cache_dir, '--cache-ttl', '60'], u'dexter\n')
+                    self.assertEqual(records[0]['result']['id'], 161)
+            self.assertEqual(server.requests, ['/singlesearch/shows?q=dexter'])
+        finally:
+            shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
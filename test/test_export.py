@@ -0,0 +1,83 @@
+#!/usr/bin/python
+ # -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pytvmaze.tvmaze import *
+from pytvmaze import export
+from test.test_tvmaze import show_payload
+from datetime import date
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class ExportTests(unittest.TestCase):
+    def setUp(self):
+        shows = [show_payload(1, network='HBO', premiered='2006-10-01', genres=['Drama'], rating={'average': 8.5}),
+                 show_payload(2, genres=['Drama'], rating={'average': None})]
+        self.shows = [Show(show) for show in shows]
+        self.episodes = [{'id': 10, 'season': 1, 'number': 1, 'airdate': '2006-10-01', 'show': shows[0]},
+                         {'id': 11, 'season': 1, 'number': 2, 'airdate': ''}]
+
+    def test_columns_flatten_nested_fields(self):
+        columns = export.columns(self.shows)
+        self.assertEqual([name for name, _, _ in export.schemas['show']][:3], ['id', 'name', 'type'])
+        self.assertEqual(columns['id'], [1, 2])
+        self.assertEqual(columns['network_name'], ['HBO', None])
+        self.assertEqual(columns['network_timezone'], ['America/New_York', None])
+        self.assertEqual(columns['rating_average'], [8.5, None])
+        self.assertEqual(columns['externals_tvdb'], [1001, 1002])
+        self.assertEqual(columns['externals_tvrage'], [2001, 2002])
+        self.assertEqual(columns['premiered'], [date(2006, 10, 1), None])
+        self.assertEqual(columns['genres'], [['Drama'], ['Drama']])
+
+    def test_raw_payloads_need_kind(self):
+        columns = export.columns(self.episodes, kind='episode')
+        self.assertEqual(columns['show_id'], [1, None])
+        self.assertEqual(columns['airdate'], [date(2006, 10, 1), None])
+        with self.assertRaises(ValueError):
+            list(export.batches(self.episodes))
+
+    def test_batches(self):
+        updates = [Update(maze_id, 1444852010 + maze_id) for maze_id in range(5)]
+        batches = list(export.batches(iter(updates), batch_size=2))
+        self.assertEqual([len(columns['id']) for kind, columns in batches], [2, 2, 1])
+        self.assertEqual(batches[2], ('update', {'id': [4], 'time': [1444852014]}))
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_to_numpy(self):
+        array = export.to_numpy(self.shows, batch_size=1)
+        self.assertEqual(list(array['id']), [1, 2])
+        self.assertEqual(array['network_id'][1], -1)
+        self.assertTrue(numpy.isnan(array['rating_average'][1]))
+        self.assertEqual(array['genres'][0], ['Drama'])
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_arrow_and_parquet(self):
+        import pyarrow.parquet as pq
+
+        table = export.to_arrow(self.episodes, kind='episode')
+        self.assertEqual(table.column('show_id').to_pylist(), [1, None])
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'shows.parquet')
+            self.assertEqual(export.write_parquet(path, iter(self.shows), batch_size=1), 2)
+            parquet = pq.ParquetFile(path)
+            self.assertEqual(parquet.metadata.num_row_groups, 2)
+            self.assertEqual(parquet.read().column('network_name').to_pylist(), ['HBO', None])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+ # -*- coding: utf-8 -*-
+
+import unittest
+
+from pytvmaze.tvmaze import *
+from pytvmaze.graph import CreditGraph
+from test.test_tvmaze import FakeAPI, show_payload
+
+
+def person(person_id):
+    return {'id': person_id, 'name': 'Person {0}'.format(person_id), '_links': {}}
+
+
+def character(character_id):
+    return {'id': character_id, 'name': 'Character {0}'.format(character_id)}
+
+
+def cast_credit(maze_id, character_id):
+    return {'_links': {}, '_embedded': {'show': show_payload(maze_id), 'character': character(character_id)}}
+
+
+def crew_credit(maze_id, crew_type):
+    return {'type': crew_type, '_links': {}, '_embedded': {'show': show_payload(maze_id)}}
+
+
+class CreditGraphTests(unittest.TestCase):
+    def responses(self):
+        cast = '?embed[]=show&embed[]=character'
+        return {
+            endpoints.show_main_info.format(1) + '?embed[]=cast&embed[]=crew': show_payload(1, _embedded={
+                'cast': [{'person': person(10), 'character': character(100)},
+                         {'person': person(11), 'character': character(101)}],
+                'crew': [{'type': 'Creator', 'person': person(12)}]}),
+            endpoints.person_main_info.format(12): person(12),
+            endpoints.person_cast_credits.format(10) + cast: [cast_credit(1, 100), cast_credit(2, 200)],
+            endpoints.person_cast_credits.format(11) + cast: [cast_credit(1, 101)],
+            endpoints.person_crew_credits.format(12) + '?embed=show': [crew_credit(1, 'Creator'),
+                                                                       crew_credit(3, 'Executive Producer')],
+        }
+
+    def test_crawl_and_queries(self):
+        graph = CreditGraph(TVMaze(), max_workers=4)
+        with FakeAPI(self.responses()) as api:
+            graph.crawl(shows=[1], depth=2)
+            self.assertEqual(len(api.calls), 7)
+            self.assertEqual(len(set(api.calls)), 7)
+            # Everything up to depth 2 is already expanded
+            graph.crawl(shows=[1], depth=2)
+            self.assertEqual(len(api.calls), 7)
+        self.assertEqual(graph.show_ids(), [1, 2, 3])
+        self.assertEqual(graph.people_in(1), [10, 11, 12])
+        self.assertEqual(graph.people_in(1, crew=False), [10, 11])
+        self.assertEqual(graph.shows_of(12), [1, 3])
+        self.assertEqual(graph.crew_roles(12), [(1, 'Creator'), (3, 'Executive Producer')])
+        self.assertEqual(graph.characters_of(10), [(1, 100), (2, 200)])
+        self.assertEqual(graph.shared_cast(1), [(2, [10])])
+        self.assertEqual(graph.shared_cast(1, crew=True), [(2, [10]), (3, [12])])
+        self.assertEqual(graph.co_workers(12), [10, 11])
+        self.assertIs(graph.person(10), graph.person(10))
+        self.assertEqual(graph.character(200).name, 'Character 200')
+        self.assertEqual(graph.show(2).maze_id, 2)
+
+    def test_crawl_from_people(self):
+        graph = CreditGraph()
+        with FakeAPI(self.responses()) as api:
+            graph.crawl(people=[12], depth=1)
+        self.assertEqual(len(api.calls), 3)
+        self.assertEqual(graph.person(12).name, 'Person 12')
+        self.assertEqual(graph.shows_of(12, crew=False), [])
+        self.assertEqual(graph.shows_of(12), [1, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
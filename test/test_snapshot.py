@@ -0,0 +1,83 @@
+#!/usr/bin/python
+ # -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pytvmaze.tvmaze import *
+from pytvmaze.snapshot import Snapshot, write_snapshot
+from test.test_tvmaze import show_payload
+
+
+class SnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'catalog.snap')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        shows = [Show(show_payload(maze_id, 'Show {0}'.format(maze_id), network='HBO', updated=1000 + maze_id,
+                                   summary='<p>Summary</p>')) for maze_id in (30, 10, 20)]
+        seasons = {10: [Season({'id': 100, 'number': 1, 'name': 'First'})]}
+        episodes = {10: [Episode({'id': 1002, 'season': 1, 'number': 2, 'name': 'Two'}),
+                         Episode({'id': 1001, 'season': 1, 'number': 1, 'name': u'Ein\xdf'}),
+                         Episode({'id': 1003, 'season': 2, 'number': 1, 'name': 'Three'})]}
+        self.assertEqual(write_snapshot(self.path, shows, seasons=seasons, episodes=episodes), 3)
+
+        with Snapshot(self.path) as snapshot:
+            self.assertEqual(len(snapshot), 3)
+            self.assertEqual(list(snapshot.show_ids()), [10, 20, 30])
+            self.assertIn(20, snapshot)
+            self.assertNotIn(15, snapshot)
+            self.assertEqual(snapshot.updated(30), 1030)
+
+            show = snapshot.show(10)
+            self.assertEqual(show.name, 'Show 10')
+            self.assertEqual(show.network.code, 'US')
+            self.assertEqual(show.externals, {'thetvdb': 1010, 'tvrage': 2010, 'imdb': 'tt10'})
+            self.assertEqual(show[1].name, 'First')
+            self.assertEqual(show[1][1].title, u'Ein\xdf')
+            self.assertEqual(show[2][1].maze_id, 1003)
+            self.assertEqual([episode.maze_id for episode in snapshot.episodes(10)], [1001, 1002, 1003])
+            self.assertEqual(snapshot.seasons(10)[1].id, 100)
+            self.assertEqual(snapshot.episode(1002).title, 'Two')
+            self.assertEqual(snapshot.episodes(20), [])
+
+            with self.assertRaises(IDNotFound):
+                snapshot.show(15)
+            with self.assertRaises(EpisodeNotFound):
+                snapshot.episode(999)
+
+    def test_not_a_snapshot(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'x' * 100)
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path)
+
+    def test_empty_or_truncated_file(self):
+        open(self.path, 'wb').close()
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path)
+        write_snapshot(self.path, [Show(show_payload(1, summary='<p>Summary</p>'))])
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:-5])
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path)
+
+    def test_records_need_an_id(self):
+        episodes = {1: [Episode({'id': None, 'season': 1, 'number': 1})]}
+        with self.assertRaises(SnapshotError):
+            write_snapshot(self.path, [Show(show_payload(1))], episodes=episodes)
+        with self.assertRaises(SnapshotError):
+            write_snapshot(self.path, [Show({'id': None, 'name': 'Show'})])
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
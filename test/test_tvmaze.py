@@ -3,9 +3,123 @@
 
 import unittest
 import datetime
+import json
+import os
+import pickle
+import shutil
+import socket
+import subprocess
 import sys
+import tempfile
+import time
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+import threading
 
 from pytvmaze.tvmaze import *
+from pytvmaze.backends import HTTPBackend, HttpxBackend, Urllib3Backend
+
+
+class FakeAPI(object):
+    '''Serve canned payloads keyed by url in place of the TVMaze free endpoints.'''
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+        self._patcher = mock.patch.object(TVMaze, '_endpoint_standard_get', staticmethod(self.get))
+
+    def get(self, url, cache=None, ttl=None):
+        self.calls.append(url)
+        return self.responses.get(url)
+
+    def __enter__(self):
+        self._patcher.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._patcher.stop()
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    '''Local HTTP server answering TVMaze style paths with canned JSON.
+
+    Use patch_endpoints() to point the endpoint templates at it.
+    '''
+    daemon_threads = True
+
+    def __init__(self, routes, delay=0.0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.routes = routes
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.url = 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # Clients that timed out have closed the connection before the answer is written
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def patch_endpoints(self):
+        patched = dict((name, value.replace('http://api.tvmaze.com', self.url))
+                       for name, value in vars(endpoints).items()
+                       if isinstance(value, str) and value.startswith('http://api.tvmaze.com'))
+        return mock.patch.multiple(endpoints, **patched)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.delay(self.path) if callable(server.delay) else server.delay)
+        payload = server.routes.get(self.path)
+        # An int route answers with that status code
+        status = payload if isinstance(payload, int) else 404 if payload is None else 200
+        body = json.dumps(payload).encode('utf-8')
+        with server.lock:
+            server.in_flight -= 1
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def show_payload(maze_id, name='Show', network=None, **extra):
+    payload = {'id': maze_id, 'name': name, '_links': {},
+               'externals': {'thetvdb': maze_id + 1000, 'tvrage': maze_id + 2000, 'imdb': 'tt{0}'.format(maze_id)}}
+    if network is not None:
+        payload['network'] = {'id': 1, 'name': network, 'country': {'name': 'United States', 'code': 'US',
+                                                                     'timezone': 'America/New_York'}}
+    payload.update(extra)
+    return payload
 
 
 class EndpointTests(unittest.TestCase):
@@ -376,3 +490,829 @@ class ExceptionsTests(unittest.TestCase):
     def test_AKASNotFound_exception(self):
         with self.assertRaises(AKASNotFound):
             result = show_akas(maze_id=5634563456)
+
+
+class IDMapTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_add_show_and_persist(self):
+        path = os.path.join(self.tmp_dir, 'ids.json')
+        id_map = IDMap(path)
+        id_map.add_show(Show(show_payload(161)))
+        self.assertEqual(id_map.get('tvdb', 1161), 161)
+        self.assertEqual(id_map.get('imdb', 'TT161'), 161)
+        id_map.save()
+        self.assertEqual(IDMap(path).get('tvrage', '2161'), 161)
+        with self.assertRaises(ValueError):
+            id_map.get('netflix', 1)
+
+    def test_get_show_uses_lookup_result(self):
+        tvm = TVMaze()
+        responses = {endpoints.lookup_tvdb.format(1161): show_payload(161),
+                     endpoints.show_main_info.format(161): show_payload(161)}
+        with FakeAPI(responses) as api:
+            self.assertEqual(tvm.get_show(tvdb_id=1161).maze_id, 161)
+            self.assertEqual(api.calls, [endpoints.lookup_tvdb.format(1161)])
+            self.assertEqual(tvm.get_show(imdb_id='tt161').maze_id, 161)
+            self.assertEqual(api.calls[1:], [endpoints.show_main_info.format(161)])
+
+    def test_resolve_ids(self):
+        tvm = TVMaze()
+        tvm.id_map.add('tvdb', 1001, 1)
+        responses = {endpoints.lookup_tvdb.format(1002): show_payload(2)}
+        with FakeAPI(responses) as api:
+            resolved = tvm.resolve_ids([1001, 1002, 1003, 1002])
+        self.assertEqual(resolved, {1001: 1, 1002: 2, 1003: None})
+        self.assertEqual(len(api.calls), 2)
+        self.assertEqual(tvm.id_map.get('tvdb', 1002), 2)
+
+
+class ReconcileTests(unittest.TestCase):
+    def test_reconcile_marked_episodes(self):
+        tvm = TVMaze('user', 'key')
+        marked = [{'episode_id': 1, 'type': 0}, {'episode_id': 2, 'type': 1}, {'episode_id': 3, 'type': 2}]
+        put_urls = []
+        deleted_urls = []
+
+        def put(url, payload=None):
+            put_urls.append((url, payload))
+            return not url.endswith('/5')
+
+        def delete(url):
+            deleted_urls.append(url)
+            return True
+
+        with mock.patch.object(tvm, '_endpoint_premium_get', return_value=marked), \
+                mock.patch.object(tvm, '_endpoint_premium_put', side_effect=put), \
+                mock.patch.object(tvm, '_endpoint_premium_delete', side_effect=delete):
+            result = tvm.reconcile_marked_episodes({1: 'watched', 2: 'watched', 3: None, 4: None, 5: 'skipped'},
+                                                   rate_limit=1000)
+
+        self.assertEqual(result.skipped, [(1, 'watched'), (4, None)])
+        self.assertEqual(result.applied, [(2, 'watched'), (3, None)])
+        self.assertEqual(len(result.failed), 1)
+        self.assertIsInstance(result.failed[0][2], EpisodeNotFound)
+        self.assertEqual(sorted(url for url, payload in put_urls),
+                         [endpoints.marked_episodes.format('/2'), endpoints.marked_episodes.format('/5')])
+        self.assertEqual(deleted_urls, [endpoints.marked_episodes.format('/3')])
+
+        with self.assertRaises(InvalidMarkedEpisodeType):
+            tvm.reconcile_marked_episodes({1: 'seen'})
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(rate=50, burst=2)
+        start = time.time()
+        for _ in range(7):
+            limiter.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+
+class WriteBehindTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_coalesce_and_flush(self):
+        tvm = TVMaze('user', 'key', write_behind=True)
+        tvm.write_behind.delay = 60
+        sent = []
+
+        def put(url, payload=None):
+            sent.append(('put', url, payload))
+            return True
+
+        def delete(url):
+            sent.append(('delete', url))
+            return True
+
+        with mock.patch.object(tvm, '_endpoint_premium_put', side_effect=put), \
+                mock.patch.object(tvm, '_endpoint_premium_delete', side_effect=delete):
+            tvm.follow_show(1)
+            tvm.unfollow_show(1)
+            tvm.vote_show(2, 3)
+            tvm.vote_show(2, 8)
+            tvm.mark_episode(3, 'watched')
+            self.assertEqual(sent, [])
+            self.assertEqual(len(tvm.write_behind), 2)
+            self.assertTrue(tvm.close(timeout=5))
+
+        self.assertEqual(sent, [('put', endpoints.voted_shows.format('/2'), {'vote': 8}),
+                                ('put', endpoints.marked_episodes.format('/3'), {'type': '0'})])
+        self.assertEqual(tvm.write_behind.applied, 2)
+        with self.assertRaises(InvalidVoteValue):
+            tvm.vote_show(2, 11)
+
+    def test_journal_replay(self):
+        journal = os.path.join(self.tmp_dir, 'journal.jsonl')
+        crashed_journal = os.path.join(self.tmp_dir, 'crashed.jsonl')
+        tvm = TVMaze('user', 'key', journal_path=journal)
+        tvm.write_behind.delay = 60
+        tvm.follow_person(7)
+        shutil.copy(journal, crashed_journal)
+        with open(crashed_journal) as f:
+            self.assertEqual(json.loads(f.readline())['action'], 'follow_person')
+
+        replayed = []
+        with mock.patch.object(TVMaze, '_endpoint_premium_put', autospec=True,
+                               side_effect=lambda self, url, payload=None: replayed.append(url) or True):
+            self.assertTrue(tvm.close(timeout=5))
+            tvm2 = TVMaze('user', 'key', journal_path=crashed_journal)
+            self.assertTrue(tvm2.close(timeout=5))
+        self.assertEqual(replayed, [endpoints.followed_people.format('/7')] * 2)
+        with open(crashed_journal) as f:
+            self.assertEqual(f.read(), '')
+
+    def test_failures_are_recorded(self):
+        tvm = TVMaze('user', 'key', write_behind=True)
+        tvm.write_behind.backoff = 0
+        with mock.patch.object(tvm, '_endpoint_premium_put', side_effect=ConnectionError('down')) as put:
+            tvm.follow_show(1)
+            tvm.flush(timeout=5)
+        self.assertEqual(put.call_count, tvm.write_behind.retries + 1)
+        self.assertIsInstance(tvm.write_behind.failed[0][1], ConnectionError)
+        tvm.close()
+
+
+class StaleReadTests(unittest.TestCase):
+    def test_stale_while_revalidate(self):
+        cache = MemoryCache()
+        tvm = TVMaze(cache=cache, stale_while_revalidate=60)
+        routes = {'/shows/1': show_payload(1, 'New')}
+        with StubServer(routes, delay=0.5) as server, server.patch_endpoints(), tvm.use():
+            url = endpoints.show_main_info.format(1)
+            cache.set(url, show_payload(1, 'Old'), ttl=-1)
+            started = time.time()
+            show = show_main_info(1)
+            self.assertTrue(time.time() - started < 0.4)
+            self.assertEqual((show.name, show.stale), ('Old', True))
+            deadline = time.time() + 5
+            while cache.get(url) is None and time.time() < deadline:
+                time.sleep(0.05)
+            show = show_main_info(1)
+            self.assertEqual((show.name, show.stale), ('New', False))
+            self.assertEqual(server.requests, ['/shows/1'])
+
+    def test_stale_if_error(self):
+        cache = MemoryCache()
+        with StubServer({}) as server:
+            patcher = server.patch_endpoints()
+        url = server.url + '/shows/1/episodes?specials=1'
+        cache.set(url, [{'id': 1, 'season': 1, 'number': 1}], ttl=-1)
+        with patcher:
+            with TVMaze(cache=cache, stale_if_error=3600).use():
+                episodes = episode_list(1)
+            self.assertEqual([episode.stale for episode in episodes], [True])
+            with TVMaze(cache=cache).use():
+                with self.assertRaises(ConnectionError):
+                    episode_list(1)
+
+
+class BackendTests(unittest.TestCase):
+    def setUp(self):
+        # Retry 429 without waiting
+        patcher = mock.patch('pytvmaze.backends._BACKOFF_FACTOR', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check_backend(self, backend):
+        tvm = TVMaze(backend=backend)
+        routes = {'/shows/1': show_payload(1), '/shows/1/akas': 500, '/shows/3': 429}
+        with StubServer(routes) as server, server.patch_endpoints(), tvm.use():
+            self.assertEqual(show_main_info(1).maze_id, 1)
+            with self.assertRaises(IDNotFound):
+                show_main_info(2)
+            with self.assertRaises(ConnectionError):
+                show_akas(1)
+            with self.assertRaises(RateLimited):
+                show_main_info(3)
+            self.assertEqual(server.requests.count('/shows/3'), 6)
+            # The 429 wasn't taken for a show
+            routes['/shows/3'] = show_payload(3)
+            self.assertEqual(show_main_info(3).maze_id, 3)
+        tvm.close()
+
+    def test_requests(self):
+        self.check_backend('requests')
+        self.assertIsNotNone(TVMaze().session)
+
+    def test_urllib3(self):
+        self.check_backend(Urllib3Backend(pool_size=2))
+        self.assertIsNone(TVMaze(backend='urllib3').session)
+
+    def test_httpx(self):
+        try:
+            backend = HttpxBackend(http2=False)
+        except ImportError:
+            self.skipTest('httpx is not installed')
+        self.check_backend(backend)
+
+    def test_custom_backend_gets_request_body(self):
+        calls = []
+
+        class RecordingBackend(HTTPBackend):
+            def request(self, method, url, data=None, auth=None, timeout=None):
+                calls.append((method, url, data, auth))
+                return mock.Mock(status_code=200)
+
+        tvm = TVMaze('user', 'key', backend=RecordingBackend())
+        tvm.mark_episode(1, 'acquired')
+        self.assertEqual(calls, [('PUT', endpoints.marked_episodes.format('/1'), {'type': '1'}, ('user', 'key'))])
+
+    def test_premium_rate_limited(self):
+        class RateLimitedBackend(HTTPBackend):
+            def request(self, method, url, data=None, auth=None, timeout=None):
+                return mock.Mock(status_code=429)
+
+        tvm = TVMaze('user', 'key', backend=RateLimitedBackend())
+        for call in (tvm.get_followed_shows, lambda: tvm.mark_episode(1, 'acquired'),
+                     lambda: tvm.unfollow_show(1)):
+            with self.assertRaises(RateLimited):
+                call()
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            TVMaze(backend='curl')
+
+
+class PrioritySchedulerTests(unittest.TestCase):
+    def wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.005)
+        self.assertTrue(condition())
+
+    def test_interactive_overtakes_queued_batch(self):
+        scheduler = PriorityScheduler(max_concurrency=1)
+        order = []
+
+        def request(priority):
+            with scheduler.slot(priority):
+                order.append(priority)
+
+        scheduler.acquire('batch')
+        threads = [threading.Thread(target=request, args=('batch',)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        self.wait_for(lambda: scheduler.stats()['batch']['queued'] == 3)
+        threads.append(threading.Thread(target=request, args=('interactive',)))
+        threads[-1].start()
+        self.wait_for(lambda: scheduler.stats()['interactive']['queued'] == 1)
+        scheduler.release('batch')
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ['interactive', 'batch', 'batch', 'batch'])
+        self.assertEqual(scheduler.stats()['batch']['dispatched'], 4)
+
+    def test_class_concurrency_limit(self):
+        routes = dict(('/shows/{0}'.format(i), show_payload(i)) for i in range(1, 9))
+        scheduler = PriorityScheduler({'interactive': (8, None), 'batch': (1, 2)}, max_concurrency=8)
+        crawler = TVMaze(scheduler=scheduler, priority='batch')
+        with StubServer(routes, delay=0.05) as server, server.patch_endpoints():
+            threads = [threading.Thread(target=crawler.get_show, kwargs={'maze_id': i}) for i in range(1, 9)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(server.max_in_flight, 2)
+        self.assertEqual(scheduler.stats()['batch']['dispatched'], 8)
+
+    def test_thread_priority_overrides_instance(self):
+        tvm = TVMaze(scheduler=True)
+        with StubServer({'/shows/1': show_payload(1)}) as server, server.patch_endpoints():
+            with tvm.use(priority='batch'):
+                show_main_info(1)
+            tvm.get_show(maze_id=1)
+        stats = tvm.scheduler.stats()
+        self.assertEqual((stats['batch']['dispatched'], stats['interactive']['dispatched']), (1, 1))
+        with self.assertRaises(ValueError):
+            TVMaze(scheduler=True, priority='urgent')
+
+
+class DeadlineTests(unittest.TestCase):
+    def test_read_timeout(self):
+        for backend in ('requests', 'urllib3'):
+            tvm = TVMaze(timeout=(1, 0.2), backend=backend)
+            with StubServer({'/shows/1': show_payload(1)}, delay=0.5) as server, server.patch_endpoints():
+                start = time.time()
+                with self.assertRaises(RequestTimeout), tvm.use():
+                    show_main_info(1)
+                # Reads aren't retried
+                self.assertLess(time.time() - start, 0.45)
+            tvm.close()
+
+    def test_deadline_spans_composite_call(self):
+        routes = {'/lookup/shows?thetvdb=81189': show_payload(1), '/shows/1?embed=episodes': show_payload(1)}
+        delays = {'/lookup/shows?thetvdb=81189': 0.1, '/shows/1?embed=episodes': 1.0}
+        tvm = TVMaze()
+        with StubServer(routes, delay=lambda path: delays.get(path, 0)) as server, server.patch_endpoints():
+            with self.assertRaises(DeadlineExceeded) as raised:
+                tvm.get_show(tvdb_id=81189, embed='episodes', deadline=0.5)
+            lookup, embed = endpoints.lookup_tvdb.format(81189), endpoints.show_main_info.format(1) + '?embed=episodes'
+        self.assertEqual(raised.exception.completed, [lookup])
+        self.assertEqual(raised.exception.pending, embed)
+        self.assertLess(raised.exception.elapsed, 0.9)
+        self.assertIn('after 1 completed request', str(raised.exception))
+
+    def test_expired_deadline_sends_nothing(self):
+        tvm = TVMaze()
+        with StubServer({'/shows/1': show_payload(1)}) as server, server.patch_endpoints():
+            with deadline(10):
+                with self.assertRaises(DeadlineExceeded), deadline(0), tvm.use():
+                    show_main_info(1)
+            self.assertEqual(server.requests, [])
+
+    def test_refused_connection_is_not_a_timeout(self):
+        with StubServer({}) as server:
+            pass
+        # Retry the connect without waiting
+        with mock.patch('pytvmaze.backends._BACKOFF_FACTOR', 0):
+            for backend in ('requests', Urllib3Backend(pool_size=1)):
+                tvm = TVMaze(backend=backend)
+                with server.patch_endpoints(), tvm.use():
+                    with self.assertRaises(ConnectionError) as raised:
+                        show_main_info(1)
+                self.assertNotIsInstance(raised.exception, RequestTimeout)
+                tvm.close()
+
+    def test_deadline_leaves_circuit_trial_to_next_request(self):
+        routes = {'/shows/1': 500}
+        delays = {'/shows/1': 0.0}
+        breaker = CircuitBreaker(window=2, min_requests=2, reset_timeout=0.05)
+        tvm = TVMaze(circuit_breaker=breaker)
+        with StubServer(routes, delay=lambda path: delays[path]) as server, server.patch_endpoints(), tvm.use():
+            for _ in range(2):
+                with self.assertRaises(ConnectionError):
+                    show_main_info(1)
+            time.sleep(0.1)
+            # Expired before the trial could be sent
+            with self.assertRaises(DeadlineExceeded), deadline(0):
+                show_main_info(1)
+            # Trial sent but cut short by the deadline
+            routes['/shows/1'], delays['/shows/1'] = show_payload(1), 0.5
+            with self.assertRaises(DeadlineExceeded), deadline(0.1):
+                show_main_info(1)
+            self.assertEqual(breaker.state('/shows/{}'), 'open')
+            delays['/shows/1'] = 0.0
+            self.assertEqual(show_main_info(1).maze_id, 1)
+            self.assertEqual(breaker.state('/shows/{}'), 'closed')
+            self.assertEqual(len(server.requests), 4)
+        tvm.close()
+
+    def test_race_workers_share_deadline(self):
+        tvm = TVMaze()
+        with StubServer({'/shows/1': show_payload(1), '/lookup/shows?imdb=tt1': show_payload(1)}, delay=1.0) as server, \
+                server.patch_endpoints():
+            start = time.time()
+            with self.assertRaises(DeadlineExceeded):
+                tvm.get_show(maze_id=1, imdb_id='tt1', race=True, deadline=0.3)
+            self.assertLess(time.time() - start, 0.8)
+
+
+class PrefetchTests(unittest.TestCase):
+    def routes(self, maze_id):
+        links = {'nextepisode': {'href': 'http://api.tvmaze.com/episodes/{0}1'.format(maze_id)}}
+        return {'/shows/{0}'.format(maze_id): show_payload(maze_id, _links=links),
+                '/shows/{0}/episodes?specials=1&specials=1'.format(maze_id): [{'id': 10, 'season': 1, 'number': 1}],
+                '/shows/{0}/cast'.format(maze_id): [{'person': {'id': 5, 'name': 'Someone'},
+                                                     'character': {'id': 6, 'name': 'Somebody'}}],
+                '/episodes/{0}1'.format(maze_id): {'id': int('{0}1'.format(maze_id)), 'season': 1, 'number': 2}}
+
+    def test_lazy_properties_use_prefetched_results(self):
+        tvm = TVMaze(prefetch=True)
+        delays = {'/shows/1/episodes?specials=1&specials=1': 0.2}
+        with StubServer(self.routes(1), delay=lambda path: delays.get(path, 0)) as server, \
+                server.patch_endpoints():
+            show = tvm.get_show(maze_id=1)
+            # Still running: the property waits for the prefetch instead of sending its own request
+            self.assertEqual([episode.maze_id for episode in show.episodes], [10])
+            self.assertEqual(show.next_episode.maze_id, 11)
+            self.assertEqual(show.cast.people[0].name, 'Someone')
+            self.assertEqual(sorted(server.requests), sorted(self.routes(1)))
+        stats = tvm.prefetcher.stats()
+        self.assertEqual(stats['show.episodes']['hits'], 1)
+        self.assertEqual(stats['show.episodes']['waited'], 1)
+        self.assertEqual(stats['show.next_episode']['hit_rate'], 1.0)
+        tvm.close()
+
+    def test_budget_limits_prefetches(self):
+        prefetcher = Prefetcher(resources={'show': ('episodes', 'cast')}, budget=RateLimiter(0.001))
+        tvm = TVMaze(prefetch=prefetcher)
+        with StubServer(self.routes(1)) as server, server.patch_endpoints():
+            show = tvm.get_show(maze_id=1)
+            show.episodes
+        stats = prefetcher.stats()
+        self.assertEqual((stats['show.episodes']['prefetched'], stats['show.cast']['skipped']), (1, 1))
+        self.assertIsNone(show.cast)
+        tvm.close()
+
+    def test_unread_resources_are_suppressed(self):
+        prefetcher = Prefetcher(resources={'show': ('cast',)}, budget=100, min_samples=2, probe_every=100)
+        tvm = TVMaze(prefetch=prefetcher)
+        routes = dict(item for maze_id in range(1, 6) for item in self.routes(maze_id).items())
+        with StubServer(routes) as server, server.patch_endpoints():
+            for maze_id in range(1, 6):
+                tvm.get_show(maze_id=maze_id)
+        stats = prefetcher.stats()['show.cast']
+        self.assertEqual((stats['prefetched'], stats['suppressed'], stats['hit_rate']), (2, 3, 0.0))
+        tvm.close()
+
+    def test_person_credits(self):
+        tvm = TVMaze(prefetch=True)
+        routes = {'/people/5': {'id': 5, 'name': 'Someone'},
+                  '/people/5/castcredits': [{'_links': {'show': {'href': 'http://api.tvmaze.com/shows/1'}}}]}
+        with StubServer(routes) as server, server.patch_endpoints(), tvm.use():
+            person = person_main_info(5)
+            self.assertEqual(len(person.castcredits), 1)
+        self.assertEqual(tvm.prefetcher.stats()['person.castcredits']['hits'], 1)
+        tvm.close()
+
+
+class TailLatencyTests(unittest.TestCase):
+    def test_hedged_request(self):
+        requests = []
+
+        def delay(path):
+            requests.append(path)
+            return 1.0 if len(requests) == 21 else 0.0
+
+        tvm = TVMaze(hedge_percentile=95, hedge_min_delay=0.05)
+        with StubServer({'/shows/1': show_payload(1)}, delay=delay) as server, server.patch_endpoints(), tvm.use():
+            for _ in range(20):
+                show_main_info(1)
+            started = time.time()
+            self.assertEqual(show_main_info(1).maze_id, 1)
+            self.assertTrue(time.time() - started < 0.8)
+            self.assertEqual(len(server.requests), 22)
+        tvm.close()
+        stats = tvm.stats()['/shows/{}']
+        self.assertEqual((stats['requests'], stats['hedged'], stats['hedge_wins']), (21, 1, 1))
+        self.assertTrue(stats['p50'] < 0.5)
+
+    def test_hedge_needs_a_free_scheduler_slot(self):
+        requests = []
+
+        def delay(path):
+            requests.append(path)
+            return 0.3 if len(requests) == 21 else 0.0
+
+        scheduler = PriorityScheduler(max_concurrency=1)
+        tvm = TVMaze(hedge_percentile=95, hedge_min_delay=0.05, scheduler=scheduler)
+        with StubServer({'/shows/1': show_payload(1)}, delay=delay) as server, server.patch_endpoints(), tvm.use():
+            for _ in range(21):
+                show_main_info(1)
+            self.assertEqual(len(server.requests), 21)
+        tvm.close()
+        self.assertEqual(tvm.stats()['/shows/{}']['hedged'], 0)
+        self.assertEqual(scheduler.stats()['interactive']['in_flight'], 0)
+
+    def test_circuit_breaker_counts_any_error(self):
+        class FailingBackend(HTTPBackend):
+            def request(self, method, url, data=None, auth=None, timeout=None):
+                raise ValueError('unmapped transport error')
+
+        breaker = CircuitBreaker(window=2, min_requests=2, reset_timeout=0.05)
+        tvm = TVMaze(circuit_breaker=breaker, backend=FailingBackend())
+        with tvm.use():
+            for _ in range(2):
+                with self.assertRaises(ValueError):
+                    show_main_info(1)
+            self.assertEqual(breaker.state('/shows/{}'), 'open')
+            time.sleep(0.1)
+            with self.assertRaises(ValueError):
+                show_main_info(1)
+        # The failed trial opens the circuit again instead of leaving it half-open
+        self.assertEqual(breaker.state('/shows/{}'), 'open')
+        self.assertEqual(tvm.stats()['/shows/{}']['failures'], 3)
+
+    def test_circuit_breaker(self):
+        routes = {'/shows/1': 500, '/shows/1/seasons': [{'id': 10, 'number': 1}]}
+        breaker = CircuitBreaker(failure_threshold=0.5, window=4, min_requests=4, reset_timeout=0.2)
+        tvm = TVMaze(circuit_breaker=breaker)
+        with StubServer(routes) as server, server.patch_endpoints(), tvm.use():
+            for _ in range(4):
+                with self.assertRaises(ConnectionError):
+                    show_main_info(1)
+            with self.assertRaises(CircuitOpen):
+                show_main_info(1)
+            self.assertEqual(len(server.requests), 4)
+            self.assertEqual(tvm.stats()['/shows/{}']['circuit'], 'open')
+            self.assertEqual(tvm.stats()['/shows/{}']['rejected'], 1)
+            # Other templates are unaffected
+            self.assertEqual(list(show_seasons(1)), [1])
+            time.sleep(0.25)
+            routes['/shows/1'] = show_payload(1)
+            self.assertEqual(show_main_info(1).maze_id, 1)
+            self.assertEqual(breaker.state('/shows/{}'), 'closed')
+
+
+class ScheduleRangeTests(unittest.TestCase):
+    def episode(self, episode_id, airstamp):
+        return {'id': episode_id, 'season': 1, 'number': 1, 'airstamp': airstamp, 'show': show_payload(episode_id)}
+
+    def test_concurrent_days_merged_and_cached(self):
+        routes = {
+            '/schedule?country=US&date=2016-01-01': [self.episode(1, '2016-01-01T20:00:00-05:00'),
+                                                     self.episode(2, '2016-01-01T21:00:00-05:00')],
+            '/schedule?country=US&date=2016-01-02': [self.episode(3, '2016-01-02T20:00:00-05:00')],
+            '/schedule?country=GB&date=2016-01-01': [self.episode(4, '2016-01-01T21:30:00+00:00'),
+                                                     self.episode(5, '2016-01-02T01:30:00+00:00')],
+        }
+        tvm = TVMaze()
+        with StubServer(routes) as server, server.patch_endpoints():
+            episodes = list(tvm.get_schedule_range(['US', 'GB'], '2016-01-01', days=2, max_workers=4))
+            self.assertEqual([episode.maze_id for episode in episodes], [4, 1, 5, 2, 3])
+            self.assertEqual(len(server.requests), 4)
+            again = list(tvm.get_schedule_range(['US', 'GB'], datetime(2016, 1, 1), days=2))
+            self.assertEqual([episode.maze_id for episode in again], [4, 1, 5, 2, 3])
+            # Past days are cached for good, the empty GB day wasn't found and is asked for again
+            self.assertEqual(len(server.requests), 5)
+            self.assertEqual(tvm._schedule_cache._entries[endpoints.get_schedule.format('US', '2016-01-01')][1],
+                             float('inf'))
+
+    def test_own_cache_is_bounded(self):
+        routes = dict(('/schedule?country=US&date=2016-01-{0:02d}'.format(day), [self.episode(day, None)])
+                      for day in range(1, 11))
+        with mock.patch('pytvmaze.tvmaze._schedule_cache_entries', 4):
+            tvm = TVMaze()
+        with StubServer(routes) as server, server.patch_endpoints():
+            self.assertEqual(len(list(tvm.get_schedule_range(['US'], '2016-01-01', days=10))), 10)
+        self.assertEqual(len(tvm._schedule_cache), 4)
+
+    def test_future_days_expire(self):
+        cache = MemoryCache()
+        tvm = TVMaze(cache=cache)
+        day = datetime.today().date() + timedelta(days=3)
+        with StubServer({'/schedule?country=US&date={0}'.format(day): [self.episode(1, None)]}) as server, \
+                server.patch_endpoints():
+            self.assertEqual(len(list(tvm.get_schedule_range(['US'], day))), 1)
+            url = endpoints.get_schedule.format('US', day)
+        expires_at = cache._entries[url][1]
+        self.assertTrue(time.time() < expires_at <= time.time() + 3600)
+
+
+class ThreadSafetyTests(unittest.TestCase):
+    workers = 64
+
+    def run_threads(self, target, args_list):
+        errors = []
+
+        def run(*args):
+            try:
+                target(*args)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=args) for args in args_list]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_shared_client_bounded_pool(self):
+        routes = dict(('/shows/{0}'.format(i), show_payload(i)) for i in range(1, self.workers + 1))
+        results = {}
+        tvm = TVMaze(pool_size=8)
+        with StubServer(routes, delay=0.01) as server, server.patch_endpoints():
+            self.run_threads(lambda i: results.__setitem__(i, tvm.get_show(maze_id=i)),
+                             [(i,) for i in range(1, self.workers + 1)])
+        tvm.close()
+        self.assertEqual(dict((i, show.maze_id) for i, show in results.items()),
+                         dict((i, i) for i in range(1, self.workers + 1)))
+        self.assertLessEqual(server.max_in_flight, 8)
+        self.assertEqual(len(tvm.id_map), 3 * self.workers)
+
+    def test_lazy_properties_fetch_once(self):
+        links = {'nextepisode': {'href': 'http://api.tvmaze.com/episodes/11'},
+                 'previousepisode': {'href': 'http://api.tvmaze.com/episodes/10'}}
+        show = Show(show_payload(1, _links=links))
+        routes = {'/shows/1/episodes?specials=1&specials=1': [{'id': 10, 'season': 1, 'number': 1}],
+                  '/episodes/10': {'id': 10, 'season': 1, 'number': 1},
+                  '/episodes/11': {'id': 11, 'season': 1, 'number': 2}}
+        seen = []
+        tvm = TVMaze(pool_size=self.workers)
+
+        def read():
+            with tvm.use():
+                seen.append((len(show.episodes), show.next_episode.maze_id, show.previous_episode.maze_id))
+
+        with StubServer(routes, delay=0.05) as server, server.patch_endpoints():
+            self.run_threads(read, [()] * self.workers)
+        tvm.close()
+        self.assertEqual(set(seen), set([(1, 11, 10)]))
+        self.assertEqual(sorted(server.requests), sorted(routes))
+
+
+class ProjectionTests(unittest.TestCase):
+    def test_show_index_fields(self):
+        payloads = [show_payload(1, updated=100, externals={'thetvdb': 81189, 'imdb': None}),
+                    show_payload(2, externals=None)]
+        with FakeAPI({endpoints.show_index.format(0): payloads}):
+            records = show_index(0, fields=['id', 'name', 'updated', 'externals.thetvdb'])
+        self.assertEqual([tuple(record) for record in records], [(1, 'Show', 100, 81189), (2, 'Show', None, None)])
+        self.assertEqual(records[0].externals_thetvdb, 81189)
+        self.assertEqual(records[0]['externals.thetvdb'], 81189)
+        self.assertEqual(records[1].to_dict(), {'id': 2, 'name': 'Show', 'updated': None, 'externals.thetvdb': None})
+        with self.assertRaises(AttributeError):
+            records[0].summary
+
+    def test_schedule_fields(self):
+        schedule = [{'id': 7, 'airstamp': '2016-01-01T20:00:00-05:00', 'summary': '<p>x</p>', 'show': show_payload(3)}]
+        with FakeAPI({endpoints.get_schedule.format('US', '2016-01-01'): schedule}):
+            record, = get_schedule('US', '2016-01-01', fields='id, airstamp, show.id')
+            episode, = get_schedule('US', '2016-01-01')
+        self.assertEqual(tuple(record), (7, '2016-01-01T20:00:00-05:00', 3))
+        self.assertEqual(record.show_id, episode.show.maze_id)
+
+    def test_records_pickle(self):
+        payloads = [{'id': i, 'season': 1, 'number': i, '_embedded': {'show': {'id': i % 7}}} for i in range(1, 2001)]
+        with FakeAPI({endpoints.get_full_schedule: payloads}):
+            records = get_full_schedule(fields=Projection(['id', '_embedded.show.id']))
+        self.assertEqual([record.id for record in records], list(range(1, 2001)))
+        self.assertEqual(records[41]._embedded_show_id, 42 % 7)
+        self.assertEqual(pickle.loads(pickle.dumps(records[41], pickle.HIGHEST_PROTOCOL)), records[41])
+
+
+class RaceTests(unittest.TestCase):
+    def test_miss_does_not_delay_fallback(self):
+        routes = {'/shows/99': 404, '/lookup/shows?thetvdb=81189': show_payload(2, externals={'thetvdb': 81189})}
+        delays = {'/shows/99': 0.3, '/lookup/shows?thetvdb=81189': 0.3}
+        tvm = TVMaze()
+        with StubServer(routes, delay=lambda path: delays.get(path, 0)) as server, server.patch_endpoints():
+            start = time.time()
+            show = tvm.get_show(maze_id=99, tvdb_id=81189, race=True)
+            elapsed = time.time() - start
+        self.assertEqual(show.maze_id, 2)
+        self.assertLess(elapsed, 0.55)
+        self.assertEqual(tvm.id_map.get('tvdb', 81189), 2)
+
+    def test_priority_kept(self):
+        routes = {'/shows/1': show_payload(1), '/lookup/shows?imdb=tt1': show_payload(2)}
+        tvm = TVMaze()
+        with StubServer(routes, delay=lambda path: 0.2 if path == '/shows/1' else 0) as server, \
+                server.patch_endpoints():
+            self.assertEqual(tvm.get_show(maze_id=1, imdb_id='tt1', race=True).maze_id, 1)
+
+    def test_errors_aggregated(self):
+        tvm = TVMaze()
+        with StubServer({}) as server, server.patch_endpoints():
+            with self.assertRaises(ShowNotFound) as raised:
+                tvm.get_show(maze_id=99, tvdb_id=98, show_name='nothing', race=True)
+        self.assertEqual(len(str(raised.exception).split(' ,')), 3)
+
+
+class SerializationTests(unittest.TestCase):
+    def assertRoundTrip(self, obj):
+        rebuilt = type(obj).from_dict(obj.to_dict())
+        self.assertEqual(rebuilt.to_dict(), obj.to_dict())
+        unpickled = pickle.loads(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(unpickled.to_dict(), obj.to_dict())
+        return unpickled
+
+    def test_all_models_round_trip(self):
+        network = {'id': 1, 'name': 'HBO', 'country': {'name': 'United States', 'code': 'US'}}
+        person = {'id': 5, 'name': 'Someone', '_links': {}}
+        character = {'id': 6, 'name': 'Somebody'}
+        objects = [Season({'id': 1, 'number': 1, 'network': network}),
+                   Episode({'id': 1, 'season': 1, 'number': 1, 'name': 'Pilot', 'show': show_payload(3)}),
+                   Person({'person': person, 'score': 12}),
+                   Character(character),
+                   Cast([{'person': person, 'character': character}]),
+                   CastCredit({'_links': {}, '_embedded': {'show': show_payload(3)}}),
+                   CrewCredit({'type': 'Creator', '_embedded': {'show': show_payload(3)}}),
+                   Crew({'type': 'Creator', 'person': person}),
+                   Updates({'1': 1444852010}),
+                   Update(1, 1444852010),
+                   AKA({'name': 'Other', 'country': None}),
+                   Network(network),
+                   WebChannel({'id': 2, 'name': 'Netflix'}),
+                   FollowedShow({'show_id': 3, '_embedded': {'show': show_payload(3)}}),
+                   FollowedPerson({'person_id': 5}),
+                   FollowedNetwork({'network_id': 1}),
+                   FollowedWebChannel({'webchannel_id': 2}),
+                   MarkedEpisode({'episode_id': 1, 'marked_at': 1, 'type': 0}),
+                   VotedShow({'show_id': 3, 'voted_at': 1, 'vote': 8}),
+                   VotedEpisode({'episode_id': 1, 'voted_at': 1, 'vote': 8})]
+        for obj in objects:
+            self.assertRoundTrip(obj)
+        self.assertEqual(self.assertRoundTrip(objects[2]).score, 12)
+        self.assertEqual(self.assertRoundTrip(objects[4]).people[0].character.name, 'Somebody')
+
+    def test_show_round_trip_without_requests(self):
+        episodes = [{'id': 10, 'season': 1, 'number': 1}, {'id': 11, 'season': 2, 'number': 1}]
+        payload = show_payload(1, summary='<p>Hi</p>', _embedded={'episodes': episodes})
+        with FakeAPI({endpoints.show_seasons.format(1): [{'id': 100, 'number': 1}, {'id': 200, 'number': 2}]}) as api:
+            show = Show(payload)
+            self.assertEqual(len(api.calls), 1)
+            show.score = 3.5
+            unpickled = self.assertRoundTrip(show)
+            self.assertEqual(len(api.calls), 1)
+        self.assertEqual(unpickled.summary, 'Hi')
+        self.assertEqual(unpickled.score, 3.5)
+        self.assertEqual(unpickled[2].id, 200)
+        self.assertIs(unpickled[2][1], unpickled.episodes[1])
+        self.assertIs(unpickled[2].show, unpickled)
+
+        lazy = Show(show_payload(2, _links={'nextepisode': {'href': 'http://api.tvmaze.com/episodes/12'}}))
+        with FakeAPI({endpoints.episode_list.format(2) + '&specials=1': episodes,
+                      endpoints.episode_by_id.format(12): {'id': 12, 'season': 3, 'number': 1},
+                      endpoints.show_seasons.format(2): [{'id': 300, 'number': 1}, {'id': 400, 'number': 2}]}) as api:
+            self.assertEqual(len(lazy.episodes), 2)
+            self.assertEqual(lazy.next_episode.maze_id, 12)
+            unpickled = self.assertRoundTrip(lazy)
+            self.assertEqual(len(api.calls), 2)
+            self.assertEqual(unpickled.next_episode.maze_id, 12)
+            # Seasons were never loaded, so the copy still loads them on first use
+            self.assertEqual(unpickled[2].id, 400)
+            self.assertEqual(len(unpickled.episodes), 2)
+            self.assertEqual(api.calls[2:], [endpoints.show_seasons.format(2),
+                                             endpoints.episode_list.format(2) + '&specials=1'])
+
+    def test_unknown_state_version(self):
+        version, data = Show(show_payload(1)).__getstate__()
+        with self.assertRaises(GeneralError):
+            Show.__new__(Show).__setstate__((version + 1, data))
+
+
+class NextPreviousTests(unittest.TestCase):
+    def linked_show(self, maze_id, next_id=None, previous_id=None):
+        links = {}
+        if next_id:
+            links['nextepisode'] = {'href': 'http://api.tvmaze.com/episodes/{0}'.format(next_id)}
+        if previous_id:
+            links['previousepisode'] = {'href': 'http://api.tvmaze.com/episodes/{0}'.format(previous_id)}
+        return Show(show_payload(maze_id, _links=links))
+
+    def test_shows_and_maze_ids(self):
+        tvm = TVMaze()
+        embed = '?embed[]=nextepisode&embed[]=previousepisode'
+        responses = dict((endpoints.episode_by_id.format(episode_id), {'id': episode_id, 'season': 1, 'number': 1})
+                         for episode_id in (10, 11, 12))
+        responses[endpoints.show_main_info.format(3) + embed] = show_payload(
+            3, _embedded={'nextepisode': {'id': 30, 'season': 2, 'number': 1}})
+        # Two shows sharing a previous episode (e.g. a crossover) cost one request for it
+        shows = [self.linked_show(1, 10, 11), self.linked_show(2, 12, 11), 3, 4, self.linked_show(5)]
+        with FakeAPI(responses) as api:
+            resolved = tvm.resolve_next_previous(shows, max_workers=4)
+            self.assertEqual(sorted(api.calls), sorted(set(api.calls)))
+            self.assertEqual(len(api.calls), 5)
+            self.assertEqual([show.next_episode.maze_id for show in resolved[:3]], [10, 12, 30])
+            self.assertEqual([show.previous_episode.maze_id for show in resolved[:2]], [11, 11])
+            self.assertIsNone(resolved[3])
+            self.assertIsNone(resolved[4].next_episode)
+            self.assertEqual(len(api.calls), 5)
+
+
+class LazySeasonTests(unittest.TestCase):
+    responses = {
+        endpoints.show_seasons.format(1): [{'id': 100, 'number': 1}, {'id': 500, 'number': 5}],
+        endpoints.season_episodes.format(500): [{'id': 53, 'season': 5, 'number': 3, 'name': 'Third'},
+                                                {'id': 54, 'season': 5, 'number': 4}],
+    }
+
+    def test_show_loads_only_the_requested_season(self):
+        show = Show(show_payload(1))
+        with FakeAPI(self.responses) as api:
+            self.assertEqual(show[5][3].title, 'Third')
+            self.assertEqual(len(show[5]), 2)
+            self.assertIs(show[5].show, show)
+        self.assertEqual(api.calls, [endpoints.show_seasons.format(1), endpoints.season_episodes.format(500)])
+
+    def test_season_by_id_loads_episodes_once(self):
+        season = Season({'id': 500, 'number': 5})
+        with FakeAPI(self.responses) as api:
+            self.assertEqual([episode.maze_id for episode in season], [53, 54])
+            self.assertEqual(season[4].maze_id, 54)
+            empty = Season({'id': 600, 'number': 6})
+            self.assertEqual(len(empty), 0)
+            self.assertEqual(len(empty), 0)
+        self.assertEqual(len(api.calls), 2)
+
+    def test_loaded_seasons_round_trip(self):
+        show = Show(show_payload(1))
+        with FakeAPI(self.responses) as api:
+            show[5][3]
+            rebuilt = Show.from_dict(show.to_dict())
+            self.assertEqual(rebuilt[5][4].maze_id, 54)
+            self.assertEqual(sorted(rebuilt.seasons), [1, 5])
+        self.assertEqual(len(api.calls), 2)
+
+
+class LazyImportTests(unittest.TestCase):
+    def test_import_does_not_load_http_stack(self):
+        code = 'import sys, pytvmaze; print(sorted(m for m in ("requests", "urllib3", "multiprocessing") if m in sys.modules))'
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root)
+        out = subprocess.check_output([sys.executable, '-c', code], env=env, universal_newlines=True)
+        self.assertEqual(out.strip(), '[]')
+
+    def test_schedule_defaults_to_current_day(self):
+        today = str(datetime.today().date())
+        with FakeAPI({endpoints.get_schedule.format('US', today): [{'id': 1, 'season': 1, 'number': 1}]}):
+            self.assertEqual(len(get_schedule()), 1)
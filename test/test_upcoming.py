@@ -0,0 +1,61 @@
+#!/usr/bin/python
+ # -*- coding: utf-8 -*-
+
+import unittest
+
+from pytvmaze.tvmaze import *
+from pytvmaze.upcoming import UpcomingEpisodes, airstamp_seconds
+from test.test_tvmaze import FakeAPI, show_payload
+
+DAY = 24 * 3600
+START = airstamp_seconds('2016-01-01T00:00:00+00:00')
+
+
+def airing(episode_id, maze_id, day, hour=20):
+    return {'id': episode_id, 'season': 1, 'number': episode_id, 'name': 'Episode {0}'.format(episode_id),
+            'airstamp': '2016-01-{0:02d}T{1:02d}:00:00-05:00'.format(day, hour),
+            '_embedded': {'show': show_payload(maze_id)}}
+
+
+class UpcomingTests(unittest.TestCase):
+    schedule = [airing(1, 10, 3), airing(2, 20, 1), airing(3, 10, 1), airing(4, 30, 2),
+                airing(5, 20, 5), airing(6, 10, 8), {'id': 7, 'airstamp': None, '_embedded': {'show': show_payload(40)}}]
+
+    def test_airstamp_seconds(self):
+        self.assertEqual(airstamp_seconds('2016-01-01T00:00:00+00:00'), START)
+        self.assertEqual(airstamp_seconds('2016-01-01T00:00:00-05:00'), START + 5 * 3600)
+        self.assertEqual(airstamp_seconds('2016-01-01T05:30:00+0530'), START)
+        self.assertIsNone(airstamp_seconds(None))
+
+    def test_next_airings_for_many_shows(self):
+        upcoming = UpcomingEpisodes()
+        with FakeAPI({endpoints.get_full_schedule: self.schedule}) as api:
+            followed = [FollowedShow({'show_id': 10}), Show(show_payload(20)), 99]
+            episodes = upcoming.next_airings(followed, start=START)
+            self.assertEqual([episode.maze_id for episode in episodes], [3, 2, 1, 5, 6])
+            self.assertEqual(episodes[0].show.maze_id, 10)
+            window = upcoming.next_airings(followed, start=START + 2 * DAY, end=START + 6 * DAY, limit=2)
+            self.assertEqual([episode.maze_id for episode in window], [1, 5])
+            self.assertEqual([e.maze_id for e in upcoming.next_airings([10, 20], start=START, per_show=1)], [3, 2])
+            self.assertIs(upcoming.next_airing(10, start=START), episodes[0])
+            self.assertIsNone(upcoming.next_airing(30, start=START + 3 * DAY))
+            self.assertEqual(len(api.calls), 1)
+        self.assertEqual(len(upcoming), 3)
+        self.assertIn(20, upcoming)
+
+    def test_refresh_reuses_unchanged_episodes(self):
+        upcoming = UpcomingEpisodes(refresh_interval=0)
+        changed = [dict(payload) for payload in self.schedule]
+        changed[2]['name'] = 'Renamed'
+        with FakeAPI({endpoints.get_full_schedule: self.schedule}):
+            first, second = upcoming.next_airings([10], start=START, limit=2)
+        with FakeAPI({endpoints.get_full_schedule: changed}) as api:
+            renamed, same = upcoming.next_airings([10], start=START, limit=2)
+            self.assertEqual(len(api.calls), 1)
+        self.assertEqual(renamed.title, 'Renamed')
+        self.assertIsNot(renamed, first)
+        self.assertIs(same, second)
+
+
+if __name__ == '__main__':
+    unittest.main()